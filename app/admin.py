@@ -15,9 +15,12 @@ class OpenaiSettingsAdmin(admin.ModelAdmin):
 
 @admin.register(Log)
 class LogAdmin(admin.ModelAdmin):
-    list_display = ('model', 'temperature', 'max_retries', 'is_successful', 'is_retried')
+    list_display = (
+        'created_at', 'call_type', 'model', 'latency_ms', 'prompt_tokens', 'completion_tokens',
+        'retries', 'is_successful',
+    )
     search_fields = ('model',)
-    list_filter = ('is_successful', 'is_retried')
+    list_filter = ('call_type', 'is_successful', 'is_retried')
     readonly_fields = ('messages', 'result')
 
 
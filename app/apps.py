@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MainAppConfig(AppConfig):
+    name = 'app'
+
+    def ready(self):
+        # Подключаем обработчики сигналов
+        from app import signals  # noqa: F401
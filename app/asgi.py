@@ -0,0 +1,180 @@
+"""
+Native ASGI endpoints mounted in config/asgi.py in front of the Django application.
+
+Django 3.2 iterates StreamingHttpResponse synchronously inside the event loop under ASGI,
+which blocks other requests and forbids ORM access while streaming. These endpoints
+stream Server-Sent Events directly over the ASGI protocol instead.
+
+Django's handler isn't involved, so the endpoints close stale database connections
+themselves, as request_started/request_finished do for Django views.
+"""
+import asyncio
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from app.utils.db import db_sync_to_async
+from app.utils.documents import get_latest_documents
+from app.utils.events import get_document_event_hub
+from app.utils.processors.backends import awarm_up_clients
+from app.utils.processors.langchain import astream_answer_with_rag_and_history
+from app.utils.sse import format_sse_event, SSE_HEADERS
+
+# Комментарий в SSE потоке раз в N секунд: прокси не закрывают соединение по таймауту
+SSE_HEARTBEAT_INTERVAL = 15
+
+
+def closes_old_connections(app):
+    """
+    Closes database connections that are unusable or past CONN_MAX_AGE before and after
+    the endpoint, in the thread sync_to_async runs ORM calls in.
+    """
+    @wraps(app)
+    async def wrapper(scope, receive, send):
+        await sync_to_async(close_old_connections)()
+        try:
+            await app(scope, receive, send)
+        finally:
+            await sync_to_async(close_old_connections)()
+
+    return wrapper
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_json(send, status, data):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": json.dumps(data).encode("utf-8")})
+
+
+async def start_sse(send):
+    headers = [(b"content-type", b"text/event-stream")]
+    headers += [(name.lower().encode(), value.encode()) for name, value in SSE_HEADERS.items()]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+
+async def send_sse(send, event, data):
+    await send({
+        "type": "http.response.body",
+        "body": format_sse_event(event, data),
+        "more_body": True,
+    })
+
+
+async def send_sse_heartbeat(send):
+    await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+@closes_old_connections
+async def ask_question_stream_app(scope, receive, send):
+    """
+    POST /api/ask-question/stream/ — streams answer tokens as SSE "token" events,
+    followed by a "done" event with the full answer and metadata.
+    """
+    if scope["method"] != "POST":
+        await send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    try:
+        body = json.loads(await read_body(receive))
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        await send_json(send, 400, {"error": "Request body must be a JSON object"})
+        return
+    question = body.get("question")
+    document_id = body.get("document_id")
+    if not question or not document_id:
+        await send_json(send, 400, {"error": "Missing question or document_id"})
+        return
+
+    await start_sse(send)
+
+    events = astream_answer_with_rag_and_history(document_id, question)
+    try:
+        async for event, data in events:
+            if event == "token":
+                await send_sse(send, "token", {"token": data})
+            else:
+                await send_sse(send, event, data)
+    except Exception as e:
+        await send_sse(send, "error", {"error": str(e)})
+    finally:
+        await events.aclose()
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+@closes_old_connections
+async def document_events_app(scope, receive, send):
+    """
+    GET /api/documents/events/ — a "snapshot" event with the latest documents, then
+    a "document" event with the new state of a document on every status transition
+    published by the Celery pipeline.
+    """
+    if scope["method"] != "GET":
+        await send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    hub = get_document_event_hub()
+    # Подписываемся до снимка, чтобы не потерять переходы между ними
+    events = hub.subscribe()
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await start_sse(send)
+        documents = await db_sync_to_async(get_latest_documents)()
+        await send_sse(send, "snapshot", {"documents": documents})
+
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=SSE_HEARTBEAT_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if next_event in done:
+                await send_sse(send, "document", next_event.result())
+                continue
+            next_event.cancel()
+            if not disconnected.done():
+                await send_sse_heartbeat(send)
+    finally:
+        hub.unsubscribe(events)
+        disconnected.cancel()
+
+
+async def lifespan_app(scope, receive, send):
+    """
+    ASGI lifespan: LLM settings and clients are created in the serving event loop
+    on startup, before the first request.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await awarm_up_clients()
+            await sync_to_async(close_old_connections)()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Document
+from .utils.processors.fingerprint import fingerprint_document
 
 class DocumentUploadForm(forms.ModelForm):
     class Meta:
@@ -54,6 +55,7 @@ class DocumentUploadForm(forms.ModelForm):
     def save(self, commit=True):
         instance = super().save(commit=False)
         instance.variant = self.cleaned_data.get('variant')
+        instance.fingerprint = fingerprint_document(instance)
         if commit:
             instance.save()
         return instance
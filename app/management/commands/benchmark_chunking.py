@@ -0,0 +1,212 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.models import DocumentChunk
+from app.utils.processors.chunking import StreamingChunker, create_chunkers, get_summary_chunk_tokens
+from app.utils.processors.embeddings import split_into_batches
+from app.utils.processors.langchain import SUMMARY_MAP_PROMPT
+from app.utils.processors.pdf import iter_pdf_pages
+from app.utils.processors.tokens import get_token_counter, is_exact
+
+# Текст образцового корпуса: английский, русский и смешанный
+SAMPLE_TEXTS = {
+    "en": (
+        "The quarterly report describes revenue growth in the northern region, the delayed "
+        "launch of the mobile application and the hiring plan for the next year. "
+    ),
+    "ru": (
+        "В квартальном отчёте описан рост выручки в северном регионе, задержка запуска "
+        "мобильного приложения и план найма сотрудников на следующий год. "
+    ),
+    "mixed": (
+        "Отчёт по проекту: the API latency dropped after the cache was enabled, однако "
+        "число ошибок при загрузке PDF выросло. "
+    ),
+}
+SAMPLE_LINES_PER_PAGE = 45
+SAMPLE_LINE_CHARS = 95
+
+
+def iter_sample_pages(text, pages):
+    for number in range(pages):
+        lines = [
+            f"{number + 1}.{line} {text * 2}"[:SAMPLE_LINE_CHARS] for line in range(SAMPLE_LINES_PER_PAGE)
+        ]
+        yield number + 1, "\n".join(lines)
+
+
+def iter_file_pages(path):
+    if path.lower().endswith(".pdf"):
+        yield from iter_pdf_pages(path)
+    else:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield None, f.read()
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in sorted(names)
+                if name.lower().endswith((".pdf", ".txt", ".md"))
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def chunk_pages(chunkers, pages):
+    """
+    Runs the pages through the chunkers like the pipeline does.
+
+    Returns:
+        dict[str, list[str]]: Chunk texts by granularity.
+    """
+    texts = {granularity: [] for granularity in chunkers}
+    for page_number, page_text in pages:
+        for granularity, chunker in chunkers.items():
+            texts[granularity].extend(span.text for span in chunker.feed(page_number, page_text))
+    for granularity, chunker in chunkers.items():
+        texts[granularity].extend(span.text for span in chunker.flush())
+    return texts
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares LLM calls and tokens of the fixed 1000-character chunking with the token-aware "
+        "summary/retrieval chunking on a sample corpus (or the given PDF/text files)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="PDF/text files or directories; sample corpus if empty")
+        parser.add_argument("--pages", type=int, nargs="+", default=[10, 100],
+                            help="Pages per sample document")
+        parser.add_argument("--model", default="gpt-4o-mini", help="Summary model")
+        parser.add_argument("--embedding-model", default="text-embedding-ada-002")
+        parser.add_argument("--summary-max-tokens", type=int, default=None)
+        parser.add_argument("--retrieval-tokens", type=int, default=None)
+        parser.add_argument("--retrieval-overlap", type=int, default=None)
+        parser.add_argument("--json", dest="json_path", help="Write the report to a JSON file")
+
+    def handle(self, *args, **options):
+        overrides = {
+            name: options[option]
+            for name, option in (
+                ("SUMMARY_CHUNK_MAX_TOKENS", "summary_max_tokens"),
+                ("RETRIEVAL_CHUNK_TOKENS", "retrieval_tokens"),
+                ("RETRIEVAL_CHUNK_OVERLAP_TOKENS", "retrieval_overlap"),
+            )
+            if options[option] is not None
+        }
+        with override_settings(**overrides):
+            report = self.run_report(options)
+
+        self.print_report(report)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def get_corpus(self, options):
+        """
+        Returns [(name, callable returning an iterator of (page_number, text))].
+        """
+        if options["paths"]:
+            return [
+                (os.path.basename(path), lambda path=path: iter_file_pages(path))
+                for path in collect_files(options["paths"])
+            ]
+        return [
+            (f"sample-{language}-{pages}p", lambda text=text, pages=pages: iter_sample_pages(text, pages))
+            for language, text in SAMPLE_TEXTS.items()
+            for pages in options["pages"]
+        ]
+
+    def run_report(self, options):
+        model, embedding_model = options["model"], options["embedding_model"]
+        count_summary_tokens = get_token_counter(model)
+        count_embedding_tokens = get_token_counter(embedding_model)
+        # Шаблон map-промпта отправляется с каждым вызовом
+        prompt_tokens = count_summary_tokens(SUMMARY_MAP_PROMPT.format(text=""))
+
+        def measure(summary_texts, retrieval_texts):
+            embedding_tokens = [count_embedding_tokens(text) for text in retrieval_texts]
+            return {
+                "map_calls": len(summary_texts),
+                "map_tokens": sum(count_summary_tokens(text) + prompt_tokens for text in summary_texts),
+                "embedding_texts": len(retrieval_texts),
+                "embedding_tokens": sum(embedding_tokens),
+                "embedding_requests": len(split_into_batches(
+                    retrieval_texts, settings.EMBEDDING_BATCH_MAX_TOKENS, settings.EMBEDDING_BATCH_MAX_TEXTS
+                )),
+            }
+
+        documents = []
+        for name, pages in self.get_corpus(options):
+            # Прежняя нарезка: одни и те же чанки по 1000 символов для суммаризации и эмбеддингов
+            baseline_chunker = StreamingChunker(
+                RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200),
+                window_size=settings.CHUNKING_WINDOW_CHARS,
+            )
+            baseline = chunk_pages({"baseline": baseline_chunker}, pages())["baseline"]
+            chunks = chunk_pages(create_chunkers(model, embedding_model), pages())
+            documents.append({
+                "name": name,
+                "baseline": measure(baseline, baseline),
+                "token_aware": measure(
+                    chunks[DocumentChunk.Granularity.SUMMARY], chunks[DocumentChunk.Granularity.RETRIEVAL]
+                ),
+            })
+
+        totals = {
+            strategy: {
+                key: sum(document[strategy][key] for document in documents)
+                for key in documents[0][strategy]
+            } if documents else {}
+            for strategy in ("baseline", "token_aware")
+        }
+        return {
+            "model": model,
+            "embedding_model": embedding_model,
+            "exact_token_counts": is_exact(model) and is_exact(embedding_model),
+            "settings": {
+                "summary_chunk_tokens": get_summary_chunk_tokens(model),
+                "summary_chunk_overlap_tokens": settings.SUMMARY_CHUNK_OVERLAP_TOKENS,
+                "retrieval_chunk_tokens": settings.RETRIEVAL_CHUNK_TOKENS,
+                "retrieval_chunk_overlap_tokens": settings.RETRIEVAL_CHUNK_OVERLAP_TOKENS,
+            },
+            "documents": documents,
+            "totals": totals,
+        }
+
+    def print_report(self, report):
+        keys = ("map_calls", "map_tokens", "embedding_texts", "embedding_tokens", "embedding_requests")
+        self.stdout.write(
+            f"summary model {report['model']}, embedding model {report['embedding_model']}, "
+            f"{'tiktoken' if report['exact_token_counts'] else 'estimated (~4 chars/token)'} token counts"
+        )
+        self.stdout.write(", ".join(f"{name} {value}" for name, value in report["settings"].items()))
+
+        self.stdout.write("\n" + f"{'document':<24} " + " ".join(f"{key:>22}" for key in keys))
+        for document in report["documents"]:
+            self.stdout.write(f"{document['name'][:24]:<24} " + " ".join(
+                f"{document['baseline'][key]:>10} -> {document['token_aware'][key]:<8}" for key in keys
+            ))
+
+        baseline, token_aware = report["totals"]["baseline"], report["totals"]["token_aware"]
+        if not baseline:
+            return
+        self.stdout.write("\nTotal:")
+        for key in keys:
+            saved = baseline[key] - token_aware[key]
+            percent = saved / baseline[key] * 100 if baseline[key] else 0.0
+            self.stdout.write(
+                f"  {key:<20} {baseline[key]:>10} -> {token_aware[key]:<10} saved {saved} ({percent:.1f}%)"
+            )
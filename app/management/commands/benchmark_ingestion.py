@@ -0,0 +1,142 @@
+import json
+import os
+import resource
+import tempfile
+import time
+from collections import defaultdict
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from app.management.commands.benchmark_pdf_extraction import create_synthetic_pdf
+from app.models import Document, DocumentChunk, OpenaiSettings
+from app.tasks import extract_and_chunk, summarize, embed, generate_title
+from app.utils.processors.instrumentation import get_llm_log_writer
+
+STAGES = (
+    ("extract_chunk", extract_and_chunk),
+    ("summarize", summarize),
+    ("embed", embed),
+    ("title", generate_title),
+)
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process and of its finished children (PDF extraction pool).
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks ingestion of synthetic PDFs through the real extract/chunk/summarize/embed "
+        "path with the fake LLM backend and a temporary SQLite database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200])
+        parser.add_argument("--documents", type=int, default=2, help="Documents per size")
+        parser.add_argument("--llm-latency", type=float, default=0.05)
+        parser.add_argument("--llm-tokens-per-second", type=float, default=200)
+        parser.add_argument("--embedding-latency", type=float, default=0.0)
+        parser.add_argument("--with-caches", action="store_true",
+                            help="Keep the embedding cache enabled")
+        parser.add_argument("--json", dest="json_path", help="Write the report to a JSON file")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir, override_settings(
+            LLM_BACKEND="fake",
+            FAKE_LLM_LATENCY=options["llm_latency"],
+            FAKE_LLM_TOKENS_PER_SECOND=options["llm_tokens_per_second"],
+            FAKE_EMBEDDING_LATENCY=options["embedding_latency"],
+            EMBEDDING_CACHE_ENABLED=options["with_caches"],
+            DOCUMENT_EVENTS_ENABLED=False,
+            EMBEDDING_CACHE_PATH=os.path.join(tmp_dir, "embedding_cache.sqlite3"),
+            MEDIA_ROOT=os.path.join(tmp_dir, "media"),
+            FAISS_INDEX_DIR=os.path.join(tmp_dir, "faiss"),
+        ):
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                report = self.run_benchmark(tmp_dir, options)
+            finally:
+                # Записи лога вызовов LLM должны попасть во временную базу до её удаления
+                get_llm_log_writer().flush()
+                teardown_databases(old_config, verbosity=0)
+
+        self.print_report(report)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def run_benchmark(self, tmp_dir, options):
+        OpenaiSettings.objects.create(model="fake-chat")
+
+        sizes = []
+        total_documents = 0
+        total_started = time.perf_counter()
+        for pages in options["pages"]:
+            stage_times = defaultdict(list)
+            chunks = []
+            size_started = time.perf_counter()
+
+            for number in range(options["documents"]):
+                path = os.path.join(tmp_dir, f"synthetic_{pages}_{number}.pdf")
+                create_synthetic_pdf(path, pages, label=f"doc{pages}-{number} ")
+                document = Document()
+                with open(path, "rb") as f:
+                    document.file.save(os.path.basename(path), File(f))
+
+                for stage, func in STAGES:
+                    document.refresh_from_db()
+                    started = time.perf_counter()
+                    func(document)
+                    stage_times[stage].append(time.perf_counter() - started)
+                chunks.append(document.chunks.filter(granularity=DocumentChunk.Granularity.RETRIEVAL).count())
+
+            elapsed = time.perf_counter() - size_started
+            total_documents += options["documents"]
+            sizes.append({
+                "pages": pages,
+                "documents": options["documents"],
+                "chunks_per_document": sum(chunks) / len(chunks),
+                "documents_per_minute": options["documents"] / elapsed * 60,
+                "stage_seconds": {
+                    stage: sum(times) / len(times) for stage, times in stage_times.items()
+                },
+            })
+
+        own_rss, children_rss = peak_rss_mb()
+        return {
+            "documents": total_documents,
+            "documents_per_minute": total_documents / (time.perf_counter() - total_started) * 60,
+            "peak_rss_mb": own_rss,
+            "peak_children_rss_mb": children_rss,
+            "settings": {
+                "llm_latency": options["llm_latency"],
+                "llm_tokens_per_second": options["llm_tokens_per_second"],
+                "embedding_latency": options["embedding_latency"],
+            },
+            "sizes": sizes,
+        }
+
+    def print_report(self, report):
+        stage_names = [stage for stage, _ in STAGES]
+        header = f"{'pages':>6} {'chunks':>7} {'docs/min':>9} " + " ".join(
+            f"{stage + ' s':>15}" for stage in stage_names
+        )
+        self.stdout.write(header)
+        for size in report["sizes"]:
+            self.stdout.write(
+                f"{size['pages']:>6} {size['chunks_per_document']:>7.0f} "
+                f"{size['documents_per_minute']:>9.1f} "
+                + " ".join(f"{size['stage_seconds'][stage]:>15.3f}" for stage in stage_names)
+            )
+        self.stdout.write(
+            f"\n{report['documents']} documents, {report['documents_per_minute']:.1f} documents/min, "
+            f"peak RSS {report['peak_rss_mb']:.1f} MB "
+            f"(extraction workers {report['peak_children_rss_mb']:.1f} MB)"
+        )
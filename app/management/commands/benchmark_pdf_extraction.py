@@ -0,0 +1,72 @@
+import os
+import resource
+import tempfile
+import time
+
+import fitz
+from django.core.management.base import BaseCommand
+
+from app.utils.processors.pdf import iter_pdf_pages
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua. Съешь же ещё этих мягких французских "
+    "булок, да выпей чаю. "
+)
+
+
+def create_synthetic_pdf(path, pages, lines_per_page=45, label=""):
+    """
+    Creates a PDF with `pages` pages of text. `label` is added to every line,
+    so PDFs with different labels have different content.
+    """
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        text = "\n".join(
+            f"{label}{number + 1}.{line} {LOREM}"[:95] for line in range(lines_per_page)
+        )
+        page.insert_text((40, 40), text, fontsize=9, fontname="helv")
+    doc.save(path)
+    doc.close()
+
+
+class Command(BaseCommand):
+    help = "Benchmarks sequential vs parallel PDF text extraction on synthetic PDFs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, nargs="+", default=[500])
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+        parser.add_argument("--pages-per-task", type=int, default=None)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for pages in options["pages"]:
+                path = os.path.join(tmp_dir, f"synthetic_{pages}.pdf")
+                create_synthetic_pdf(path, pages)
+                self.stdout.write(f"\n{pages} pages, {os.path.getsize(path) / 1024:.0f} KB")
+                self.stdout.write(
+                    f"{'workers':>8} {'best s':>8} {'pages/s':>9} {'first page s':>13} {'peak RSS MB':>12}"
+                )
+
+                for workers in options["workers"]:
+                    best = first_page = None
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        first = None
+                        count = 0
+                        for _, text in iter_pdf_pages(
+                            path, workers=workers, pages_per_task=options["pages_per_task"]
+                        ):
+                            if first is None:
+                                first = time.perf_counter() - started
+                            count += 1
+                        elapsed = time.perf_counter() - started
+                        if best is None or elapsed < best:
+                            best, first_page = elapsed, first
+
+                    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                    self.stdout.write(
+                        f"{workers:>8} {best:>8.3f} {count / best:>9.0f} {first_page:>13.3f} {peak_rss:>12.1f}"
+                    )
@@ -0,0 +1,187 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from app.models import Document, DocumentChunk, OpenaiSettings
+from app.utils.processors.backends import get_embeddings_model
+from app.utils.processors.instrumentation import get_llm_log_writer
+from app.utils.processors.langchain import RAG_TOP_K, create_embeddings_and_store, load_vectorstore, \
+                                          retrieve_documents
+
+# Режимы поиска: настройки RAG_RETRIEVAL_MODE / RAG_LEXICAL_FAST_PATH
+MODES = {
+    "vector": {"RAG_RETRIEVAL_MODE": "vector", "RAG_LEXICAL_FAST_PATH": False},
+    "hybrid": {"RAG_RETRIEVAL_MODE": "hybrid", "RAG_LEXICAL_FAST_PATH": False},
+    "hybrid+fast": {"RAG_RETRIEVAL_MODE": "hybrid", "RAG_LEXICAL_FAST_PATH": True},
+}
+
+SYLLABLES = ("ко", "ва", "ле", "ми", "ро", "са", "ти", "ну", "да", "ре", "го", "лов")
+ITEMS = ("кабель", "насосы", "трансформаторы", "светильники", "арматуру", "трубы", "датчики", "щиты")
+FILLER = (
+    "Стороны согласовали порядок приёмки, сроки оплаты и ответственность за просрочку. "
+    "Поставка выполняется партиями, документы передаются вместе с товаром. "
+)
+
+
+def make_name(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(3)).title() + "ов"
+
+
+def build_corpus(sections, rng):
+    """
+    Synthetic contract: every section has a unique clause number and contractor name
+    and the same boilerplate, so exact terms decide which chunk is relevant.
+
+    Returns:
+        list[dict]: Sections with "text", "clause", "name" and "item".
+    """
+    names = set()
+    corpus = []
+    for number in range(sections):
+        name = make_name(rng)
+        while name in names:
+            name = make_name(rng)
+        names.add(name)
+        clause = f"{number // 10 + 1}.{number % 10 + 1}.{rng.randint(1, 9)}"
+        item = rng.choice(ITEMS)
+        corpus.append({
+            "clause": clause,
+            "name": name,
+            "item": item,
+            "text": (
+                f"Пункт {clause}. Подрядчик {name} обязан поставить {item} до {rng.randint(1, 28)}.0"
+                f"{rng.randint(1, 9)}.2025, сумма договора {rng.randint(100, 999)} тыс. рублей. " + FILLER * 3
+            ),
+        })
+    return corpus
+
+
+def build_queries(section):
+    return [
+        ("keyword", f"пункт {section['clause']}"),
+        ("keyword", section["name"]),
+        ("question", f"Что должен поставить подрядчик {section['name']}?"),
+        ("question", f"Какая сумма договора указана в пункте {section['clause']}?"),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares recall and latency of vector-only, hybrid (BM25 + FAISS) and hybrid retrieval "
+        "with the lexical fast path on a synthetic contract, using the fake embedding backend "
+        "and a temporary SQLite database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sections", type=int, default=300, help="Chunks of the synthetic document")
+        parser.add_argument("--queries", type=int, default=100, help="Sections to ask about (4 queries each)")
+        parser.add_argument("--embedding-latency", type=float, default=0.05,
+                            help="Simulated latency of one embedding request, seconds")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", dest="json_path", help="Write the report to a JSON file")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir, override_settings(
+            LLM_BACKEND="fake",
+            FAKE_EMBEDDING_LATENCY=options["embedding_latency"],
+            EMBEDDING_CACHE_ENABLED=False,
+            DOCUMENT_EVENTS_ENABLED=False,
+            FAISS_INDEX_DIR=os.path.join(tmp_dir, "faiss"),
+        ):
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                report = self.run_benchmark(options)
+            finally:
+                get_llm_log_writer().flush()
+                teardown_databases(old_config, verbosity=0)
+
+        self.print_report(report)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def run_benchmark(self, options):
+        rng = random.Random(options["seed"])
+        OpenaiSettings.objects.create(model="fake-chat")
+        corpus = build_corpus(options["sections"], rng)
+
+        document = Document.objects.create(title="benchmark", status=Document.Status.DONE)
+        # bulk_create: индекс FTS5 заполняется триггерами
+        chunks = DocumentChunk.objects.bulk_create([
+            DocumentChunk(document=document, text=section["text"], start_offset=index)
+            for index, section in enumerate(corpus)
+        ])
+        with override_settings(FAKE_EMBEDDING_LATENCY=0):
+            create_embeddings_and_store(document, chunks)
+
+        embeddings_model = get_embeddings_model()
+        vectorstore = load_vectorstore(document.id, embeddings_model)
+        asked = rng.sample(corpus, min(options["queries"], len(corpus)))
+
+        results = {}
+        for mode, mode_settings in MODES.items():
+            stats = defaultdict(lambda: {"hits_1": 0, "hits_k": 0, "queries": 0, "embeddings": 0, "latency": []})
+            with override_settings(**mode_settings):
+                for section in asked:
+                    for kind, query in build_queries(section):
+                        timings = {}
+                        started = time.perf_counter()
+                        docs, path = retrieve_documents(document.id, vectorstore, embeddings_model, query, timings)
+                        latency = (time.perf_counter() - started) * 1000
+                        texts = [doc.page_content for doc in docs]
+                        for key in (kind, "all"):
+                            entry = stats[key]
+                            entry["queries"] += 1
+                            entry["hits_1"] += bool(texts) and texts[0] == section["text"]
+                            entry["hits_k"] += section["text"] in texts
+                            entry["embeddings"] += path != "lexical"
+                            entry["latency"].append(latency)
+            results[mode] = {
+                kind: {
+                    "queries": entry["queries"],
+                    "recall_at_1": entry["hits_1"] / entry["queries"],
+                    f"recall_at_{RAG_TOP_K}": entry["hits_k"] / entry["queries"],
+                    "embedding_calls": entry["embeddings"],
+                    "latency_p50_ms": statistics.median(entry["latency"]),
+                    "latency_p95_ms": percentile(entry["latency"], 0.95),
+                }
+                for kind, entry in stats.items()
+            }
+
+        return {
+            "sections": len(corpus),
+            "queries": len(asked) * len(build_queries(asked[0])) if asked else 0,
+            "embedding_latency": options["embedding_latency"],
+            "top_k": RAG_TOP_K,
+            "modes": results,
+        }
+
+    def print_report(self, report):
+        recall_k = f"recall_at_{report['top_k']}"
+        self.stdout.write(
+            f"{report['sections']} chunks, {report['queries']} queries, "
+            f"simulated embedding latency {report['embedding_latency'] * 1000:.0f} ms"
+        )
+        self.stdout.write(
+            f"\n{'mode':<12} {'query':<9} {'recall@1':>9} {'recall@' + str(report['top_k']):>9} "
+            f"{'embeds':>7} {'p50 ms':>8} {'p95 ms':>8}"
+        )
+        for mode, kinds in report["modes"].items():
+            for kind in ("keyword", "question", "all"):
+                entry = kinds[kind]
+                self.stdout.write(
+                    f"{mode:<12} {kind:<9} {entry['recall_at_1']:>9.2f} {entry[recall_k]:>9.2f} "
+                    f"{entry['embedding_calls']:>7} {entry['latency_p50_ms']:>8.2f} {entry['latency_p95_ms']:>8.2f}"
+                )
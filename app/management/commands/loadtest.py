@@ -0,0 +1,277 @@
+import http.client
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from app.models import ConversationSummary, Document, DocumentChunk, Message, OpenaiSettings
+from app.utils.processors.backends import FAKE_VOCABULARY
+from app.utils.processors.history import get_fold_boundary
+from app.utils.processors.instrumentation import get_llm_log_writer
+from app.utils.processors.langchain import create_embeddings_and_store
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+QUESTIONS = (
+    "О чём этот документ?",
+    "Какие основные выводы?",
+    "Какие методы описаны в документе?",
+    "Что сказано в разделе про результаты?",
+    "What is this document about?",
+)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_stats(latencies_ms, elapsed):
+    values = sorted(latencies_ms)
+    histogram = {}
+    previous = 0
+    for bucket in LATENCY_BUCKETS_MS:
+        histogram[f"le_{bucket}"] = sum(1 for value in values if previous < value <= bucket)
+        previous = bucket
+    histogram["le_inf"] = sum(1 for value in values if value > LATENCY_BUCKETS_MS[-1])
+    return {
+        "requests": len(values),
+        "throughput_rps": len(values) / elapsed if elapsed else None,
+        "mean_ms": sum(values) / len(values) if values else None,
+        "p50_ms": percentile(values, 0.50),
+        "p90_ms": percentile(values, 0.90),
+        "p99_ms": percentile(values, 0.99),
+        "max_ms": values[-1] if values else None,
+        "histogram_ms": histogram,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fake_text(rng, words):
+    return " ".join(rng.choice(FAKE_VOCABULARY) for _ in range(words))
+
+
+class LocalServer:
+    """
+    Runs the project in a background thread: uvicorn with config.asgi ("asgi")
+    or Django's threaded development WSGI server ("wsgi").
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.port = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self.kind == "asgi":
+            import uvicorn
+            from config.asgi import application
+
+            self.port = free_port()
+            self._server = uvicorn.Server(uvicorn.Config(
+                application, host="127.0.0.1", port=self.port, log_level="warning", lifespan="off",
+            ))
+            self._thread = threading.Thread(target=self._server.run, daemon=True)
+            self._thread.start()
+            while not self._server.started:
+                time.sleep(0.05)
+        else:
+            from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+            from django.core.wsgi import get_wsgi_application
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler, allow_reuse_address=False)
+            self._server.set_app(get_wsgi_application())
+            self.port = self._server.server_address[1]
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self.kind == "asgi":
+            self._server.should_exit = True
+        else:
+            self._server.shutdown()
+            self._server.server_close()
+        self._thread.join(timeout=10)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests /api/ask-question/, /api/documents/ and /documents/<id>/chat/ on a local "
+        "server with the fake LLM backend and seeded data; prints latency stats as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=["asgi", "wsgi"], default="asgi")
+        parser.add_argument("--endpoints", nargs="+", default=["ask", "documents", "chat"],
+                            choices=["ask", "ask-stream", "documents", "chat"])
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+        parser.add_argument("--documents", type=int, default=5)
+        parser.add_argument("--chunks", type=int, default=200, help="Chunks per seeded document")
+        parser.add_argument("--history", type=int, default=200, help="Messages per seeded document")
+        parser.add_argument("--llm-latency", type=float, default=0.2)
+        parser.add_argument("--llm-tokens-per-second", type=float, default=100)
+        parser.add_argument("--answer-cache", action="store_true",
+                            help="Keep the answer cache enabled (questions repeat, so most requests hit it)")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", dest="json_path", help="Write the report to a JSON file")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir, override_settings(
+            DEBUG=False,
+            LLM_BACKEND="fake",
+            FAKE_LLM_LATENCY=options["llm_latency"],
+            FAKE_LLM_TOKENS_PER_SECOND=options["llm_tokens_per_second"],
+            EMBEDDING_CACHE_ENABLED=False,
+            # Брокера нет: история засеивается уже свёрнутой, задача сворачивания не ставится
+            CHAT_HISTORY_SUMMARY_ENABLED=False,
+            ANSWER_CACHE_ENABLED=options["answer_cache"],
+            FAISS_INDEX_DIR=os.path.join(tmp_dir, "faiss"),
+        ):
+            # Временная sqlite база в файле: in-memory база плохо переносит конкурентную запись
+            connections.databases["default"]["TEST"]["NAME"] = os.path.join(tmp_dir, "loadtest.sqlite3")
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                document_ids = self.seed(options)
+                server = LocalServer(options["server"])
+                server.start()
+                try:
+                    report = self.run_load(server.port, document_ids, options)
+                finally:
+                    server.stop()
+            finally:
+                # Записи лога вызовов LLM должны попасть во временную базу до её удаления
+                get_llm_log_writer().flush()
+                teardown_databases(old_config, verbosity=0)
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def seed(self, options):
+        rng = random.Random(options["seed"])
+        OpenaiSettings.objects.create(model="fake-chat")
+
+        document_ids = []
+        for number in range(options["documents"]):
+            document = Document.objects.create(
+                title=f"loadtest {number}",
+                variant=Document.Variant.DOCUMENT,
+                status=Document.Status.DONE,
+                summary=fake_text(rng, 300),
+            )
+            chunk_objs = []
+            offset = 0
+            for index in range(options["chunks"]):
+                text = fake_text(rng, 150)
+                chunk_objs.append(DocumentChunk(
+                    document=document, text=text,
+                    page_start=index // 3 + 1, page_end=index // 3 + 1,
+                    start_offset=offset, end_offset=offset + len(text),
+                ))
+                offset += len(text)
+            DocumentChunk.objects.bulk_create(chunk_objs, batch_size=500)
+            create_embeddings_and_store(document, chunk_objs)
+
+            Message.objects.bulk_create(
+                [
+                    Message(
+                        document=document,
+                        role=Message.Role.USER if index % 2 == 0 else Message.Role.ASSISTANT,
+                        content=fake_text(rng, 40),
+                    )
+                    for index in range(options["history"])
+                ],
+                batch_size=500,
+            )
+            ConversationSummary.objects.create(
+                document=document,
+                summary=fake_text(rng, 150),
+                last_message_id=get_fold_boundary(document.id, 0, settings.CHAT_HISTORY_MAX_MESSAGES) or 0,
+            )
+            document_ids.append(document.id)
+        return document_ids
+
+    def build_request(self, endpoint, document_id, rng):
+        if endpoint in ("ask", "ask-stream"):
+            path = "/api/ask-question/" if endpoint == "ask" else "/api/ask-question/stream/"
+            body = json.dumps({"question": rng.choice(QUESTIONS), "document_id": document_id})
+            return "POST", path, body.encode("utf-8"), {"Content-Type": "application/json"}
+        if endpoint == "documents":
+            return "GET", "/api/documents/", None, {}
+        return "GET", f"/documents/{document_id}/chat/", None, {}
+
+    def run_load(self, port, document_ids, options):
+        local = threading.local()
+        rng = random.Random(options["seed"])
+        report = {
+            "server": options["server"],
+            "concurrency": options["concurrency"],
+            "seed": {
+                "documents": options["documents"],
+                "chunks_per_document": options["chunks"],
+                "messages_per_document": options["history"],
+            },
+            "answer_cache": options["answer_cache"],
+            "llm": {
+                "latency": options["llm_latency"],
+                "tokens_per_second": options["llm_tokens_per_second"],
+            },
+            "endpoints": {},
+        }
+
+        def send(request):
+            method, path, body, headers = request
+            connection = getattr(local, "connection", None)
+            if connection is None:
+                connection = local.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                local.connection = None
+                status = None
+            return (time.perf_counter() - started) * 1000, status
+
+        for endpoint in options["endpoints"]:
+            requests = [
+                self.build_request(endpoint, rng.choice(document_ids), rng)
+                for _ in range(options["requests"])
+            ]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                results = list(pool.map(send, requests))
+            elapsed = time.perf_counter() - started
+
+            ok = [latency for latency, status in results if status == 200]
+            stats = latency_stats(ok, elapsed)
+            stats["errors"] = len(results) - len(ok)
+            report["endpoints"][endpoint] = stats
+        return report
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Document
+from app.tasks import reset_summary, summarize_document
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the summaries of processed documents again, e.g. after the combine prompt "
+        "changed. Map summaries of unchanged chunks come from the chunk summary cache, so "
+        "usually only the reduce step calls the LLM"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("document_ids", type=int, nargs="*")
+        parser.add_argument("--all", action="store_true", help="All processed documents")
+        parser.add_argument("--sync", action="store_true",
+                            help="Summarize in this process instead of queueing Celery tasks")
+
+    def handle(self, *args, **options):
+        if not options["document_ids"] and not options["all"]:
+            raise CommandError("Pass document ids or --all")
+
+        documents = Document.objects.filter(status=Document.Status.DONE)
+        if not options["all"]:
+            documents = documents.filter(id__in=options["document_ids"])
+            missing = set(options["document_ids"]) - set(documents.values_list("id", flat=True))
+            if missing:
+                raise CommandError(f"Not processed or not found: {sorted(missing)}")
+
+        for document_id in documents.order_by("id").values_list("id", flat=True).iterator():
+            reset_summary(document_id)
+            if options["sync"]:
+                summarize_document.apply(args=[document_id], throw=True)
+                status = Document.objects.values_list("summary_status", flat=True).get(id=document_id)
+                self.stdout.write(f"Document {document_id}: summary {status}")
+            else:
+                summarize_document.delay(document_id)
+                self.stdout.write(f"Document {document_id}: queued")
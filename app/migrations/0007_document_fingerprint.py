@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_auto_20250526_1137'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=80, null=True),
+        ),
+    ]
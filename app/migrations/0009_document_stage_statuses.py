@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+def mark_finished_documents(apps, schema_editor):
+    # Уже обработанные документы считаем прошедшими все этапы
+    Document = apps.get_model('app', 'Document')
+    finished = Document.objects.filter(status='done')
+    finished.update(chunking_status='done', summary_status='done', embedding_status='done')
+    finished.filter(variant='youtube').update(title_status='done')
+    finished.exclude(variant='youtube').update(title_status='skipped')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_documentchunk_pages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='chunking_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='embedding_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='summary_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='title_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_finished_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:05
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_document_stage_statuses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('model', models.CharField(max_length=64)),
+                ('prompt_hash', models.CharField(max_length=64)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('summary', models.TextField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chunksummary',
+            constraint=models.UniqueConstraint(fields=('model', 'prompt_hash', 'text_hash'), name='unique_chunk_summary'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_chunksummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('last_message_id', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['document', 'id'], name='message_document_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='document',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_summary', to='app.document'),
+        ),
+    ]
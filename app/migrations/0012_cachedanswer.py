@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_conversationsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question_hash', models.CharField(max_length=64)),
+                ('question', models.TextField()),
+                ('embedding_model', models.CharField(blank=True, max_length=64)),
+                ('embedding', models.BinaryField(blank=True, null=True)),
+                ('answer', models.TextField()),
+                ('metadata', models.JSONField(default=dict)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cached_answers', to='app.document')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cachedanswer',
+            index=models.Index(fields=['document', 'last_used_at'], name='cachedanswer_lru_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cachedanswer',
+            constraint=models.UniqueConstraint(fields=('document', 'question_hash'), name='unique_cached_answer'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='call_type',
+            field=models.CharField(blank=True, choices=[('map', 'Map'), ('reduce', 'Reduce'), ('title', 'Title'), ('condense', 'Condense'), ('answer', 'Answer'), ('embed', 'Embed'), ('fold', 'History fold')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='completion_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='latency_ms',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='retries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['call_type', 'created_at'], name='log_call_type_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_log_instrumentation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='granularity',
+            field=models.CharField(choices=[('summary', 'Summary'), ('retrieval', 'Retrieval')], default='retrieval', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=models.Index(fields=['document', 'granularity', 'start_offset'], name='chunk_granularity_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:12
+
+from django.db import migrations
+
+# Полнотекстовый индекс FTS5 по тексту retrieval-чанков (внешний content — сама таблица чанков,
+# текст не дублируется). Индекс поддерживают триггеры, в том числе при bulk_create.
+# Колонка document_id индексируется как отдельный токен: поиск ограничивается документом внутри
+# MATCH, и BM25 ранжирует только чанки этого документа, а не совпадения по всей базе.
+# Если будущая миграция пересоздаст app_documentchunk (SQLite делает так при изменении полей),
+# триггеры нужно создать заново.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE app_documentchunk_fts USING fts5(
+        text,
+        document_id,
+        content='app_documentchunk',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER app_documentchunk_fts_ai AFTER INSERT ON app_documentchunk
+    WHEN new.granularity = 'retrieval' BEGIN
+        INSERT INTO app_documentchunk_fts(rowid, text, document_id) VALUES (new.id, new.text, new.document_id);
+    END
+    """,
+    """
+    CREATE TRIGGER app_documentchunk_fts_ad AFTER DELETE ON app_documentchunk
+    WHEN old.granularity = 'retrieval' BEGIN
+        INSERT INTO app_documentchunk_fts(app_documentchunk_fts, rowid, text, document_id)
+        VALUES ('delete', old.id, old.text, old.document_id);
+    END
+    """,
+    # Старый текст удаляется из индекса до вставки нового, поэтому оба шага в одном триггере
+    """
+    CREATE TRIGGER app_documentchunk_fts_au AFTER UPDATE OF text, granularity, document_id ON app_documentchunk BEGIN
+        INSERT INTO app_documentchunk_fts(app_documentchunk_fts, rowid, text, document_id)
+        SELECT 'delete', old.id, old.text, old.document_id WHERE old.granularity = 'retrieval';
+        INSERT INTO app_documentchunk_fts(rowid, text, document_id)
+        SELECT new.id, new.text, new.document_id WHERE new.granularity = 'retrieval';
+    END
+    """,
+    # Чанки, сохранённые до миграции
+    """
+    INSERT INTO app_documentchunk_fts(rowid, text, document_id)
+    SELECT id, text, document_id FROM app_documentchunk WHERE granularity = 'retrieval'
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS app_documentchunk_fts_ai",
+    "DROP TRIGGER IF EXISTS app_documentchunk_fts_ad",
+    "DROP TRIGGER IF EXISTS app_documentchunk_fts_au",
+    "DROP TABLE IF EXISTS app_documentchunk_fts",
+]
+
+
+def execute_on_sqlite(schema_editor, statements):
+    # FTS5 есть только в SQLite; на других базах поиск остаётся векторным
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_fts_index(apps, schema_editor):
+    execute_on_sqlite(schema_editor, CREATE_SQL)
+
+
+def drop_fts_index(apps, schema_editor):
+    execute_on_sqlite(schema_editor, DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_documentchunk_granularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -29,6 +29,16 @@ class OpenaiSettings(ExportModelOperationsMixin('openai_settings'), BaseModel):
 
 
 class Log(BaseModel):
+    class CallType(models.TextChoices):
+        MAP = "map", "Map"
+        REDUCE = "reduce", "Reduce"
+        TITLE = "title", "Title"
+        CONDENSE = "condense", "Condense"
+        ANSWER = "answer", "Answer"
+        EMBED = "embed", "Embed"
+        FOLD = "fold", "History fold"
+
+    call_type = models.CharField(max_length=20, choices=CallType.choices, blank=True, default="")
     model = models.CharField(max_length=64)
     temperature = models.DecimalField(
         max_digits=2,
@@ -44,6 +54,17 @@ class Log(BaseModel):
     is_successful = models.BooleanField(default=False)
     is_retried = models.BooleanField(default=False)
 
+    # Задержка и токены вызова; без usage от API токены оценены по длине текста
+    latency_ms = models.FloatField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['call_type', 'created_at'], name='log_call_type_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -55,6 +76,7 @@ class Log(BaseModel):
 class Document(ExportModelOperationsMixin('document'), BaseModel):
     class Status(models.TextChoices):
         UPLOADED = "uploaded", "Uploaded"
+        QUEUED = "queued", "Queued"
         PROCESSING = "processing", "Processing"
         DONE = "done", "Done"
         FAILED = "failed", "Failed"
@@ -63,6 +85,14 @@ class Document(ExportModelOperationsMixin('document'), BaseModel):
         DOCUMENT = "document", "Document"
         YOUTUBE = "youtube", "YouTube Video"
 
+    # Статус отдельного этапа обработки (Celery задачи)
+    class StageStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+        SKIPPED = "skipped", "Skipped"
+
     file = models.FileField(upload_to='pdfs/', blank=True, null=True)
     title = models.CharField(max_length=255, blank=True, null=True)
     variant = models.CharField(max_length=20, choices=Variant.choices, default=Variant.DOCUMENT)
@@ -72,6 +102,36 @@ class Document(ExportModelOperationsMixin('document'), BaseModel):
     status = models.CharField(
         max_length=20, choices=Status.choices, default=Status.UPLOADED
     )
+    chunking_status = models.CharField(
+        max_length=20, choices=StageStatus.choices, default=StageStatus.PENDING
+    )
+    summary_status = models.CharField(
+        max_length=20, choices=StageStatus.choices, default=StageStatus.PENDING
+    )
+    embedding_status = models.CharField(
+        max_length=20, choices=StageStatus.choices, default=StageStatus.PENDING
+    )
+    title_status = models.CharField(
+        max_length=20, choices=StageStatus.choices, default=StageStatus.PENDING
+    )
+    # sha256 файла или youtube:<video_id> — для повторного использования уже обработанных документов
+    fingerprint = models.CharField(max_length=80, blank=True, null=True, db_index=True)
+
+    # Контроль допуска к обработке: кто загрузил, размер и очередь (0 — маленькие документы)
+    client_key = models.CharField(max_length=64, blank=True, default="")
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    priority = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # постраничный список документов (keyset по id) с фильтрами по статусу и типу
+            models.Index(fields=['status', 'id'], name='document_status_id_idx'),
+            models.Index(fields=['variant', 'id'], name='document_variant_id_idx'),
+            models.Index(fields=['created_at'], name='document_created_at_idx'),
+            # выбор следующего документа из очереди и активные документы клиента
+            models.Index(fields=['status', 'priority', 'id'], name='document_queue_idx'),
+            models.Index(fields=['status', 'client_key'], name='document_client_status_idx'),
+        ]
 
     def filename(self):
         return self.file.name.split('/')[-1] if self.file else "No file"
@@ -82,9 +142,95 @@ class Document(ExportModelOperationsMixin('document'), BaseModel):
         return self.filename()
 
 
+class UploadSession(BaseModel):
+    """
+    Chunked, resumable upload of a PDF. Parts are written to a temporary file under
+    MEDIA_ROOT/uploads/; completing the upload creates the Document.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = "active", "Active"
+        COMPLETED = "completed", "Completed"
+        ABORTED = "aborted", "Aborted"
+
+    client_key = models.CharField(max_length=64, blank=True, default="")
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True, null=True)
+    size = models.PositiveBigIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='uploadsession_expiry_idx'),
+        ]
+
+
 class DocumentChunk(BaseModel):
+    class Granularity(models.TextChoices):
+        # крупные чанки для map-шага суммаризации и мелкие для эмбеддингов и поиска
+        SUMMARY = "summary", "Summary"
+        RETRIEVAL = "retrieval", "Retrieval"
+
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="chunks")
     text = models.TextField()
+    granularity = models.CharField(max_length=16, choices=Granularity.choices, default=Granularity.RETRIEVAL)
+
+    # страницы PDF (с 1) и позиции чанка в тексте документа; для YouTube страниц нет
+    page_start = models.PositiveIntegerField(blank=True, null=True)
+    page_end = models.PositiveIntegerField(blank=True, null=True)
+    start_offset = models.PositiveIntegerField(default=0)
+    end_offset = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['document', 'granularity', 'start_offset'], name='chunk_granularity_idx'),
+        ]
+
+
+class ChunkSummary(BaseModel):
+    """
+    Partial (map step) summary of a chunk, reused when a document is re-summarized.
+    """
+    model = models.CharField(max_length=64)
+    prompt_hash = models.CharField(max_length=64)
+    text_hash = models.CharField(max_length=64)
+    summary = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model', 'prompt_hash', 'text_hash'], name='unique_chunk_summary'
+            ),
+        ]
+
+
+class CachedAnswer(BaseModel):
+    """
+    Answer to a question about a document, reused for repeated questions.
+
+    Keyed by the hash of the normalized question; `embedding` (float32 vector of the
+    question) is used for near-duplicate matches.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="cached_answers")
+    question_hash = models.CharField(max_length=64)
+    question = models.TextField()
+    embedding_model = models.CharField(max_length=64, blank=True)
+    embedding = models.BinaryField(blank=True, null=True)
+    answer = models.TextField()
+    metadata = models.JSONField(default=dict)
+    hits = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'question_hash'], name='unique_cached_answer'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['document', 'last_used_at'], name='cachedanswer_lru_idx'),
+        ]
 
 
 class Message(ExportModelOperationsMixin('messsage'), BaseModel):
@@ -95,3 +241,21 @@ class Message(ExportModelOperationsMixin('messsage'), BaseModel):
     document = models.ForeignKey(Document, on_delete=models.CASCADE)
     role = models.CharField(max_length=10, choices=Role.choices)
     content = models.TextField()
+
+    class Meta:
+        indexes = [
+            # последние сообщения документа (история чата) и сообщения после заданного id
+            models.Index(fields=['document', 'id'], name='message_document_id_idx'),
+        ]
+
+
+class ConversationSummary(BaseModel):
+    """
+    Rolling summary of the document chat: messages with id <= last_message_id
+    are folded into `summary` and are no longer sent to the LLM verbatim.
+    """
+    document = models.OneToOneField(
+        Document, on_delete=models.CASCADE, related_name="conversation_summary"
+    )
+    summary = models.TextField(blank=True, default="")
+    last_message_id = models.PositiveBigIntegerField(default=0)
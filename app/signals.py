@@ -0,0 +1,19 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app.models import OpenaiSettings
+from app.utils.processors.clients import get_client_registry
+
+
+@receiver([post_save, post_delete], sender=OpenaiSettings)
+def invalidate_openai_settings(sender, **kwargs):
+    # Изменения в админке применяются сразу в этом процессе, в остальных — через TTL
+    get_client_registry().invalidate_settings()
+
+
+@receiver(setting_changed)
+def reset_clients(sender, setting, **kwargs):
+    # override_settings в бенчмарках меняет бэкенд и параметры клиентов
+    if setting.startswith(('LLM_', 'FAKE_', 'OPENAI_')):
+        get_client_registry().clear()
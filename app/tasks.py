@@ -1,13 +1,51 @@
-from celery import shared_task
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document as LangDocument
-
-from .models import Document, DocumentChunk
-from .utils.processors.pdf import extract_text_from_pdf
-from .utils.processors.langchain import get_summary_chain, \
-                                    create_embeddings_and_store, \
+import time
+
+from celery import chain, group, shared_task
+from django.conf import settings
+from django.utils import timezone
+from prometheus_client import Counter
+
+from .models import Document, DocumentChunk, Log
+from .utils.processors.pdf import iter_pdf_pages
+from .utils.processors.chunking import create_chunkers
+from .utils.processors.langchain import create_embeddings_and_store, \
+                                    copy_embeddings_store, \
                                     get_title_generation_chain 
+from .utils.processors.backends import get_embeddings_model
+from .utils.processors.clients import get_openai_settings
 from .utils.processors.youtube import extract_youtube_video_data
+from .utils.processors.fingerprint import fingerprint_document
+from .utils.processors.history import fold_chat_history
+from .utils.processors.instrumentation import llm_callbacks
+from .utils.events import publish_document_event
+from .utils.admission import admit_queued_documents
+from .utils.processors.summarization import summarize_texts
+from .utils.pipeline_metrics import StageTimer, observe_stage
+
+# Дедупликация: сколько документов удалось взять из уже обработанных
+dedup_hits_counter = Counter(
+    'document_dedup_hits_total', 'Documents reused from an identical processed document', ['variant']
+)
+dedup_misses_counter = Counter(
+    'document_dedup_misses_total', 'Documents processed from scratch', ['variant']
+)
+
+PIPELINE_STAGES = ('chunking_status', 'summary_status', 'embedding_status', 'title_status')
+
+# Этап, без которого этап не запустится: цепочка Celery останавливается на упавшем этапе
+STAGE_PREREQUISITES = {
+    'summary_status': 'chunking_status',
+    'embedding_status': 'chunking_status',
+    'title_status': 'summary_status',
+}
+
+# Этапы, время которых измеряется целиком в run_stage
+STAGE_METRIC_NAMES = {
+    'summary_status': 'summarize',
+    'embedding_status': 'embed',
+    'title_status': 'title',
+}
+
 
 def update_document_status(document, status):
     """
@@ -18,66 +56,387 @@ def update_document_status(document, status):
         status (str): The new status to set (e.g., PROCESSING, DONE, FAILED).
     """
     document.status = status
-    document.save()
+    document.save(update_fields=['status', 'updated_at'])
+    publish_document_event(document.id)
+
+
+def update_stage_status(document, stage, status):
+    """
+    Updates the status of one pipeline stage without overwriting fields
+    that parallel stages may be writing at the same time.
+
+    Args:
+        document (Document): The Document model instance.
+        stage (str): Name of the stage status field (e.g. "summary_status").
+        status (str): The new Document.StageStatus value.
+    """
+    setattr(document, stage, status)
+    document.save(update_fields=[stage, 'updated_at'])
+    publish_document_event(document.id)
 
 
-def extract_text_by_type(document):
+def iter_pages_by_type(document):
+    """
+    Yields (page_number, text) of the document lazily. YouTube transcripts are a single
+    page without a number.
+    """
     if document.variant == Document.Variant.DOCUMENT:
-        return extract_text_from_pdf(document.file.path)
+        # Размер пула задаём явно: в дочерних процессах billiard daemon всегда False
+        yield from iter_pdf_pages(document.file.path, workers=settings.PDF_EXTRACT_WORKERS_IN_CELERY)
     elif document.variant == Document.Variant.YOUTUBE:
-        text = extract_youtube_video_data(document.url)
-        return text
+        yield None, extract_youtube_video_data(document.url)
+
+
+def chunk_and_store_document(document):
+    """
+    Streams pages of the document through the summary and retrieval chunkers in one pass
+    and saves chunks in fixed-size batches, without holding the whole document text in memory.
+
+    Returns:
+        int: The number of saved chunks of both granularities.
+    """
+    openai_settings = get_openai_settings()
+    chunkers = create_chunkers(
+        summary_model=openai_settings.model if openai_settings else "",
+        embedding_model=get_embeddings_model().model,
+    )
+    batch_size = settings.CHUNK_BULK_CREATE_BATCH_SIZE
+    # Извлечение, нарезка и запись идут вперемешку: время каждой части суммируется
+    timer = StageTimer()
+
+    # Удаляем старые чанки (если есть)
+    with timer.measure('db_write'):
+        DocumentChunk.objects.filter(document=document).delete()
+
+    # Держим в памяти только несохранённую пачку
+    pending = []
+    saved = 0
+
+    def save_batch():
+        nonlocal saved
+        with timer.measure('db_write'):
+            DocumentChunk.objects.bulk_create(pending)
+        saved += len(pending)
+        pending.clear()
+
+    def save_spans(granularity, spans):
+        pending.extend(
+            DocumentChunk(
+                document=document,
+                granularity=granularity,
+                text=span.text,
+                page_start=span.page_start,
+                page_end=span.page_end,
+                start_offset=span.start_offset,
+                end_offset=span.end_offset,
+            )
+            for span in spans
+        )
+        # Сохраняем чанки в БД пачками по мере готовности
+        if len(pending) >= batch_size:
+            save_batch()
+
+    for page_number, page_text in timer.iterate('extract', iter_pages_by_type(document)):
+        for granularity, chunker in chunkers.items():
+            with timer.measure('chunk'):
+                spans = chunker.feed(page_number, page_text)
+            save_spans(granularity, spans)
+    for granularity, chunker in chunkers.items():
+        with timer.measure('chunk'):
+            spans = chunker.flush()
+        save_spans(granularity, spans)
+
+    if pending:
+        save_batch()
+    timer.observe(document)
+    return saved
+
+
+def find_processed_duplicate(document):
+    """
+    Finds an already processed document with the same content fingerprint.
+
+    Args:
+        document (Document): The Document model instance.
+
+    Returns:
+        Document or None: The latest finished document with the same fingerprint.
+    """
+    if not document.fingerprint:
+        return None
+
+    return (
+        Document.objects
+        .filter(fingerprint=document.fingerprint, status=Document.Status.DONE)
+        .exclude(id=document.id)
+        .order_by('-id')
+        .first()
+    )
+
+
+def reuse_processed_document(source, document):
+    """
+    Copies summary, chunks and FAISS index from an identical processed document.
+
+    Returns:
+        bool: False if the source can't be reused (e.g. its FAISS index is missing).
+    """
+    if not copy_embeddings_store(source, document):
+        return False
+
+    DocumentChunk.objects.filter(document=document).delete()
+    chunk_fields = ('text', 'granularity', 'page_start', 'page_end', 'start_offset', 'end_offset')
+    chunk_objs = [
+        DocumentChunk(document=document, **values)
+        for values in source.chunks.order_by('id').values(*chunk_fields).iterator()
+    ]
+    DocumentChunk.objects.bulk_create(chunk_objs, batch_size=500)
+
+    document.summary = source.summary
+    if document.variant == Document.Variant.YOUTUBE and not document.title:
+        document.title = source.title
+    document.chunking_status = Document.StageStatus.DONE
+    document.summary_status = Document.StageStatus.DONE
+    document.embedding_status = Document.StageStatus.DONE
+    document.title_status = (
+        Document.StageStatus.DONE if document.variant == Document.Variant.YOUTUBE
+        else Document.StageStatus.SKIPPED
+    )
+    document.save()
+    return True
+
+
+def will_not_run(document, stage):
+    """
+    Whether the stage has failed or is pending behind a stage that won't run.
+    """
+    status = getattr(document, stage)
+    if status == Document.StageStatus.FAILED:
+        return True
+    prerequisite = STAGE_PREREQUISITES.get(stage)
+    return status == Document.StageStatus.PENDING and prerequisite is not None and will_not_run(document, prerequisite)
+
+
+def fail_document_if_settled(document_id):
+    """
+    Marks the document as failed once a stage has failed and no stage is still running
+    or going to run, so the admission slot is only released when the document no longer
+    uses workers.
+    """
+    document = Document.objects.only('status', *PIPELINE_STAGES).get(id=document_id)
+    finished = (Document.StageStatus.DONE, Document.StageStatus.SKIPPED)
+    failed = any(getattr(document, stage) == Document.StageStatus.FAILED for stage in PIPELINE_STAGES)
+    settled = all(
+        getattr(document, stage) in finished or will_not_run(document, stage) for stage in PIPELINE_STAGES
+    )
+    if not failed or not settled:
+        return
+    updated = Document.objects.filter(id=document_id, status=Document.Status.PROCESSING).update(
+        status=Document.Status.FAILED, updated_at=timezone.now()
+    )
+    if updated:
+        publish_document_event(document_id)
+        dispatch_queued_documents()
+
+
+def finalize_document(document_id):
+    """
+    Marks the document as done once every stage has finished, or as failed once the stages
+    still able to run have finished after a failure. Stages run in parallel and every
+    stage writes its own status before calling this, so whichever stage finishes last
+    sees all of them; the final status is a conditional UPDATE, applied only once.
+    """
+    updated = Document.objects.filter(
+        id=document_id,
+        chunking_status=Document.StageStatus.DONE,
+        summary_status=Document.StageStatus.DONE,
+        embedding_status=Document.StageStatus.DONE,
+        title_status__in=[Document.StageStatus.DONE, Document.StageStatus.SKIPPED],
+    ).exclude(status=Document.Status.DONE).update(status=Document.Status.DONE, updated_at=timezone.now())
+    if updated:
+        publish_document_event(document_id)
+        # Освободился слот обработки — запускаем следующий документ из очереди
+        dispatch_queued_documents()
     else:
-        return ""
+        fail_document_if_settled(document_id)
 
 
-@shared_task
-def process_document(document_id):
+def run_stage(task, document_id, stage, func):
+    """
+    Runs one pipeline stage of the document.
+
+    Stages that are already done are skipped, so restarting the pipeline after a failure
+    only redoes what failed. A failing stage is retried by Celery; after the last retry
+    the stage is marked as failed, and the document once the other branch has finished
+    (see finalize_document).
+
+    Args:
+        task: The bound Celery task.
+        document_id (int): The Document id.
+        stage (str): Name of the stage status field.
+        func (callable): func(document) doing the work of the stage.
+    """
     document = Document.objects.get(id=document_id)
+    if getattr(document, stage) in (Document.StageStatus.DONE, Document.StageStatus.SKIPPED):
+        finalize_document(document_id)
+        return
+
+    update_stage_status(document, stage, Document.StageStatus.PROCESSING)
+    started = time.perf_counter()
     try:
-        update_document_status(document, Document.Status.PROCESSING)
+        func(document)
+    except Exception as e:
+        if task.request.retries < task.max_retries:
+            raise task.retry(exc=e, countdown=settings.PIPELINE_STAGE_RETRY_DELAY * 2 ** task.request.retries)
+        update_stage_status(document, stage, Document.StageStatus.FAILED)
+        finalize_document(document_id)
+        raise e
 
-        # Получаем текст в зависимости от типа документа
-        text = extract_text_by_type(document)
+    if getattr(document, stage) == Document.StageStatus.PROCESSING:
+        # Этап извлечения делится на части внутри chunk_and_store_document
+        if stage in STAGE_METRIC_NAMES:
+            observe_stage(document, STAGE_METRIC_NAMES[stage], time.perf_counter() - started)
+        update_stage_status(document, stage, Document.StageStatus.DONE)
+    finalize_document(document_id)
 
-        if not text:
-            raise ValueError("No text extracted from the document")
 
-        # Разбиваем текст на чанки ОДИН раз
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = text_splitter.split_text(text)
+def get_chunks(document, granularity):
+    return document.chunks.filter(granularity=granularity).order_by('start_offset', 'id')
 
-        # Удаляем старые чанки (если есть)
-        DocumentChunk.objects.filter(document=document).delete()
 
-        # Сохраняем чанки в БД
-        chunk_objs = [DocumentChunk(document=document, text=chunk) for chunk in chunks]
-        DocumentChunk.objects.bulk_create(chunk_objs)
+def get_summary_texts(document):
+    texts = list(get_chunks(document, DocumentChunk.Granularity.SUMMARY).values_list('text', flat=True))
+    # Документы, нарезанные до разделения чанков, суммаризируются по обычным чанкам
+    if not texts:
+        texts = list(get_chunks(document, DocumentChunk.Granularity.RETRIEVAL).values_list('text', flat=True))
+    return texts
 
-        # Загружаем чанки из БД (чтобы получить id и т.п.)
-        chunk_objs = list(DocumentChunk.objects.filter(document=document))
 
-        # Создаем LangChain документы
-        docs = [LangDocument(page_content=chunk.text) for chunk in chunk_objs]
+def extract_and_chunk(document):
+    # Если такой же документ уже обработан — используем его результаты
+    if not document.fingerprint:
+        document.fingerprint = fingerprint_document(document)
+        document.save(update_fields=['fingerprint', 'updated_at'])
 
-        # Суммаризация
-        chain = get_summary_chain()
-        summary = chain.run(docs)
+    source = find_processed_duplicate(document)
+    if source and reuse_processed_document(source, document):
+        dedup_hits_counter.labels(variant=document.variant).inc()
+        return
+    dedup_misses_counter.labels(variant=document.variant).inc()
 
-        # Сохраняем summary
-        document.summary = summary
-        document.save()
+    # Читаем страницы и режем на чанки потоково, сохраняя чанки пачками
+    chunk_count = chunk_and_store_document(document)
 
-        # Эмбеддинги для RAG (параллельно)
-        create_embeddings_and_store(document, chunk_objs)
+    if not chunk_count:
+        raise ValueError("No text extracted from the document")
 
-        if document.variant == Document.Variant.YOUTUBE:
-            chain = get_title_generation_chain()
-            generated_title = chain.run(summary_text=document.summary)
-            document.title = generated_title.replace('"', '').strip()
-            document.save()
-        update_document_status(document, Document.Status.DONE)
+    # Чанки новые — последующие этапы нужно выполнить заново
+    Document.objects.filter(id=document.id).update(
+        summary_status=Document.StageStatus.PENDING,
+        embedding_status=Document.StageStatus.PENDING,
+        title_status=Document.StageStatus.PENDING,
+        updated_at=timezone.now(),
+    )
+    publish_document_event(document.id)
 
-    except Exception as e:
-        update_document_status(document, Document.Status.FAILED)
-        raise e
+
+def summarize(document):
+    # Суммаризация (map-шаг выполняется параллельно)
+    document.summary = summarize_texts(get_summary_texts(document))
+    document.save(update_fields=['summary', 'updated_at'])
+
+
+def embed(document):
+    # Эмбеддинги для RAG, выполняются параллельно с суммаризацией
+    chunk_objs = list(
+        get_chunks(document, DocumentChunk.Granularity.RETRIEVAL).only('text', 'page_start', 'page_end')
+    )
+    create_embeddings_and_store(document, chunk_objs)
+
+
+def generate_title(document):
+    if document.variant != Document.Variant.YOUTUBE:
+        update_stage_status(document, 'title_status', Document.StageStatus.SKIPPED)
+        return
+
+    chain = get_title_generation_chain()
+    generated_title = chain.run(summary_text=document.summary, callbacks=llm_callbacks(Log.CallType.TITLE))
+    document.title = generated_title.replace('"', '').strip()
+    document.save(update_fields=['title', 'updated_at'])
+
+
+@shared_task(bind=True, max_retries=settings.PIPELINE_STAGE_MAX_RETRIES)
+def extract_document(self, document_id):
+    run_stage(self, document_id, 'chunking_status', extract_and_chunk)
+
+
+@shared_task(bind=True, max_retries=settings.PIPELINE_STAGE_MAX_RETRIES)
+def summarize_document(self, document_id):
+    run_stage(self, document_id, 'summary_status', summarize)
+
+
+@shared_task(bind=True, max_retries=settings.PIPELINE_STAGE_MAX_RETRIES)
+def embed_document(self, document_id):
+    run_stage(self, document_id, 'embedding_status', embed)
+
+
+@shared_task(bind=True, max_retries=settings.PIPELINE_STAGE_MAX_RETRIES)
+def generate_document_title(self, document_id):
+    run_stage(self, document_id, 'title_status', generate_title)
+
+
+def build_document_pipeline(document_id):
+    """
+    extract + chunk  ->  ( summarize -> title )  ||  embed
+
+    Summarization and embeddings run in parallel, title generation waits only for the summary.
+    The last stage to finish marks the document as done (see finalize_document).
+    """
+    return chain(
+        extract_document.si(document_id),
+        group(
+            chain(summarize_document.si(document_id), generate_document_title.si(document_id)),
+            embed_document.si(document_id),
+        ),
+    )
+
+
+def reset_summary(document_id):
+    """
+    Marks the summary of a processed document as pending, so `summarize_document`
+    generates it again (e.g. after the combine prompt changed).
+    """
+    Document.objects.filter(id=document_id).update(
+        summary_status=Document.StageStatus.PENDING, updated_at=timezone.now()
+    )
+    publish_document_event(document_id)
+
+
+def dispatch_queued_documents():
+    """
+    Starts the pipelines of queued documents while admission control has free slots.
+    Runs after every upload and whenever a document finishes or fails.
+    """
+    for document_id in admit_queued_documents():
+        publish_document_event(document_id)
+        build_document_pipeline(document_id).apply_async()
+
+
+@shared_task
+def process_document(document_id):
+    """
+    Queues (or re-queues after a failure) the document; its pipeline starts as soon as
+    admission control has a free slot for it.
+    """
+    document = Document.objects.get(id=document_id)
+    if document.status != Document.Status.PROCESSING:
+        update_document_status(document, Document.Status.QUEUED)
+    dispatch_queued_documents()
+
+
+@shared_task
+def fold_document_history(document_id):
+    """
+    Folds old chat messages of the document into its rolling conversation summary.
+    """
+    fold_chat_history(document_id)
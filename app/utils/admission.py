@@ -0,0 +1,176 @@
+"""
+Admission control of the processing pipeline.
+
+Uploaded documents are queued; a queued document starts when fewer than
+ADMISSION_MAX_ACTIVE documents are processing in total and fewer than
+ADMISSION_MAX_ACTIVE_PER_CLIENT for its client. Small documents (priority 0) go before
+large ones (priority 1); a large document that has waited ADMISSION_PRIORITY_AGING
+seconds is ordered like a small one, so a steady stream of small uploads can't starve it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, Func, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+from prometheus_client import Counter, Histogram
+
+from app.models import Document
+
+documents_admitted_counter = Counter(
+    'documents_admitted_total', 'Queued documents admitted to the processing pipeline', ['lane']
+)
+document_queue_wait_histogram = Histogram(
+    'document_queue_wait_seconds', 'Time documents spend queued before processing starts', ['lane'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+SMALL_LANE = 0
+LARGE_LANE = 1
+LANE_NAMES = {SMALL_LANE: "small", LARGE_LANE: "large"}
+
+# Сколько документов из начала очереди просматривается за один проход
+DISPATCH_SCAN_LIMIT = 50
+
+
+def get_client_key(request):
+    """
+    Identifies the uploading client by its IP address (first X-Forwarded-For hop behind a proxy).
+    """
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    client_ip = forwarded_for.split(',')[0].strip() or request.META.get('REMOTE_ADDR', '')
+    return client_ip[:64]
+
+
+def get_document_size(document):
+    if document.variant == Document.Variant.DOCUMENT and document.file:
+        return document.file.size
+    # Транскрипт YouTube заранее неизвестен, считаем его маленьким
+    return 0
+
+
+def prepare_for_queue(document, client_key):
+    """
+    Fills the admission fields of a new document and marks it as queued (not saved).
+    """
+    document.client_key = client_key
+    document.size_bytes = get_document_size(document)
+    document.priority = (
+        SMALL_LANE if document.size_bytes <= settings.ADMISSION_SMALL_DOCUMENT_BYTES else LARGE_LANE
+    )
+    document.status = Document.Status.QUEUED
+
+
+def queued_documents():
+    """
+    Queued documents in dispatch order: by lane (with aging), then first come first served.
+    """
+    aged_before = timezone.now() - timedelta(seconds=settings.ADMISSION_PRIORITY_AGING)
+    return (
+        Document.objects.filter(status=Document.Status.QUEUED)
+        .annotate(lane=Case(
+            When(updated_at__lt=aged_before, then=Value(SMALL_LANE)),
+            default=F('priority'),
+            output_field=IntegerField(),
+        ))
+        .order_by('lane', 'id')
+    )
+
+
+def count_processing():
+    return Document.objects.filter(status=Document.Status.PROCESSING).count()
+
+
+def count_subquery(queryset):
+    return Subquery(
+        queryset.order_by().annotate(total=Func(F('id'), function='COUNT')).values('total')[:1],
+        output_field=IntegerField(),
+    )
+
+
+def get_queue_positions(document_ids):
+    """
+    1-based positions of the queued documents among `document_ids` in the dispatch order,
+    computed in one query; documents that aren't queued are left out.
+
+    Returns:
+        dict[int, int]: Position by document id.
+    """
+    if not document_ids:
+        return {}
+    queued = queued_documents()
+    ahead = queued.filter(Q(lane__lt=OuterRef('lane')) | Q(lane=OuterRef('lane'), id__lt=OuterRef('id')))
+    rows = (
+        queued.filter(id__in=document_ids)
+        .annotate(ahead=count_subquery(ahead))
+        .values_list('id', 'ahead')
+    )
+    return {document_id: ahead + 1 for document_id, ahead in rows}
+
+
+def get_queue_position(document):
+    """
+    1-based position of a queued document in the dispatch order, None if it isn't queued.
+    """
+    if document.status != Document.Status.QUEUED:
+        return None
+    return get_queue_positions([document.id]).get(document.id)
+
+
+def claim_slot(document):
+    """
+    Moves a queued document to processing if the global and per-client limits allow it.
+
+    The limits are checked inside the same UPDATE statement. SQLite serializes writes,
+    so there concurrent dispatchers can't start more documents than there are slots; with
+    concurrent writers (e.g. PostgreSQL under READ COMMITTED) two UPDATEs can both see
+    the last free slot, and the claim would need a lock.
+
+    Returns:
+        bool: True if the document was admitted.
+    """
+    processing = Document.objects.filter(status=Document.Status.PROCESSING)
+    claimed = (
+        Document.objects
+        .alias(
+            active_total=count_subquery(processing),
+            active_client=count_subquery(processing.filter(client_key=document.client_key)),
+        )
+        .filter(
+            id=document.id,
+            status=Document.Status.QUEUED,
+            active_total__lt=settings.ADMISSION_MAX_ACTIVE,
+            active_client__lt=settings.ADMISSION_MAX_ACTIVE_PER_CLIENT,
+        )
+        .update(status=Document.Status.PROCESSING, updated_at=timezone.now())
+    )
+    if not claimed:
+        return False
+
+    lane = LANE_NAMES[document.priority]
+    documents_admitted_counter.labels(lane=lane).inc()
+    document_queue_wait_histogram.labels(lane=lane).observe(
+        (timezone.now() - document.updated_at).total_seconds()
+    )
+    return True
+
+
+def admit_queued_documents():
+    """
+    Admits queued documents while there are free slots.
+
+    Returns:
+        list[int]: Ids of the admitted documents; their pipelines have to be started.
+    """
+    admitted = []
+    free_slots = settings.ADMISSION_MAX_ACTIVE - count_processing()
+
+    for document in queued_documents()[:DISPATCH_SCAN_LIMIT]:
+        if free_slots <= 0:
+            break
+        if claim_slot(document):
+            admitted.append(document.id)
+            free_slots -= 1
+        elif count_processing() >= settings.ADMISSION_MAX_ACTIVE:
+            # Слоты заняли параллельные проходы; иначе документ ждёт из-за лимита своего клиента
+            break
+    return admitted
@@ -0,0 +1,200 @@
+import re
+import unicodedata
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from prometheus_client import Counter
+
+from app.models import CachedAnswer
+from app.utils.cache.embedding_cache import text_hash
+
+answer_cache_hits_counter = Counter(
+    'answer_cache_hits_total', 'Answers served from the answer cache', ['match']
+)
+answer_cache_misses_counter = Counter(
+    'answer_cache_misses_total', 'Questions answered by the RAG chain'
+)
+answer_cache_evictions_counter = Counter(
+    'answer_cache_evictions_total', 'Cached answers removed from the answer cache', ['reason']
+)
+
+TRAILING_PUNCTUATION_RE = re.compile(r"[\s?!.…,;:]+$")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    question = unicodedata.normalize("NFKC", question).lower().replace("ё", "е")
+    question = WHITESPACE_RE.sub(" ", question).strip()
+    return TRAILING_PUNCTUATION_RE.sub("", question)
+
+
+def is_answer_cache_enabled():
+    return settings.ANSWER_CACHE_ENABLED
+
+
+def invalidate_answer_cache(document_id):
+    """
+    Removes all cached answers of the document, e.g. after its index was rebuilt.
+    """
+    deleted, _ = CachedAnswer.objects.filter(document_id=document_id).delete()
+    if deleted:
+        answer_cache_evictions_counter.labels(reason="reindex").inc(deleted)
+
+
+class AnswerCache:
+    """
+    Cached answers of one document, stored in the CachedAnswer table so all web
+    processes share them.
+
+    An exact match on the normalized question is a single indexed lookup. If
+    ANSWER_CACHE_SIMILARITY_THRESHOLD is set, a miss embeds the question and compares it
+    with the cached question embeddings of the document (at most
+    ANSWER_CACHE_MAX_ENTRIES_PER_DOCUMENT of them). Entries expire after ANSWER_CACHE_TTL
+    seconds; the least recently used ones are evicted above the per-document limit.
+
+    A question can be stored with a `context` (a fingerprint of the conversation it was
+    asked in): such entries only match the same question in the same conversation and are
+    never matched by similarity. Entries without a context are standalone questions.
+    """
+
+    def __init__(self, document_id, embeddings_model=None):
+        self.document_id = document_id
+        self.embeddings_model = embeddings_model
+        self.similarity_threshold = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        # Эмбеддинг вопроса, посчитанный при поиске: сохраняется вместе с ответом
+        # и используется для поиска фрагментов, чтобы не считать его второй раз
+        self.embedded_question = None
+        self.question_embedding = None
+
+    @property
+    def embedding_model_name(self):
+        return getattr(self.embeddings_model, "model", "") or ""
+
+    def _entries(self):
+        expires_before = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+        return CachedAnswer.objects.filter(document_id=self.document_id, created_at__gte=expires_before)
+
+    @staticmethod
+    def _question_hash(question, context=None):
+        normalized = normalize_question(question)
+        return text_hash(normalized if context is None else f"{normalized}\n{context}")
+
+    def can_match_similar(self, context=None):
+        return context is None and self.similarity_threshold > 0 and self.embeddings_model is not None
+
+    def embed_question(self, question):
+        if self.embedded_question != question:
+            self.question_embedding = self.embeddings_model.embed_query(question)
+            self.embedded_question = question
+        return self.question_embedding
+
+    async def aembed_question(self, question):
+        if self.embedded_question != question:
+            self.question_embedding = await self.embeddings_model.aembed_query(question)
+            self.embedded_question = question
+        return self.question_embedding
+
+    def _use(self, entry, match):
+        CachedAnswer.objects.filter(id=entry.id).update(hits=F("hits") + 1, last_used_at=timezone.now())
+        answer_cache_hits_counter.labels(match=match).inc()
+        return entry
+
+    def get_exact(self, question, context=None):
+        entry = self._entries().filter(question_hash=self._question_hash(question, context)).first()
+        return self._use(entry, "exact") if entry is not None else None
+
+    def get_similar(self, question_embedding):
+        """
+        Returns the cached standalone question most similar to the embedded one if it is
+        above ANSWER_CACHE_SIMILARITY_THRESHOLD, or None. Makes no embedding call, so the
+        async path can embed the question with the async client beforehand.
+        """
+        vector = np.asarray(question_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+
+        candidates = list(
+            self._entries()
+            .filter(embedding_model=self.embedding_model_name, embedding__isnull=False)
+            .order_by("-last_used_at")
+            .values_list("id", "embedding")[:settings.ANSWER_CACHE_MAX_ENTRIES_PER_DOCUMENT]
+        )
+        candidates = [
+            (entry_id, np.frombuffer(bytes(blob), dtype=np.float32))
+            for entry_id, blob in candidates
+        ]
+        candidates = [(entry_id, blob) for entry_id, blob in candidates if blob.shape == vector.shape]
+        if not candidates:
+            return None
+
+        ids = [entry_id for entry_id, _ in candidates]
+        matrix = np.stack([blob for _, blob in candidates])
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1
+        similarities = matrix @ vector / (norms * norm)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        entry = CachedAnswer.objects.filter(id=ids[best]).first()
+        return self._use(entry, "similar") if entry is not None else None
+
+    def get(self, question, context=None):
+        """
+        Returns the cached answer for the question or None: an exact match, then (for
+        standalone questions) a similar one, embedding the question synchronously.
+        Misses are counted by the caller with `record_miss`, once per answered question.
+        """
+        entry = self.get_exact(question, context)
+        if entry is None and self.can_match_similar(context):
+            entry = self.get_similar(self.embed_question(question))
+        return entry
+
+    def record_miss(self):
+        answer_cache_misses_counter.inc()
+
+    def set(self, question, answer, metadata, context=None):
+        normalized = normalize_question(question)
+        embedding = None
+        if context is None and self.embedded_question == question and self.question_embedding is not None:
+            embedding = np.asarray(self.question_embedding, dtype=np.float32).tobytes()
+
+        try:
+            CachedAnswer.objects.update_or_create(
+                document_id=self.document_id,
+                question_hash=self._question_hash(question, context),
+                defaults={
+                    "question": normalized,
+                    "embedding_model": self.embedding_model_name if embedding else "",
+                    "embedding": embedding,
+                    "answer": answer,
+                    "metadata": metadata,
+                    "hits": 0,
+                    "created_at": timezone.now(),
+                    "last_used_at": timezone.now(),
+                },
+            )
+        except IntegrityError:
+            # Тот же вопрос одновременно сохранил другой запрос
+            return
+        self.evict()
+
+    def evict(self):
+        entries = CachedAnswer.objects.filter(document_id=self.document_id)
+
+        expires_before = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+        expired, _ = entries.filter(created_at__lt=expires_before).delete()
+        if expired:
+            answer_cache_evictions_counter.labels(reason="ttl").inc(expired)
+
+        stale_ids = list(
+            entries.order_by("-last_used_at")
+            .values_list("id", flat=True)[settings.ANSWER_CACHE_MAX_ENTRIES_PER_DOCUMENT:]
+        )
+        if stale_ids:
+            deleted, _ = CachedAnswer.objects.filter(id__in=stale_ids).delete()
+            answer_cache_evictions_counter.labels(reason="lru").inc(deleted)
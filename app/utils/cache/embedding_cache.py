@@ -0,0 +1,235 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Counter
+
+embedding_cache_hits_counter = Counter(
+    'embedding_cache_hits_total', 'Chunk embeddings served from the on-disk cache'
+)
+embedding_cache_misses_counter = Counter(
+    'embedding_cache_misses_total', 'Chunk embeddings requested from the embedding backend'
+)
+embedding_cache_evictions_counter = Counter(
+    'embedding_cache_evictions_total', 'Chunk embeddings evicted from the on-disk cache'
+)
+
+# sqlite ограничивает число параметров в одном запросе
+SQLITE_BATCH_SIZE = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of embedding vectors keyed by (embedding model, sha256 of the text).
+
+    Vectors are stored as raw float32 blobs in a sqlite file. When the total size of the
+    stored vectors exceeds `max_bytes`, the least recently used entries are evicted.
+    The total is kept in a meta row by triggers, so every process sharing the file sees it
+    without summing the table.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        with self._lock:
+            if not self._initialized:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    " model TEXT NOT NULL,"
+                    " text_hash TEXT NOT NULL,"
+                    " vector BLOB NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " last_used REAL NOT NULL,"
+                    " PRIMARY KEY (model, text_hash))"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+                )
+                self._create_size_total(connection)
+                connection.commit()
+                self._initialized = True
+        return connection
+
+    @staticmethod
+    def _create_size_total(connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings_meta ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1),"
+            " total_size INTEGER NOT NULL)"
+        )
+        # Файлы, созданные до появления счётчика, суммируются один раз
+        connection.execute(
+            "INSERT OR IGNORE INTO embeddings_meta (id, total_size)"
+            " SELECT 1, COALESCE(SUM(size), 0) FROM embeddings"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS embeddings_size_ai AFTER INSERT ON embeddings BEGIN"
+            " UPDATE embeddings_meta SET total_size = total_size + new.size WHERE id = 1; END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS embeddings_size_ad AFTER DELETE ON embeddings BEGIN"
+            " UPDATE embeddings_meta SET total_size = total_size - old.size WHERE id = 1; END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS embeddings_size_au AFTER UPDATE OF size ON embeddings BEGIN"
+            " UPDATE embeddings_meta SET total_size = total_size - old.size + new.size WHERE id = 1; END"
+        )
+
+    def get_many(self, model, hashes):
+        """
+        Returns a dict {text_hash: np.ndarray(float32)} for the hashes found in the cache
+        and marks them as recently used.
+        """
+        found = {}
+        if not hashes:
+            return found
+
+        connection = self._connect()
+        try:
+            for start in range(0, len(hashes), SQLITE_BATCH_SIZE):
+                batch = hashes[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings"
+                    f" WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found],
+                )
+                connection.commit()
+        finally:
+            connection.close()
+        return found
+
+    def set_many(self, model, items):
+        """
+        Stores {text_hash: vector} pairs and evicts old entries if the cache is over budget.
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((model, key, blob, len(blob), now))
+
+        connection = self._connect()
+        try:
+            # Upsert, а не INSERT OR REPLACE: замена строки не вызывает триггер удаления
+            connection.executemany(
+                "INSERT INTO embeddings (model, text_hash, vector, size, last_used)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (model, text_hash) DO UPDATE SET"
+                " vector = excluded.vector, size = excluded.size, last_used = excluded.last_used",
+                rows,
+            )
+            connection.commit()
+            self._evict(connection)
+        finally:
+            connection.close()
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT total_size FROM embeddings_meta WHERE id = 1").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Освобождаем с запасом (до 90% бюджета), чтобы не вытеснять на каждой записи
+        to_free = total - int(self.max_bytes * 0.9)
+        freed = 0
+        evicted = []
+        for model, key, size in connection.execute(
+            "SELECT model, text_hash, size FROM embeddings ORDER BY last_used"
+        ):
+            evicted.append((model, key))
+            freed += size
+            if freed >= to_free:
+                break
+
+        connection.executemany(
+            "DELETE FROM embeddings WHERE model = ? AND text_hash = ?", evicted
+        )
+        connection.commit()
+        embedding_cache_evictions_counter.inc(len(evicted))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends cache misses to the underlying embedding model.
+
+    Query embeddings are not cached: questions are rarely repeated verbatim.
+    """
+
+    def __init__(self, embeddings_model, model_name, cache):
+        self.embeddings_model = embeddings_model
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        vectors = self.cache.get_many(self.model_name, unique_hashes)
+
+        texts_by_hash = dict(zip(hashes, texts))
+        missing = [key for key in unique_hashes if key not in vectors]
+        embedding_cache_hits_counter.inc(len(unique_hashes) - len(missing))
+        embedding_cache_misses_counter.inc(len(missing))
+
+        if missing:
+            embedded = self.embeddings_model.embed_documents([texts_by_hash[key] for key in missing])
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, embedded)
+            }
+            self.cache.set_many(self.model_name, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key].tolist() for key in hashes]
+
+    def embed_query(self, text):
+        return self.embeddings_model.embed_query(text)
+
+
+_embedding_cache = None
+
+
+def get_embedding_cache():
+    """
+    Returns the process-wide EmbeddingCache configured in settings.
+    """
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_BYTES
+        )
+    return _embedding_cache
+
+
+def with_embedding_cache(embeddings_model):
+    """
+    Wraps an embeddings model with the persistent cache if it is enabled in settings.
+    """
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return embeddings_model
+    return CachedEmbeddings(embeddings_model, embeddings_model.model, get_embedding_cache())
@@ -0,0 +1,82 @@
+import hashlib
+
+from prometheus_client import Counter
+
+from app.models import ChunkSummary
+from app.utils.cache.embedding_cache import text_hash
+
+chunk_summary_cache_hits_counter = Counter(
+    'chunk_summary_cache_hits_total', 'Map step summaries reused from the database'
+)
+chunk_summary_cache_misses_counter = Counter(
+    'chunk_summary_cache_misses_total', 'Map step summaries generated by the LLM'
+)
+
+# sqlite ограничивает число параметров в одном запросе
+QUERY_BATCH_SIZE = 500
+
+
+class ChunkSummaryCache:
+    """
+    Map step summaries stored in the ChunkSummary table and keyed by
+    (model, hash of the map prompt template, hash of the chunk text).
+
+    Changing the combine prompt keeps all map summaries valid, changing the model
+    or the map prompt makes them miss.
+    """
+
+    def __init__(self, model, map_prompt):
+        self.model = model
+        self.prompt_hash = hashlib.sha256(map_prompt.template.encode("utf-8")).hexdigest()
+
+    def get_many(self, hashes):
+        found = {}
+        for start in range(0, len(hashes), QUERY_BATCH_SIZE):
+            rows = ChunkSummary.objects.filter(
+                model=self.model,
+                prompt_hash=self.prompt_hash,
+                text_hash__in=hashes[start:start + QUERY_BATCH_SIZE],
+            ).values_list('text_hash', 'summary')
+            found.update(rows)
+        return found
+
+    def set_many(self, summaries):
+        ChunkSummary.objects.bulk_create(
+            [
+                ChunkSummary(
+                    model=self.model,
+                    prompt_hash=self.prompt_hash,
+                    text_hash=key,
+                    summary=summary,
+                )
+                for key, summary in summaries.items()
+            ],
+            batch_size=QUERY_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def map(self, texts, summarize):
+        """
+        Returns map summaries for `texts` in order; only texts missing from the cache
+        are passed to `summarize(texts, on_result) -> list[str]`.
+
+        `summarize` calls `on_result(index, summary)` as each summary completes and it is
+        stored right away, so summaries finished before a failure are reused on retry.
+        """
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        summaries = self.get_many(unique_hashes)
+
+        texts_by_hash = dict(zip(hashes, texts))
+        missing = [key for key in unique_hashes if key not in summaries]
+        chunk_summary_cache_hits_counter.inc(len(unique_hashes) - len(missing))
+        chunk_summary_cache_misses_counter.inc(len(missing))
+
+        if missing:
+            def save(index, summary):
+                self.set_many({missing[index]: summary})
+
+            generated = summarize([texts_by_hash[key] for key in missing], save)
+            summaries.update(zip(missing, generated))
+
+        return [summaries[key] for key in hashes]
@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from prometheus_client import Counter, Gauge
+
+vectorstore_cache_hits_counter = Counter(
+    'vectorstore_cache_hits_total', 'FAISS vectorstores served from the in-process cache'
+)
+vectorstore_cache_misses_counter = Counter(
+    'vectorstore_cache_misses_total', 'FAISS vectorstores loaded from disk'
+)
+vectorstore_cache_evictions_counter = Counter(
+    'vectorstore_cache_evictions_total', 'FAISS vectorstores evicted from the in-process cache'
+)
+vectorstore_cache_resident_bytes = Gauge(
+    'vectorstore_cache_resident_bytes', 'Estimated memory used by cached FAISS vectorstores',
+    multiprocess_mode='livesum',
+)
+
+# Примерные накладные расходы на один документ в docstore (объект, metadata, id)
+DOCSTORE_ENTRY_OVERHEAD = 512
+
+
+def estimate_vectorstore_size(vectorstore):
+    """
+    Estimates memory used by a FAISS vectorstore: float32 vectors plus docstore texts.
+    """
+    index = vectorstore.index
+    size = index.ntotal * index.d * 4
+    for doc in vectorstore.docstore._dict.values():
+        size += len(doc.page_content.encode("utf-8")) + DOCSTORE_ENTRY_OVERHEAD
+    return size
+
+
+class VectorstoreCache:
+    """
+    Per-process LRU cache of loaded FAISS vectorstores bounded by a memory budget.
+
+    Each entry remembers the version of the index files on disk (their mtimes), so an index
+    rebuilt by a Celery worker in another process is reloaded on the next access.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._resident_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version, loader):
+        """
+        Returns the cached vectorstore for `key` or loads it with `loader()` on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                vectorstore_cache_hits_counter.inc()
+                return entry[1]
+
+        vectorstore_cache_misses_counter.inc()
+        vectorstore = loader()
+        size = estimate_vectorstore_size(vectorstore)
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (version, vectorstore, size)
+            self._resident_bytes += size
+            # Последний загруженный индекс оставляем, даже если он больше бюджета
+            while self._resident_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                vectorstore_cache_evictions_counter.inc()
+            vectorstore_cache_resident_bytes.set(self._resident_bytes)
+
+        return vectorstore
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+            vectorstore_cache_resident_bytes.set(self._resident_bytes)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._resident_bytes -= entry[2]
+
+
+_vectorstore_cache = None
+
+
+def get_vectorstore_cache():
+    """
+    Returns the process-wide VectorstoreCache configured in settings.
+    """
+    global _vectorstore_cache
+    if _vectorstore_cache is None:
+        _vectorstore_cache = VectorstoreCache(settings.VECTORSTORE_CACHE_MAX_BYTES)
+    return _vectorstore_cache
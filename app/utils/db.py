@@ -0,0 +1,25 @@
+"""
+ORM access from async code.
+
+Django 3.2 runs thread-sensitive sync_to_async calls (the default) of all requests in one
+shared thread, so short ORM helpers of concurrent async requests queue behind each other.
+`db_sync_to_async` runs them in the default thread pool instead. Connections are per
+thread, so stale ones are closed around every call, as Django does around a request.
+"""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def db_sync_to_async(func):
+    """
+    Wraps a short, connection-only ORM helper (no thread-bound state, no transaction
+    spanning several calls) for awaiting in the default thread pool.
+    """
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)
@@ -0,0 +1,127 @@
+"""
+Documents listing: keyset pagination over the id index, without the summaries.
+
+A page is `WHERE [status = ...] [AND variant = ...] [AND id < cursor] ORDER BY id DESC LIMIT n`,
+served by the (status, id) / (variant, id) indexes, so its cost doesn't depend on the page
+number or on the size of the table. Summaries are fetched separately, one document at a time.
+"""
+import base64
+import binascii
+
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from app.models import Document
+from app.utils.admission import get_queue_positions
+
+# Сколько документов показывает страница загрузки
+LATEST_DOCUMENTS_LIMIT = 5
+MAX_PAGE_SIZE = 100
+
+LIST_FIELDS = (
+    'id', 'file', 'title', 'variant', 'url', 'status',
+    'chunking_status', 'summary_status', 'embedding_status', 'title_status',
+    'priority', 'created_at', 'updated_at',
+)
+
+
+def encode_cursor(document_id):
+    return base64.urlsafe_b64encode(str(document_id).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the document id encoded in the cursor or raises ValueError.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def document_list_queryset():
+    """
+    Documents newest first with only the listed fields; `has_summary` is computed
+    in the database, so summaries are never transferred.
+    """
+    return (
+        Document.objects.only(*LIST_FIELDS)
+        .annotate(has_summary=ExpressionWrapper(Q(summary__gt=''), output_field=BooleanField()))
+        .order_by('-id')
+    )
+
+
+def filter_documents(queryset, status=None, variant=None, cursor=None):
+    """
+    Applies the listing filters; raises ValueError on unknown values or a broken cursor.
+    """
+    if status:
+        if status not in Document.Status.values:
+            raise ValueError(f"Unknown status: {status}")
+        queryset = queryset.filter(status=status)
+    if variant:
+        if variant not in Document.Variant.values:
+            raise ValueError(f"Unknown variant: {variant}")
+        queryset = queryset.filter(variant=variant)
+    if cursor:
+        queryset = queryset.filter(id__lt=decode_cursor(cursor))
+    return queryset
+
+
+def parse_page_size(value):
+    if value in (None, ''):
+        return LATEST_DOCUMENTS_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def serialize_document(doc, queue_position=None):
+    return {
+        'id': doc.id,
+        'filename': doc.filename() if doc.variant == Document.Variant.DOCUMENT else None,
+        'variant': doc.variant,
+        'title': doc.title,
+        'url': doc.url,
+        'status': doc.status,
+        'status_display': doc.get_status_display(),
+        'stages': {
+            'chunking': doc.chunking_status,
+            'summary': doc.summary_status,
+            'embedding': doc.embedding_status,
+            'title': doc.title_status,
+        },
+        'has_summary': doc.has_summary,
+        # Только для документов в очереди
+        'queue_position': queue_position,
+        'created_at': doc.created_at.isoformat(),
+    }
+
+
+def list_documents(status=None, variant=None, cursor=None, limit=LATEST_DOCUMENTS_LIMIT):
+    """
+    Returns one page of documents: {"documents": [...], "next_cursor": str or None}.
+    """
+    queryset = filter_documents(document_list_queryset(), status, variant, cursor)
+    # Берём на один документ больше, чтобы узнать, есть ли следующая страница
+    documents = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(documents[limit - 1].id) if len(documents) > limit else None
+    documents = documents[:limit]
+    # Позиции всех документов страницы в очереди — одним запросом
+    positions = get_queue_positions([doc.id for doc in documents if doc.status == Document.Status.QUEUED])
+    return {
+        'documents': [serialize_document(doc, positions.get(doc.id)) for doc in documents],
+        'next_cursor': next_cursor,
+    }
+
+
+def get_latest_documents():
+    return list_documents()['documents']
+
+
+def get_listed_document(document_id):
+    return document_list_queryset().filter(id=document_id).first()
@@ -0,0 +1,147 @@
+"""
+Document status events pushed to the upload page.
+
+Celery stages publish the changed document to a fanout exchange on the Celery broker.
+Every web process consumes the exchange through its own exclusive queue in a background
+thread and hands the events to the SSE connections of that process (see app.asgi).
+"""
+import asyncio
+import logging
+import socket
+import threading
+import time
+import uuid
+
+from celery import current_app
+from django.conf import settings
+from kombu import Connection, Exchange, Queue
+from prometheus_client import Counter, Gauge
+
+from app.utils.admission import get_queue_position
+from app.utils.documents import get_listed_document, serialize_document
+
+logger = logging.getLogger(__name__)
+
+document_events_published_counter = Counter(
+    'document_events_published_total', 'Document status events published by the pipeline'
+)
+document_events_dropped_counter = Counter(
+    'document_events_dropped_total', 'Document status events dropped for slow SSE clients'
+)
+document_events_subscribers_gauge = Gauge(
+    'document_events_subscribers', 'Open SSE connections waiting for document status events',
+    multiprocess_mode='livesum',
+)
+
+DOCUMENT_EVENTS_EXCHANGE = Exchange('document_events', type='fanout', durable=False)
+
+# Очередь событий одного SSE клиента; при переполнении новые события отбрасываются
+SUBSCRIBER_QUEUE_SIZE = 100
+RECONNECT_DELAY = 5
+
+
+def publish_document_event(document_id):
+    """
+    Publishes the current state of the document (without the summary, like the listing).
+    Events are best effort: a broker error is logged and doesn't fail the pipeline stage.
+    """
+    if not settings.DOCUMENT_EVENTS_ENABLED:
+        return
+
+    document = get_listed_document(document_id)
+    if document is None:
+        return
+    try:
+        with current_app.producer_or_acquire() as producer:
+            producer.publish(
+                serialize_document(document, get_queue_position(document)),
+                exchange=DOCUMENT_EVENTS_EXCHANGE,
+                routing_key='',
+                declare=[DOCUMENT_EVENTS_EXCHANGE],
+                serializer='json',
+                delivery_mode=1,
+                retry=False,
+            )
+        document_events_published_counter.inc()
+    except Exception:
+        logger.warning("Failed to publish event of document %s", document_id, exc_info=True)
+
+
+class DocumentEventHub:
+    """
+    Fans document events out to the SSE connections of this process.
+
+    The broker is consumed by one daemon thread started with the first subscriber;
+    events are passed to the subscribers' event loops with call_soon_threadsafe.
+    """
+
+    def __init__(self, broker_url):
+        self.broker_url = broker_url
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        """
+        Returns an asyncio.Queue receiving the events; must be called from the event loop.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+            document_events_subscribers_gauge.set(len(self._subscribers))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._consume, name="document-events", daemon=True)
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+            document_events_subscribers_gauge.set(len(self._subscribers))
+
+    def _deliver(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            document_events_dropped_counter.inc()
+
+    def _on_message(self, body, message):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, body)
+
+    def _consume(self):
+        while True:
+            try:
+                with Connection(self.broker_url) as connection:
+                    queue = Queue(
+                        f'document_events.{uuid.uuid4().hex}',
+                        exchange=DOCUMENT_EVENTS_EXCHANGE,
+                        exclusive=True,
+                        auto_delete=True,
+                        durable=False,
+                    )
+                    with connection.Consumer([queue], callbacks=[self._on_message],
+                                             accept=['json'], no_ack=True):
+                        while True:
+                            try:
+                                connection.drain_events(timeout=1)
+                            except socket.timeout:
+                                pass
+            except Exception:
+                logger.warning("Document events consumer disconnected, reconnecting", exc_info=True)
+                time.sleep(RECONNECT_DELAY)
+
+
+_document_event_hub = None
+
+
+def get_document_event_hub():
+    """
+    Returns the process-wide DocumentEventHub consuming the Celery broker.
+    """
+    global _document_event_hub
+    if _document_event_hub is None:
+        _document_event_hub = DocumentEventHub(settings.CELERY_BROKER_URL)
+    return _document_event_hub
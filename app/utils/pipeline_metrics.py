@@ -0,0 +1,102 @@
+"""
+Document pipeline metrics: duration of every processing stage and Celery queue wait time.
+
+Celery workers run several pool processes; with PROMETHEUS_MULTIPROC_DIR set their
+metrics are aggregated and exported by the main worker process (see config/celery.py).
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from celery.signals import before_task_publish, task_prerun
+from prometheus_client import Histogram
+
+pipeline_stage_duration_histogram = Histogram(
+    'pipeline_stage_duration_seconds', 'Duration of document pipeline stages',
+    ['stage', 'variant', 'size_bucket'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+task_queue_wait_histogram = Histogram(
+    'celery_task_queue_wait_seconds', 'Time Celery tasks wait in the broker queue before a worker starts them',
+    ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 300, 900),
+)
+
+# (верхняя граница размера файла, метка)
+SIZE_BUCKETS = (
+    (1024 * 1024, 'lt_1mb'),
+    (10 * 1024 * 1024, '1_10mb'),
+    (100 * 1024 * 1024, '10_100mb'),
+)
+
+PUBLISHED_AT_HEADER = 'published_at'
+
+
+def get_size_bucket(document):
+    # Размер транскрипта YouTube заранее неизвестен
+    if not document.size_bytes:
+        return 'unknown'
+    for limit, name in SIZE_BUCKETS:
+        if document.size_bytes < limit:
+            return name
+    return 'gt_100mb'
+
+
+def observe_stage(document, stage, seconds):
+    pipeline_stage_duration_histogram.labels(
+        stage=stage, variant=document.variant, size_bucket=get_size_bucket(document)
+    ).observe(seconds)
+
+
+class StageTimer:
+    """
+    Accumulates the time of interleaved stages of one document, e.g. the streamed
+    PDF extraction, chunking and chunk writes, and observes the totals per stage.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    @contextmanager
+    def measure(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - started
+
+    def iterate(self, stage, iterable):
+        """
+        Yields from `iterable`, counting the time spent producing each item as `stage`.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.measure(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def observe(self, document):
+        for stage, seconds in self.seconds.items():
+            observe_stage(document, stage, seconds)
+
+
+@before_task_publish.connect
+def add_published_at_header(headers=None, **kwargs):
+    if headers is not None:
+        headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    published_at = getattr(task.request, PUBLISHED_AT_HEADER, None)
+    if published_at is None:
+        return
+    waiting_since = published_at
+    # Задача с countdown (повтор этапа) ждёт намеренно: считаем ожидание с момента eta
+    if task.request.eta:
+        waiting_since = max(waiting_since, datetime.fromisoformat(task.request.eta).timestamp())
+    task_queue_wait_histogram.labels(task=task.name).observe(max(0.0, time.time() - waiting_since))
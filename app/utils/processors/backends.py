@@ -0,0 +1,247 @@
+"""
+LLM and embedding backends.
+
+LLM_BACKEND setting (environment variable) selects the backend:
+- "openai" — ChatOpenAI / OpenAIEmbeddings (default);
+- "fake" — deterministic local models for benchmarks and load tests, no network access.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+
+import numpy as np
+import openai
+from django.conf import settings as django_settings
+from langchain.chat_models import ChatOpenAI
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import OpenAIEmbeddings
+
+from app.utils.db import db_sync_to_async
+from app.utils.processors.clients import get_client_registry, get_openai_settings
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+FAKE_VOCABULARY = (
+    "документ описывает основные идеи выводы результаты анализ данные метод подход "
+    "модель система процесс задача решение пример раздел глава пункт таблица рисунок "
+    "the document describes key findings results method approach model system process"
+).split()
+
+
+def is_fake_backend():
+    return django_settings.LLM_BACKEND == "fake"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model: the answer depends only on the prompt.
+
+    Simulates an API call: waits `latency` seconds before the first token, then produces
+    `answer_tokens` tokens at `tokens_per_second`.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.05
+    tokens_per_second: float = 200.0
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _answer_tokens(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = np.random.default_rng(seed)
+        words = rng.choice(FAKE_VOCABULARY, size=self.answer_tokens)
+        return [f"{word} " for word in words]
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer_tokens(messages)
+        time.sleep(self.latency + len(tokens) * self._token_delay())
+        message = AIMessage(content="".join(tokens).strip())
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer_tokens(messages)
+        await asyncio.sleep(self.latency + len(tokens) * self._token_delay())
+        message = AIMessage(content="".join(tokens).strip())
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self._answer_tokens(messages):
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self._answer_tokens(messages):
+            await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def get_num_tokens(self, text):
+        # ~4 символа на токен, без tiktoken (ему нужна сеть для загрузки словаря)
+        return max(1, len(text) // 4)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hash-based embeddings: words are hashed into a fixed number of dimensions
+    (feature hashing) and the vector is L2-normalized. Deterministic, and texts
+    sharing words get similar vectors, so retrieval still behaves sensibly.
+    """
+
+    def __init__(self, dimensions=256, latency=0.0):
+        self.model = f"fake-embedding-{dimensions}"
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "big")
+            vector[value % self.dimensions] += 1.0 if value & (1 << 63) else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+def create_chat_model(model, temperature=0, max_retries=2, **kwargs):
+    if is_fake_backend():
+        return FakeChatModel(
+            model_name=model,
+            latency=django_settings.FAKE_LLM_LATENCY,
+            tokens_per_second=django_settings.FAKE_LLM_TOKENS_PER_SECOND,
+            answer_tokens=django_settings.FAKE_LLM_ANSWER_TOKENS,
+        )
+    # Клиенты OpenAI создаём сами: ChatOpenAI передал бы sync пул и в AsyncOpenAI
+    registry = get_client_registry()
+    api_key = os.getenv("OPENAI_API_KEY")
+    client = openai.OpenAI(api_key=api_key, max_retries=max_retries, http_client=registry.get_http_client())
+    async_client = openai.AsyncOpenAI(
+        api_key=api_key, max_retries=max_retries, http_client=registry.get_async_http_client()
+    )
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        model=model,
+        temperature=temperature,
+        max_retries=max_retries,
+        client=client.chat.completions,
+        async_client=async_client.chat.completions,
+        **kwargs,
+    )
+
+
+def create_embeddings_model(**kwargs):
+    if is_fake_backend():
+        return FakeEmbeddings(
+            dimensions=django_settings.FAKE_EMBEDDING_DIMENSIONS,
+            latency=django_settings.FAKE_EMBEDDING_LATENCY,
+        )
+    registry = get_client_registry()
+    return OpenAIEmbeddings(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=registry.get_http_client(),
+        http_async_client=registry.get_async_http_client(),
+        **kwargs,
+    )
+
+
+def get_chat_model(model, temperature=0, **kwargs):
+    """
+    Returns the chat model of the configured backend, cached in the process-wide registry.
+    """
+    key = ("chat", model, float(temperature), tuple(sorted(kwargs.items())))
+    return get_client_registry().get(
+        "chat", key, lambda: create_chat_model(model, temperature=temperature, **kwargs)
+    )
+
+
+def get_embeddings_model(**kwargs):
+    """
+    Returns the embeddings model of the configured backend, cached in the process-wide registry.
+    """
+    key = ("embeddings", tuple(sorted(kwargs.items())))
+    return get_client_registry().get("embeddings", key, lambda: create_embeddings_model(**kwargs))
+
+
+def create_default_clients(settings):
+    """
+    Creates the clients the pipeline and the chat use with the given OpenaiSettings.
+    """
+    temperature = float(settings.temperature)
+    # Заголовки и саммари
+    get_chat_model(settings.model, temperature=temperature)
+    get_chat_model(settings.model, temperature=temperature, max_retries=0)
+    # Чат, сжатие истории
+    get_chat_model(settings.model, temperature=0)
+    get_embeddings_model()
+    get_embeddings_model(max_retries=0)
+
+
+def warm_up_clients():
+    """
+    Loads the OpenAI settings and creates the clients before the first task or request
+    of the process. Failures are logged: the clients are then created on first use.
+    """
+    try:
+        settings = get_openai_settings()
+        if settings is not None:
+            create_default_clients(settings)
+    except Exception:
+        logger.warning("Failed to warm up LLM clients", exc_info=True)
+
+
+async def awarm_up_clients():
+    """
+    Async variant of `warm_up_clients` for the event loop serving ASGI requests:
+    clients created inside the loop use its connection pool.
+    """
+    try:
+        settings = await db_sync_to_async(get_openai_settings)()
+        if settings is not None:
+            create_default_clients(settings)
+    except Exception:
+        logger.warning("Failed to warm up LLM clients", exc_info=True)
+
+
+def check_backend_credentials():
+    """
+    Raises ValueError if the configured backend needs an API key that isn't set.
+    """
+    if not is_fake_backend() and not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY not set in environment.")
@@ -0,0 +1,161 @@
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.conf import settings as django_settings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.models import DocumentChunk
+from app.utils.processors.langchain import get_model_context_window
+from app.utils.processors.tokens import get_token_counter
+
+# start_offset/end_offset — позиции в тексте всего документа (страницы подряд)
+ChunkSpan = namedtuple("ChunkSpan", ["text", "page_start", "page_end", "start_offset", "end_offset"])
+
+
+class StreamingChunker:
+    """
+    Splits a stream of pages into chunks with a LangChain text splitter,
+    keeping only a window of text in memory.
+
+    Pages are appended to a buffer; once the buffer reaches `window_size` characters it is
+    split and every chunk except the last one is emitted. Splitting continues from the start
+    of the last chunk, so chunks never end on an artificial window boundary.
+
+    Usage:
+        chunker = StreamingChunker(splitter, window_size=50000)
+        for page_number, text in pages:
+            yield from chunker.feed(page_number, text)
+        yield from chunker.flush()
+    """
+
+    def __init__(self, splitter, window_size):
+        self.splitter = splitter
+        self.window_size = window_size
+        self.buffer = ""
+        self.buffer_offset = 0
+        # (смещение начала страницы, номер страницы) для страниц, попадающих в буфер
+        self.page_offsets = []
+        self.page_numbers = []
+
+    def feed(self, page_number, text):
+        """
+        Adds a page and returns the chunks that are complete.
+        """
+        self.page_offsets.append(self.buffer_offset + len(self.buffer))
+        self.page_numbers.append(page_number)
+        self.buffer += text
+        if len(self.buffer) < self.window_size:
+            return []
+        return self._split(final=False)
+
+    def flush(self):
+        """
+        Returns the remaining chunks at the end of the document.
+        """
+        return self._split(final=True)
+
+    def _page_at(self, offset):
+        index = bisect_right(self.page_offsets, offset) - 1
+        return self.page_numbers[max(index, 0)] if self.page_numbers else None
+
+    def _split(self, final):
+        texts = self.splitter.split_text(self.buffer)
+        if not final:
+            if len(texts) < 2:
+                return []
+            texts, tail = texts[:-1], texts[-1]
+
+        chunks = []
+        search_from = 0
+        for text in texts:
+            start = self.buffer.find(text, search_from)
+            if start == -1:
+                start = search_from
+            end = start + len(text)
+            chunks.append(ChunkSpan(
+                text=text,
+                page_start=self._page_at(self.buffer_offset + start),
+                page_end=self._page_at(self.buffer_offset + max(end - 1, start)),
+                start_offset=self.buffer_offset + start,
+                end_offset=self.buffer_offset + end,
+            ))
+            search_from = start + 1
+
+        if final:
+            cut = len(self.buffer)
+        else:
+            cut = self.buffer.find(tail, search_from)
+            if cut == -1:
+                cut = end
+        self._drop_prefix(cut)
+        return chunks
+
+    def _drop_prefix(self, cut):
+        self.buffer = self.buffer[cut:]
+        self.buffer_offset += cut
+        # Оставляем страницу, на которой начинается буфер, и все последующие
+        first = max(bisect_right(self.page_offsets, self.buffer_offset) - 1, 0)
+        del self.page_offsets[:first]
+        del self.page_numbers[:first]
+
+
+# Окно буфера вмещает несколько чанков: иначе крупный чанк заново режется на каждой странице
+WINDOW_CHUNKS = 3
+CHARS_PER_TOKEN = 4
+
+
+def get_summary_chunk_tokens(model):
+    """
+    Size of summary chunks: the part of the model's context window left after the map
+    prompt and the answer (SUMMARY_RESERVED_TOKENS), capped by SUMMARY_CHUNK_MAX_TOKENS.
+    """
+    available = get_model_context_window(model) - django_settings.SUMMARY_RESERVED_TOKENS
+    return max(
+        django_settings.RETRIEVAL_CHUNK_TOKENS,
+        min(django_settings.SUMMARY_CHUNK_MAX_TOKENS, available),
+    )
+
+
+def create_token_splitter(model, chunk_tokens, overlap_tokens):
+    """
+    Text splitter measuring chunk size and overlap in tokens of the model.
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        length_function=get_token_counter(model),
+    )
+
+
+def create_chunkers(summary_model, embedding_model):
+    """
+    Creates a StreamingChunker per chunk granularity:
+
+    - summary: large chunks for the map step, sized from the summary model's context window,
+      with SUMMARY_CHUNK_OVERLAP_TOKENS (no overlap by default, so no token is sent twice);
+    - retrieval: RETRIEVAL_CHUNK_TOKENS chunks with a small overlap for embeddings and search.
+
+    Returns:
+        dict[str, StreamingChunker]: Chunkers by DocumentChunk.Granularity.
+    """
+    sizes = {
+        DocumentChunk.Granularity.SUMMARY: (
+            summary_model,
+            get_summary_chunk_tokens(summary_model),
+            django_settings.SUMMARY_CHUNK_OVERLAP_TOKENS,
+        ),
+        DocumentChunk.Granularity.RETRIEVAL: (
+            embedding_model,
+            django_settings.RETRIEVAL_CHUNK_TOKENS,
+            django_settings.RETRIEVAL_CHUNK_OVERLAP_TOKENS,
+        ),
+    }
+    return {
+        granularity: StreamingChunker(
+            create_token_splitter(model, chunk_tokens, overlap_tokens),
+            window_size=max(
+                django_settings.CHUNKING_WINDOW_CHARS, chunk_tokens * CHARS_PER_TOKEN * WINDOW_CHUNKS
+            ),
+        )
+        for granularity, (model, chunk_tokens, overlap_tokens) in sizes.items()
+    }
@@ -0,0 +1,169 @@
+"""
+Process-wide registry of the OpenAI settings, HTTP connection pools and LLM/embedding clients.
+
+Building a client and reading `OpenaiSettings` used to happen on every task and request,
+and every new client opened its own connection pool (new TLS handshakes). The registry
+keeps them for the lifetime of the process:
+
+- the settings row is cached for OPENAI_SETTINGS_CACHE_TTL seconds and dropped on admin
+  save (signal in app.signals; other processes pick the change up after the TTL);
+- one keep-alive httpx pool is shared by all sync clients; async clients get a pool per
+  event loop, since connections can't move between loops;
+- clients are cached by their parameters, per event loop when created inside one.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import openai
+from django.conf import settings as django_settings
+from prometheus_client import Counter, Histogram
+
+from app.models import OpenaiSettings
+
+client_setup_histogram = Histogram(
+    'llm_client_setup_seconds', 'Time to load the OpenAI settings or create a client', ['kind'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+client_setup_saved_counter = Counter(
+    'llm_client_setup_saved_seconds_total', 'Setup time saved by reusing cached settings and clients', ['kind']
+)
+
+
+def get_running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class ClientRegistry:
+    """
+    Caches the OpenAI settings and the clients of one process.
+
+    Cached values remember how long they took to create; every reuse adds that time
+    to llm_client_setup_saved_seconds_total.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._settings = None
+        self._settings_expires_at = 0.0
+        self._settings_setup_seconds = 0.0
+        self._clients = {}
+        self._loop_clients = weakref.WeakKeyDictionary()
+
+    def _check_fork(self):
+        # После fork пулы соединений родителя использовать нельзя
+        if self._pid != os.getpid():
+            self._reset()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def get_settings(self):
+        """
+        Returns the OpenaiSettings row, or None if it isn't configured (not cached).
+        """
+        with self._lock:
+            self._check_fork()
+            if self._settings is not None and time.monotonic() < self._settings_expires_at:
+                client_setup_saved_counter.labels(kind="settings").inc(self._settings_setup_seconds)
+                return self._settings
+
+        started = time.perf_counter()
+        settings = OpenaiSettings.objects.first()
+        setup_seconds = time.perf_counter() - started
+        client_setup_histogram.labels(kind="settings").observe(setup_seconds)
+
+        if settings is not None:
+            with self._lock:
+                self._settings = settings
+                self._settings_expires_at = time.monotonic() + django_settings.OPENAI_SETTINGS_CACHE_TTL
+                self._settings_setup_seconds = setup_seconds
+        return settings
+
+    def invalidate_settings(self):
+        with self._lock:
+            self._settings = None
+
+    def get(self, kind, key, factory):
+        """
+        Returns the cached client for `key`, creating it with `factory()` on first use.
+        """
+        loop = get_running_loop()
+        with self._lock:
+            self._check_fork()
+            if loop is None:
+                clients = self._clients
+            else:
+                clients = self._loop_clients.setdefault(loop, {})
+
+            cached = clients.get(key)
+            if cached is not None:
+                client, setup_seconds = cached
+                client_setup_saved_counter.labels(kind=kind).inc(setup_seconds)
+                return client
+
+            started = time.perf_counter()
+            client = factory()
+            setup_seconds = time.perf_counter() - started
+            clients[key] = (client, setup_seconds)
+        client_setup_histogram.labels(kind=kind).observe(setup_seconds)
+        return client
+
+    def get_http_client(self):
+        """
+        Returns the shared keep-alive httpx pool for sync OpenAI clients.
+        """
+        with self._lock:
+            self._check_fork()
+            cached = self._clients.get(("http",))
+            if cached is None:
+                cached = (create_http_client(openai.DefaultHttpxClient), 0.0)
+                self._clients[("http",)] = cached
+            return cached[0]
+
+    def get_async_http_client(self):
+        """
+        Returns the httpx pool of the running event loop, or None outside an event loop
+        (the OpenAI client then creates its own; it is never used in sync code).
+        """
+        if get_running_loop() is None:
+            return None
+        return self.get("http", ("async_http",), lambda: create_http_client(openai.DefaultAsyncHttpxClient))
+
+
+def create_http_client(client_class):
+    return client_class(limits=httpx.Limits(
+        max_connections=django_settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=django_settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    ))
+
+
+_client_registry = None
+
+
+def get_client_registry():
+    """
+    Returns the process-wide ClientRegistry.
+    """
+    global _client_registry
+    if _client_registry is None:
+        _client_registry = ClientRegistry()
+    return _client_registry
+
+
+def get_openai_settings():
+    """
+    Returns the cached OpenaiSettings row, or None if it isn't configured.
+    """
+    return get_client_registry().get_settings()
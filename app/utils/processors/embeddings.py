@@ -0,0 +1,141 @@
+"""
+Batched embedding of document chunks.
+
+Texts are split into batches bounded by EMBEDDING_BATCH_MAX_TOKENS and
+EMBEDDING_BATCH_MAX_TEXTS, up to EMBEDDING_CONCURRENCY batches are sent at a time,
+and rate limits / 5xx responses are retried with jittered backoff. Every text is still
+embedded on its own by the backend, so the vectors don't depend on the batching.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings as django_settings
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.utils.processors.instrumentation import estimate_tokens, record_embedding_call
+from app.utils.retry import call_with_retries
+
+logger = logging.getLogger(__name__)
+
+embeddings_computed_counter = Counter(
+    'embeddings_computed_total', 'Chunk embeddings computed by the embedding backend'
+)
+embedding_batch_retries_counter = Counter(
+    'embedding_batch_retries_total', 'Embedding batch requests retried after a retryable error'
+)
+embedding_batch_histogram = Histogram(
+    'embedding_batch_seconds', 'Duration of one embedding batch request, retries included',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+embedding_throughput_gauge = Gauge(
+    'embedding_throughput_per_second', 'Embeddings per second of the last embedded document',
+    multiprocess_mode='mostrecent',
+)
+
+
+def split_into_batches(texts, max_tokens, max_texts):
+    """
+    Greedily groups consecutive texts into batches of at most `max_texts` texts and
+    `max_tokens` estimated tokens. A text larger than `max_tokens` gets a batch of its own.
+
+    Returns:
+        list[list[str]]
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_texts or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Embeddings wrapper that sends `embed_documents` to the underlying model in
+    token-bounded batches, `concurrency` batches at a time, retrying retryable errors
+    up to `max_retries` times. The order of the vectors matches the order of the texts.
+    """
+
+    def __init__(self, embeddings_model, max_retries, concurrency, max_batch_tokens, max_batch_texts):
+        self.embeddings_model = embeddings_model
+        self.max_retries = max_retries
+        self.concurrency = max(1, concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_texts = max(1, max_batch_texts)
+
+    @property
+    def model(self):
+        return self.embeddings_model.model
+
+    def embed_batch(self, texts):
+        retries = 0
+
+        def on_retry(attempt, error):
+            nonlocal retries
+            retries += 1
+            embedding_batch_retries_counter.inc()
+            logger.warning("Embedding batch of %d texts failed (attempt %d): %s", len(texts), attempt + 1, error)
+
+        started = time.perf_counter()
+        error = None
+        try:
+            with embedding_batch_histogram.time():
+                return call_with_retries(
+                    lambda: self.embeddings_model.embed_documents(texts), self.max_retries, on_retry=on_retry
+                )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            record_embedding_call(
+                self.model, texts, time.perf_counter() - started,
+                error=error, retries=retries, max_retries=self.max_retries,
+            )
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+
+        started = time.perf_counter()
+        batches = split_into_batches(texts, self.max_batch_tokens, self.max_batch_texts)
+        if len(batches) == 1:
+            results = [self.embed_batch(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                results = list(pool.map(self.embed_batch, batches))
+        vectors = [vector for batch_vectors in results for vector in batch_vectors]
+
+        elapsed = time.perf_counter() - started
+        embeddings_computed_counter.inc(len(vectors))
+        if elapsed > 0:
+            embedding_throughput_gauge.set(len(vectors) / elapsed)
+        logger.info(
+            "Embedded %d texts in %d batches in %.2fs (%.1f embeddings/sec)",
+            len(vectors), len(batches), elapsed, len(vectors) / elapsed if elapsed > 0 else 0.0,
+        )
+        return vectors
+
+    def embed_query(self, text):
+        return self.embeddings_model.embed_query(text)
+
+
+def get_embedding_scheduler(embeddings_model, max_retries):
+    """
+    Wraps an embeddings model with the batch scheduler configured in settings.
+    """
+    return EmbeddingScheduler(
+        embeddings_model,
+        max_retries=max_retries,
+        concurrency=django_settings.EMBEDDING_CONCURRENCY,
+        max_batch_tokens=django_settings.EMBEDDING_BATCH_MAX_TOKENS,
+        max_batch_texts=django_settings.EMBEDDING_BATCH_MAX_TEXTS,
+    )
@@ -0,0 +1,40 @@
+import hashlib
+
+from app.utils.processors.youtube import extract_video_id
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def fingerprint_file(file_obj):
+    """
+    Считает SHA-256 файла потоково, блоками по HASH_BLOCK_SIZE,
+    не загружая весь файл в память.
+    """
+    digest = hashlib.sha256()
+    for block in file_obj.chunks(HASH_BLOCK_SIZE):
+        digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def fingerprint_youtube(url):
+    """
+    Отпечаток YouTube видео — его video_id.
+    """
+    return f"youtube:{extract_video_id(url)}"
+
+
+def fingerprint_document(document):
+    """
+    Returns a content fingerprint for the document or None if it can't be computed.
+
+    PDF documents are identified by the SHA-256 of the file, YouTube videos by their video_id,
+    so the same content uploaded twice gets the same fingerprint.
+    """
+    try:
+        if document.file:
+            return fingerprint_file(document.file)
+        if document.url:
+            return fingerprint_youtube(document.url)
+    except (OSError, ValueError):
+        return None
+    return None
@@ -0,0 +1,212 @@
+"""
+Token-budgeted chat history.
+
+Each question reads at most CHAT_HISTORY_MAX_MESSAGES + CHAT_HISTORY_FOLD_BATCH recent
+messages plus one ConversationSummary row, and sends the rolling summary and as many
+of the newest messages as fit into CHAT_HISTORY_TOKEN_BUDGET. Older messages are folded
+into the summary incrementally by the `fold_document_history` Celery task.
+"""
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.utils import timezone
+from langchain.prompts import PromptTemplate
+from prometheus_client import Counter, Histogram
+
+from app.models import ConversationSummary, Log, Message
+from app.utils.cache.answer_cache import normalize_question
+from app.utils.processors.backends import get_chat_model
+from app.utils.processors.clients import get_openai_settings
+from app.utils.processors.instrumentation import llm_callbacks
+
+chat_history_tokens_histogram = Histogram(
+    'chat_history_prompt_tokens', 'Estimated tokens of chat history sent with a question',
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000),
+)
+chat_history_folded_messages_counter = Counter(
+    'chat_history_folded_messages_total', 'Messages folded into rolling conversation summaries'
+)
+
+# Промт для дополнения краткого содержания диалога новыми репликами
+HISTORY_SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template=(
+        "Дополни краткое содержание диалога пользователя и ассистента о документе "
+        "новыми репликами. Сохрани вопросы пользователя, важные факты из ответов и "
+        "договорённости. Не больше 200 слов, язык диалога.\n\n"
+        "Текущее краткое содержание:\n{summary}\n\n"
+        "Новые реплики:\n{new_lines}\n\n"
+        "Новое краткое содержание:"
+    )
+)
+
+# Сколько сообщений сворачивается в краткое содержание одним вызовом LLM
+FOLD_MAX_MESSAGES_PER_CALL = 40
+
+
+def estimate_tokens(text):
+    # ~4 символа на токен: точность не важна, важна ограниченность промта
+    return len(text) // 4 + 1
+
+
+def format_messages(messages):
+    return "\n".join(f"{m['role'].title()}: {m['content']}" for m in messages)
+
+
+def get_conversation_summary(document_id):
+    return ConversationSummary.objects.filter(document_id=document_id).first()
+
+
+def get_chat_history(document_id):
+    """
+    Returns the bounded chat history of the document, oldest first: the rolling summary
+    (role "summary") if there is one, then the newest messages that fit into the token budget.
+    """
+    conversation = get_conversation_summary(document_id)
+    summary = conversation.summary if conversation else ""
+    last_folded_id = conversation.last_message_id if conversation else 0
+
+    budget = django_settings.CHAT_HISTORY_TOKEN_BUDGET
+    if summary:
+        budget -= estimate_tokens(summary)
+
+    # Ещё не свёрнутые сообщения старше окна тоже помещаются, пока их не свернула задача
+    limit = django_settings.CHAT_HISTORY_MAX_MESSAGES + django_settings.CHAT_HISTORY_FOLD_BATCH
+    recent = (
+        Message.objects.filter(document_id=document_id, id__gt=last_folded_id)
+        .order_by("-id")
+        .values("role", "content")[:limit]
+    )
+
+    messages = []
+    for message in recent:
+        tokens = estimate_tokens(message["content"])
+        if tokens > budget:
+            break
+        budget -= tokens
+        messages.append({"role": message["role"], "content": message["content"]})
+    messages.reverse()
+
+    chat_history = [{"role": "summary", "content": summary}] if summary else []
+    chat_history.extend(messages)
+    chat_history_tokens_histogram.observe(django_settings.CHAT_HISTORY_TOKEN_BUDGET - budget)
+    return chat_history
+
+
+def get_history_fingerprint(document_id, question):
+    """
+    Identifies the conversation a question is asked in without loading the history: the id
+    of the newest message, not counting the turns at the end that asked the same question,
+    so asking a question again right away gets the fingerprint of its first ask.
+
+    Returns:
+        str or None: None if nothing was said before the question.
+    """
+    limit = django_settings.CHAT_HISTORY_MAX_MESSAGES + django_settings.CHAT_HISTORY_FOLD_BATCH
+    recent = list(
+        Message.objects.filter(document_id=document_id)
+        .order_by("-id")
+        .values_list("id", "role", "content")[:limit]
+    )
+    normalized = normalize_question(question)
+    index = 0
+    # Реплики сохраняются парами: вопрос, затем ответ
+    while (
+        index + 1 < len(recent)
+        and recent[index][1] == Message.Role.ASSISTANT
+        and recent[index + 1][1] == Message.Role.USER
+        and normalize_question(recent[index + 1][2]) == normalized
+    ):
+        index += 2
+    if index < len(recent):
+        return f"after:{recent[index][0]}"
+    # Всё окно — повторы вопроса: старше могут быть другие сообщения
+    return f"before:{recent[-1][0]}" if len(recent) == limit else None
+
+
+def save_conversation_turn(document_id, question, answer):
+    """
+    Saves the question and the answer and schedules folding of older messages if enough
+    of them have accumulated outside the verbatim window.
+    """
+    Message.objects.bulk_create([
+        Message(document_id=document_id, role=Message.Role.USER, content=question),
+        Message(document_id=document_id, role=Message.Role.ASSISTANT, content=answer),
+    ])
+    if django_settings.CHAT_HISTORY_SUMMARY_ENABLED and needs_folding(document_id):
+        # Импорт здесь: app.tasks импортирует модули processors
+        from app.tasks import fold_document_history
+        transaction.on_commit(lambda: fold_document_history.delay(document_id))
+
+
+def get_fold_boundary(document_id, last_folded_id, keep):
+    """
+    Returns the id of the newest message that is older than the `keep` newest ones
+    and not folded yet, or None.
+    """
+    return (
+        Message.objects.filter(document_id=document_id, id__gt=last_folded_id)
+        .order_by("-id")
+        .values_list("id", flat=True)[keep:keep + 1]
+        .first()
+    )
+
+
+def needs_folding(document_id):
+    conversation = get_conversation_summary(document_id)
+    last_folded_id = conversation.last_message_id if conversation else 0
+    keep = (
+        django_settings.CHAT_HISTORY_MAX_MESSAGES + django_settings.CHAT_HISTORY_FOLD_BATCH - 1
+    )
+    return get_fold_boundary(document_id, last_folded_id, keep) is not None
+
+
+def fold_chat_history(document_id):
+    """
+    Folds messages older than the CHAT_HISTORY_MAX_MESSAGES newest ones into the rolling
+    summary, FOLD_MAX_MESSAGES_PER_CALL messages per LLM call.
+
+    Each step is a conditional UPDATE on last_message_id, so a concurrent fold of the same
+    document stops instead of folding the same messages twice.
+
+    Returns:
+        int: Number of folded messages.
+    """
+    settings = get_openai_settings()
+    if not settings:
+        return 0
+    llm = get_chat_model(settings.model, temperature=0)
+
+    conversation, _ = ConversationSummary.objects.get_or_create(document_id=document_id)
+    boundary = get_fold_boundary(
+        document_id, conversation.last_message_id, django_settings.CHAT_HISTORY_MAX_MESSAGES
+    )
+    folded = 0
+    while boundary is not None and conversation.last_message_id < boundary:
+        batch = list(
+            Message.objects.filter(
+                document_id=document_id,
+                id__gt=conversation.last_message_id,
+                id__lte=boundary,
+            )
+            .order_by("id")
+            .values("id", "role", "content")[:FOLD_MAX_MESSAGES_PER_CALL]
+        )
+        if not batch:
+            break
+
+        summary = llm.invoke(HISTORY_SUMMARY_PROMPT.format(
+            summary=conversation.summary or "(пусто)",
+            new_lines=format_messages(batch),
+        ), config={"callbacks": llm_callbacks(Log.CallType.FOLD)}).content.strip()
+
+        updated = ConversationSummary.objects.filter(
+            pk=conversation.pk, last_message_id=conversation.last_message_id
+        ).update(summary=summary, last_message_id=batch[-1]["id"], updated_at=timezone.now())
+        if not updated:
+            break
+
+        conversation.summary = summary
+        conversation.last_message_id = batch[-1]["id"]
+        folded += len(batch)
+        chat_history_folded_messages_counter.inc(len(batch))
+    return folded
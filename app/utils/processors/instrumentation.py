@@ -0,0 +1,281 @@
+"""
+Instrumentation of LLM and embedding calls.
+
+Every call records its latency, prompt/completion tokens, retries and outcome into
+Prometheus and into the Log table. Chat model calls are observed with a LangChain callback
+handler (`llm_callbacks`), embedding calls are recorded explicitly (`record_embedding_call`).
+
+Log rows are written by a background thread in batches, so a call only puts a dict into
+a bounded in-memory queue; when the queue is full the row is dropped, not waited for.
+Token counts come from the API usage when it is reported (non-streaming OpenAI calls),
+otherwise they are estimated at ~4 characters per token.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings as django_settings
+from django.db import close_old_connections
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter, Histogram
+
+from app.models import Log
+
+logger = logging.getLogger(__name__)
+
+llm_call_duration_histogram = Histogram(
+    'llm_call_duration_seconds', 'Duration of LLM and embedding calls', ['call_type', 'outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+llm_call_tokens_histogram = Histogram(
+    'llm_call_tokens', 'Tokens per LLM and embedding call', ['call_type', 'direction'],
+    buckets=(10, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+llm_log_written_counter = Counter('llm_log_written_total', 'LLM call records written to the Log table')
+llm_log_dropped_counter = Counter(
+    'llm_log_dropped_total', 'LLM call records dropped because the log queue was full or the write failed'
+)
+
+# Сколько символов промпта и ответа сохраняется в Log
+LOG_TEXT_MAX_CHARS = 2000
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def truncate(text):
+    if len(text) <= LOG_TEXT_MAX_CHARS:
+        return text
+    return text[:LOG_TEXT_MAX_CHARS] + "…"
+
+
+class LLMLogWriter:
+    """
+    Writes Log rows in batches of up to `batch_size` from a daemon thread, at least
+    every `flush_interval` seconds while there is something to write.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_queue_size):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Поток писателя не переживает fork: в новом процессе запускаем свой
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            threading.Thread(target=self._run, args=(self._queue,), name="llm-log-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, record):
+        """
+        Queues the keyword arguments of a Log row; never blocks.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            llm_log_dropped_counter.inc()
+
+    def flush(self, timeout=5.0):
+        """
+        Waits until the queued rows are written (for management commands and shutdown).
+        """
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self, records):
+        while True:
+            batch = [records.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(records.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                records.task_done()
+
+    def _write(self, batch):
+        try:
+            Log.objects.bulk_create([Log(**record) for record in batch])
+            llm_log_written_counter.inc(len(batch))
+        except Exception:
+            llm_log_dropped_counter.inc(len(batch))
+            logger.warning("Failed to write %d LLM call records", len(batch), exc_info=True)
+        finally:
+            close_old_connections()
+
+
+_llm_log_writer = None
+
+
+def get_llm_log_writer():
+    """
+    Returns the process-wide LLMLogWriter configured in settings.
+    """
+    global _llm_log_writer
+    if _llm_log_writer is None:
+        _llm_log_writer = LLMLogWriter(
+            batch_size=django_settings.LLM_LOG_BATCH_SIZE,
+            flush_interval=django_settings.LLM_LOG_FLUSH_INTERVAL,
+            max_queue_size=django_settings.LLM_LOG_QUEUE_SIZE,
+        )
+        atexit.register(_llm_log_writer.flush)
+    return _llm_log_writer
+
+
+def record_llm_call(call_type, model, latency, prompt_tokens, completion_tokens, messages, result,
+                    error=None, retries=0, temperature=0, max_retries=0):
+    """
+    Records one call into Prometheus and, if LLM_LOG_ENABLED, into the Log table.
+    """
+    outcome = "error" if error is not None else "success"
+    llm_call_duration_histogram.labels(call_type=call_type, outcome=outcome).observe(latency)
+    llm_call_tokens_histogram.labels(call_type=call_type, direction="prompt").observe(prompt_tokens)
+    if completion_tokens:
+        llm_call_tokens_histogram.labels(call_type=call_type, direction="completion").observe(completion_tokens)
+
+    if not django_settings.LLM_LOG_ENABLED:
+        return
+    get_llm_log_writer().submit({
+        "call_type": call_type,
+        "model": (model or "")[:64],
+        "temperature": Decimal(str(round(float(temperature or 0), 1))),
+        "max_retries": max_retries,
+        "messages": messages,
+        "result": {"error": truncate(repr(error))} if error is not None else result,
+        "is_successful": error is None,
+        "is_retried": retries > 0,
+        "retries": retries,
+        "latency_ms": latency * 1000,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+    })
+
+
+def record_embedding_call(model, texts, latency, error=None, retries=0, max_retries=0):
+    prompt_tokens = sum(estimate_tokens(text) for text in texts)
+    record_llm_call(
+        Log.CallType.EMBED, model, latency, prompt_tokens, 0,
+        messages={"inputs": len(texts)},
+        result={"vectors": len(texts)} if error is None else {},
+        error=error, retries=retries, max_retries=max_retries,
+    )
+
+
+class LLMCallLogger(BaseCallbackHandler):
+    """
+    Records every chat model run it observes as a `call_type` call.
+
+    One handler is created per logical call and reused by its retries: a run started
+    after a failed run of the same handler counts as a retry.
+    """
+
+    # Обработчик только кладёт запись в очередь: вызываем его прямо в event loop
+    run_inline = True
+
+    def __init__(self, call_type, max_retries=0):
+        self.call_type = call_type
+        self.max_retries = max_retries
+        self.attempts = 0
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, prompts, invocation_params, metadata):
+        params = invocation_params or {}
+        metadata = metadata or {}
+        with self._lock:
+            self.attempts += 1
+            self._runs[run_id] = {
+                "started": time.perf_counter(),
+                "prompts": prompts,
+                "model": params.get("model") or params.get("model_name") or metadata.get("ls_model_name") or "",
+                "temperature": params.get("temperature") or metadata.get("ls_temperature") or 0,
+                "retries": self.attempts - 1,
+                "streamed": [],
+            }
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, metadata=None,
+                            **kwargs):
+        prompts = [
+            {"role": message.type, "content": str(message.content)}
+            for batch in messages for message in batch
+        ]
+        self._start(run_id, prompts, invocation_params, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, invocation_params=None, metadata=None, **kwargs):
+        prompts = [{"role": "human", "content": prompt} for prompt in prompts]
+        self._start(run_id, prompts, invocation_params, metadata)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None:
+            run["streamed"].append(token)
+
+    def _finish(self, run_id, text=None, usage=None, error=None):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        usage = usage or {}
+        prompt_text = "\n".join(prompt["content"] for prompt in run["prompts"])
+        text = text if text is not None else "".join(run["streamed"])
+        record_llm_call(
+            self.call_type,
+            run["model"],
+            time.perf_counter() - run["started"],
+            usage.get("prompt_tokens") or estimate_tokens(prompt_text),
+            usage.get("completion_tokens") or (estimate_tokens(text) if text else 0),
+            messages={"messages": [
+                {"role": prompt["role"], "content": truncate(prompt["content"])} for prompt in run["prompts"]
+            ]},
+            result={"text": truncate(text)},
+            error=error,
+            retries=run["retries"],
+            temperature=run["temperature"],
+            max_retries=self.max_retries,
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage")
+        texts = []
+        for generations in response.generations:
+            for generation in generations:
+                texts.append(generation.text)
+                message = getattr(generation, "message", None)
+                if usage is None and getattr(message, "usage_metadata", None):
+                    usage = {
+                        "prompt_tokens": message.usage_metadata.get("input_tokens"),
+                        "completion_tokens": message.usage_metadata.get("output_tokens"),
+                    }
+        self._finish(run_id, text="".join(texts), usage=usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=error)
+
+
+def llm_callbacks(call_type, max_retries=0):
+    """
+    Callbacks to pass to a chat model or chain call: `llm.invoke(prompt, config={"callbacks": ...})`.
+    """
+    return [LLMCallLogger(call_type, max_retries)]
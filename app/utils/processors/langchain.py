@@ -1,17 +1,42 @@
-import os
+import asyncio
+import shutil
+import time
+from collections import namedtuple
+from functools import partial
 from pathlib import Path
-from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
-from langchain.chains.summarize import load_summarize_chain
 from langchain.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain.chains import ConversationalRetrievalChain, LLMChain
-
-from app.models import OpenaiSettings, Message
-
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-FAISS_DIR = BASE_DIR / "faiss_indices"
-FAISS_DIR.mkdir(parents=True, exist_ok=True)
+from langchain.chains import LLMChain
+from django.conf import settings as django_settings
+from prometheus_client import Histogram
+
+from app.models import Log
+from app.utils.cache.answer_cache import AnswerCache, \
+                                      invalidate_answer_cache, \
+                                      is_answer_cache_enabled
+from app.utils.cache.embedding_cache import with_embedding_cache
+from app.utils.cache.vectorstore_cache import get_vectorstore_cache
+from app.utils.db import db_sync_to_async
+from app.utils.processors.embeddings import get_embedding_scheduler
+from app.utils.processors.clients import get_openai_settings
+from app.utils.processors.history import get_chat_history, get_history_fingerprint, save_conversation_turn
+from app.utils.processors.instrumentation import llm_callbacks, record_embedding_call
+from app.utils.processors.retrieval import fuse_results, \
+                                          get_vector_candidate_count, \
+                                          lexical_candidates, \
+                                          lexical_fast_path, \
+                                          retrievals_counter
+from app.utils.processors.backends import get_chat_model, \
+                                         get_embeddings_model, \
+                                         check_backend_credentials
+
+time_to_first_token_histogram = Histogram(
+    'rag_time_to_first_token_seconds', 'Time from question to the first streamed answer token',
+    buckets=(0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 21),
+)
+
+def get_faiss_index_path(document_id):
+    return Path(django_settings.FAISS_INDEX_DIR) / f"faiss_index_doc_{document_id}"
 
 
 def get_title_generation_chain():
@@ -20,7 +45,7 @@ def get_title_generation_chain():
 
     Функция:
     - Получает настройки OpenAI из базы (модель, температуру).
-    - Инициализирует ChatOpenAI с этими настройками.
+    - Инициализирует чат-модель выбранного бэкенда (ChatOpenAI или локальную) с этими настройками.
     - Формирует промпт, который принимает summary и просит сгенерировать короткий заголовок.
     - Возвращает готовую цепочку LLMChain, готовую к вызову.
 
@@ -30,15 +55,11 @@ def get_title_generation_chain():
         ValueError — если настройки OpenAI не найдены.
     """
 
-    settings = OpenaiSettings.objects.first()
+    settings = get_openai_settings()
     if not settings:
         raise ValueError("OpenAI settings not found")
 
-    llm = ChatOpenAI(
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        model=settings.model,
-        temperature=float(settings.temperature),
-    )
+    llm = get_chat_model(settings.model, temperature=float(settings.temperature))
 
     prompt = PromptTemplate(
         input_variables=["summary_text"],
@@ -54,138 +75,700 @@ def get_title_generation_chain():
     return chain
 
 
-def get_summary_chain():
+# Промт для суммирования отдельных частей документа
+SUMMARY_MAP_PROMPT = PromptTemplate(
+    input_variables=["text"],
+    template=(
+        "Прочитай следующий фрагмент документа и напиши краткое резюме его основной идеи.\n\n"
+        "Фрагмент:\n{text}\n\n"
+        "Резюме:"
+    )
+)
+
+# Промт для объединения всех частичных резюме в итоговое
+SUMMARY_COMBINE_PROMPT = PromptTemplate(
+    input_variables=["text"],
+    template=(
+        "Тебе дана серия резюме различных частей длинного документа.\n"
+        "Используя эти резюме, напиши связное и краткое итоговое резюме всего документа.\n\n"
+        "Резюме частей:\n{text}\n\n"
+        "Итоговое резюме:"
+    )
+)
+
+def get_combine_prompt(settings):
+    """
+    Returns the reduce step prompt: `OpenaiSettings.summary_prompt` if
+    SUMMARY_CUSTOM_PROMPT_ENABLED is on and the prompt is set and uses exactly
+    the {text} variable, otherwise SUMMARY_COMBINE_PROMPT.
+    """
+    if django_settings.SUMMARY_CUSTOM_PROMPT_ENABLED and settings and settings.summary_prompt:
+        try:
+            prompt = PromptTemplate.from_template(settings.summary_prompt)
+        except ValueError:
+            return SUMMARY_COMBINE_PROMPT
+        if prompt.input_variables == ["text"]:
+            return prompt
+    return SUMMARY_COMBINE_PROMPT
+
+
+# Размер контекстного окна (в токенах) известных моделей
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+
+def get_model_context_window(model):
     """
-    Creates a LangChain summarization chain using custom prompts from the database.
+    Returns the context window of the model, matching versioned names by prefix
+    (e.g. "gpt-4o-2024-08-06" -> "gpt-4o").
+    """
+    for name in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model == name or model.startswith(f"{name}-"):
+            return MODEL_CONTEXT_WINDOWS[name]
+    return DEFAULT_CONTEXT_WINDOW
 
-    This function:
-    - Loads the OpenAI model and prompt settings from the `OpenaiSettings` model.
-    - Initializes a ChatOpenAI instance with the specified model and temperature.
-    - Defines two custom prompts: one for summarizing individual chunks (map step),
-      and another for combining the partial summaries into a final one (reduce step).
-    - Returns a ready-to-use LangChain summarization chain using the "map_reduce" method.
+
+def get_summary_llm():
+    """
+    Creates the chat model used for summarization from the database settings.
+
+    Retries are done by the summarization engine according to `OpenaiSettings.max_retries`,
+    so the client's own retries are disabled.
 
     Returns:
-        A LangChain summarize chain object configured for multi-step summarization.
+        (llm, settings)
     Raises:
         ValueError: If OpenAI settings are not found in the database.
     """
 
     # Get OpenAI API configuration from the database
-    settings = OpenaiSettings.objects.first()
+    settings = get_openai_settings()
     if not settings:
         raise ValueError("OpenAI settings not found")
 
-    # Initialize the ChatOpenAI model with your API key and settings
-    llm = ChatOpenAI(
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        model=settings.model,
-        temperature=float(settings.temperature),
+    # Initialize the chat model of the configured backend (OpenAI or fake)
+    llm = get_chat_model(settings.model, temperature=float(settings.temperature), max_retries=0)
+    return llm, settings
+
+
+def create_embeddings_and_store(document, chunk_objs):
+    texts = [chunk.text for chunk in chunk_objs]
+    # Страницы сохраняем в docstore, чтобы ответы могли ссылаться на них
+    metadatas = [
+        {"page_start": chunk.page_start, "page_end": chunk.page_end}
+        for chunk in chunk_objs
+    ]
+    # Повторы делает планировщик батчей по `OpenaiSettings.max_retries`, у клиента они отключены
+    settings = get_openai_settings()
+    scheduler = get_embedding_scheduler(
+        get_embeddings_model(max_retries=0), settings.max_retries if settings else 0
     )
+    # Эмбеддинги уже встречавшихся чанков берутся из кэша на диске,
+    # в батчи попадают только промахи кэша
+    embeddings_model = with_embedding_cache(scheduler)
+    vectorstore = FAISS.from_texts(texts, embeddings_model, metadatas=metadatas)
 
-    # Промт для суммирования отдельных частей документа
-    map_prompt = PromptTemplate(
-        input_variables=["text"],
-        template=(
-            "Прочитай следующий фрагмент документа и напиши краткое резюме его основной идеи.\n\n"
-            "Фрагмент:\n{text}\n\n"
-            "Резюме:"
-        )
+    faiss_index_path = get_faiss_index_path(document.id)
+    vectorstore.save_local(str(faiss_index_path))
+    get_vectorstore_cache().invalidate(document.id)
+    invalidate_answer_cache(document.id)
+
+
+def copy_embeddings_store(source_document, document):
+    """
+    Copies the FAISS index of an already processed document to a new document
+    so identical content doesn't have to be embedded again.
+
+    Returns:
+        True if the index was copied, False if the source index doesn't exist.
+    """
+    source_path = get_faiss_index_path(source_document.id)
+    if not source_path.exists():
+        return False
+
+    faiss_index_path = get_faiss_index_path(document.id)
+    shutil.copytree(source_path, faiss_index_path, dirs_exist_ok=True)
+    get_vectorstore_cache().invalidate(document.id)
+    invalidate_answer_cache(document.id)
+    return True
+
+
+def load_vectorstore(document_id, embeddings_model):
+    """
+    Loads the FAISS vector store of a document through the in-process LRU cache.
+
+    The cache entry is keyed by the mtimes of the index files, so an index rebuilt
+    by `process_document` in another process is picked up on the next question.
+    """
+    faiss_index_path = get_faiss_index_path(document_id)
+    if not faiss_index_path.exists():
+        raise FileNotFoundError(f"FAISS index not found at {faiss_index_path}")
+
+    version = tuple(
+        (faiss_index_path / name).stat().st_mtime_ns for name in ("index.faiss", "index.pkl")
     )
 
-    # Промт для объединения всех частичных резюме в итоговое
-    combine_prompt = PromptTemplate(
-        input_variables=["text"],
-        template=(
-            "Тебе дана серия резюме различных частей длинного документа.\n"
-            "Используя эти резюме, напиши связное и краткое итоговое резюме всего документа.\n\n"
-            "Резюме частей:\n{text}\n\n"
-            "Итоговое резюме:"
-        )
+    return get_vectorstore_cache().get(
+        document_id,
+        version,
+        lambda: FAISS.load_local(
+            str(faiss_index_path),
+            embeddings_model,
+            allow_dangerous_deserialization=True  # only use this if you trust the data
+        ),
     )
 
-    # Create a summarize chain using the map-reduce strategy
-    chain = load_summarize_chain(
-        llm,
-        chain_type="map_reduce",
-        map_prompt=map_prompt,
-        combine_prompt=combine_prompt,
+
+# Промт для переформулировки вопроса с учётом истории в самостоятельный вопрос
+CONDENSE_QUESTION_PROMPT = PromptTemplate(
+    input_variables=["chat_history", "question"],
+    template=(
+        "Учитывая историю диалога и последующий вопрос, переформулируй последующий вопрос "
+        "так, чтобы он был понятен без истории. Сохрани язык вопроса.\n\n"
+        "История диалога:\n{chat_history}\n\n"
+        "Последующий вопрос: {question}\n"
+        "Самостоятельный вопрос:"
+    )
+)
+
+# Промт для ответа на вопрос по найденным фрагментам документа
+QA_PROMPT = PromptTemplate(
+    input_variables=["context", "chat_history", "question"],
+    template=(
+        "Используй следующие фрагменты документа, чтобы ответить на вопрос пользователя. "
+        "Если ответа нет во фрагментах, так и скажи, не придумывай. "
+        "Если у фрагмента указаны страницы, сошлись на них в ответе.\n\n"
+        "Фрагменты:\n{context}\n\n"
+        "История диалога:\n{chat_history}\n\n"
+        "Вопрос: {question}\n"
+        "Ответ:"
     )
+)
 
-    return chain
+RAG_TOP_K = 4
 
 
-def create_embeddings_and_store(document, chunk_objs):
-    texts = [chunk.text for chunk in chunk_objs]
-    embeddings_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-    vectorstore = FAISS.from_texts(texts, embeddings_model)
+def format_chat_history(chat_history):
+    if not chat_history:
+        return "(пусто)"
+    lines = []
+    for m in chat_history:
+        if m["role"] == "summary":
+            lines.append(f"Краткое содержание предыдущего диалога: {m['content']}")
+        else:
+            lines.append(f"{m['role'].title()}: {m['content']}")
+    return "\n".join(lines)
 
-    faiss_index_path = FAISS_DIR / f"faiss_index_doc_{document.id}"
-    vectorstore.save_local(str(faiss_index_path))
 
+def should_condense_question(chat_history):
+    """
+    Decides whether the question has to be rewritten with the history before retrieval.
 
-def answer_question_with_rag_and_history(document_id, question):
+    RAG_CONDENSE_QUESTION setting:
+    - "auto" — only when there is a conversation history (default);
+    - "always" — on every question;
+    - "never" — retrieval uses the question as is, history only goes to the answer prompt.
+    """
+    mode = django_settings.RAG_CONDENSE_QUESTION
+    if mode == "never":
+        return False
+    if mode == "always":
+        return True
+    return bool(chat_history)
+
+
+def llm_call_config(call_type):
+    return {"callbacks": llm_callbacks(call_type)}
+
+
+def get_model_name(embeddings_model):
+    return getattr(embeddings_model, "model", "") or ""
+
+
+def retrieve_documents(document_id, vectorstore, embeddings_model, query, timings, k=RAG_TOP_K,
+                       query_embedding=None):
+    """
+    Retrieves the chunks for the query (see app.utils.processors.retrieval):
+
+    - a keyword-like query (quoted phrase or identifier) whose terms some chunks contain
+      all together is answered from the BM25 search alone, without an embedding call;
+    - otherwise the query is embedded exactly once (unless `query_embedding` is already known),
+      FAISS is searched once and its ranking is fused with the BM25 one.
+
+    Stage durations (in ms) are written into `timings` under "lexical_search", "embed" and "search".
+
+    Returns:
+        (docs, path) — path is "lexical", "hybrid" or "vector".
+    """
+    lexical_docs = lexical_fast_path(document_id, query, k, timings, query_embedding)
+    if lexical_docs:
+        retrievals_counter.labels(path="lexical").inc()
+        return lexical_docs, "lexical"
+
+    lexical_docs = lexical_candidates(document_id, query, timings)
+
+    started = time.perf_counter()
+    if query_embedding is None:
+        query_embedding = embeddings_model.embed_query(query)
+        record_embedding_call(get_model_name(embeddings_model), [query], time.perf_counter() - started)
+    timings["embed"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    docs = vectorstore.similarity_search_by_vector(query_embedding, k=get_vector_candidate_count(k, lexical_docs))
+    timings["search"] = (time.perf_counter() - started) * 1000
+
+    docs, path = fuse_results(docs, lexical_docs, k)
+    retrievals_counter.labels(path=path).inc()
+    return docs, path
+
+
+def get_rag_settings():
+    """
+    Returns the OpenAI settings for the chat or raises ValueError if they are not configured.
+    """
     # Get the OpenAI API key and LangChain settings from the environment/database
-    api_key = os.getenv("OPENAI_API_KEY")
-    settings = OpenaiSettings.objects.first()
+    settings = get_openai_settings()
 
     if not settings:
         raise ValueError("OpenAI settings not found")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not set in environment.")
+    check_backend_credentials()
+    return settings
 
-    # --- Step 1: Load the FAISS vector store for this document ---
-    embeddings_model = OpenAIEmbeddings(openai_api_key=api_key)
-    faiss_index_path = FAISS_DIR / f"faiss_index_doc_{document_id}"
-    if not faiss_index_path.exists():
-        raise FileNotFoundError(f"FAISS index not found at {faiss_index_path}")
 
-    # Load previously stored vector index from disk
-    vectorstore = FAISS.load_local(
-        str(faiss_index_path),
-        embeddings_model,
-        allow_dangerous_deserialization=True  # only use this if you trust the data
-    )
+def build_rag_models(settings):
+    llm = get_chat_model(settings.model, temperature=0)
+    embeddings_model = get_embeddings_model()
+    return llm, embeddings_model
+
 
-    # --- Step 2: Perform similarity search with the current question ---
-    # Find top-k most relevant text chunks using semantic similarity
-    similar_docs = vectorstore.similarity_search(question, k=4)
+def format_pages(metadata):
+    page_start = metadata.get("page_start")
+    page_end = metadata.get("page_end")
+    if page_start is None:
+        return None
+    if page_end is None or page_end == page_start:
+        return f"стр. {page_start}"
+    return f"стр. {page_start}–{page_end}"
 
-    # --- Step 3: Retrieve conversation history related to this document ---
-    # Fetch all past user and assistant messages, sorted chronologically
-    past_messages = Message.objects.filter(document_id=document_id).order_by("created_at")
-    chat_history = [
-        {"role": m.role, "content": m.content}
-        for m in past_messages
+
+def format_context(similar_docs):
+    """
+    Joins retrieved chunks for the answer prompt, prefixing each with its pages if known.
+    """
+    parts = []
+    for doc in similar_docs:
+        pages = format_pages(doc.metadata)
+        parts.append(f"[{pages}]\n{doc.page_content}" if pages else doc.page_content)
+    return "\n\n".join(parts)
+
+
+def get_sources(similar_docs):
+    return [
+        {"page_start": doc.metadata.get("page_start"), "page_end": doc.metadata.get("page_end")}
+        for doc in similar_docs
+        if doc.metadata.get("page_start") is not None
     ]
 
-    # Temporarily add the current question to the end of the chat history
-    chat_history.append({"role": "user", "content": question})
 
-    # --- Step 4: Initialize the language model and create a conversational RAG chain ---
-    llm = ChatOpenAI(
-        temperature=0,
-        model=settings.model,
-        openai_api_key=api_key
+def build_answer_prompt(similar_docs, chat_history, question):
+    return QA_PROMPT.format(
+        context=format_context(similar_docs),
+        chat_history=format_chat_history(chat_history),
+        question=question,
+    )
+
+
+def get_answer_cache(document_id):
+    """
+    Returns the answer cache of the document, or None if the cache is disabled.
+    The embeddings model is only needed for near-duplicate matches.
+    """
+    if not is_answer_cache_enabled():
+        return None
+    embeddings_model = None
+    if django_settings.ANSWER_CACHE_SIMILARITY_THRESHOLD > 0:
+        embeddings_model = get_embeddings_model()
+    return AnswerCache(document_id, embeddings_model)
+
+
+# Вопрос после переформулировки и всё, что для него уже загружено
+RagQuery = namedtuple("RagQuery", ["llm", "embeddings_model", "chat_history", "query", "condensed"])
+
+
+def get_known_query_embedding(answer_cache, query):
+    # Эмбеддинг, посчитанный кэшем ответов, годится для поиска, только если это эмбеддинг запроса
+    if answer_cache is None or answer_cache.embedded_question != query:
+        return None
+    return answer_cache.question_embedding
+
+
+def find_cached_answer(answer_cache, cache_key, timings):
+    """
+    Looks `cache_key` — (question, history fingerprint or None) — up in the answer cache.
+    The duration (in ms) is added to `timings` under "cache_lookup".
+    """
+    if answer_cache is None:
+        return None
+    started = time.perf_counter()
+    entry = answer_cache.get(*cache_key)
+    timings["cache_lookup"] = timings.get("cache_lookup", 0.0) + (time.perf_counter() - started) * 1000
+    return entry
+
+
+async def afind_cached_answer(answer_cache, cache_key, timings):
+    """
+    Async variant of `find_cached_answer`: the question is embedded with the async client
+    before the ORM lookups, so no ORM thread waits for the embeddings API.
+    """
+    if answer_cache is None:
+        return None
+    started = time.perf_counter()
+    entry = await db_sync_to_async(answer_cache.get_exact)(*cache_key)
+    if entry is None and answer_cache.can_match_similar(cache_key[1]):
+        question_embedding = await answer_cache.aembed_question(cache_key[0])
+        entry = await db_sync_to_async(answer_cache.get_similar)(question_embedding)
+    timings["cache_lookup"] = timings.get("cache_lookup", 0.0) + (time.perf_counter() - started) * 1000
+    return entry
+
+
+def condense_question(llm, chat_history, question):
+    return llm.invoke(CONDENSE_QUESTION_PROMPT.format(
+        chat_history=format_chat_history(chat_history),
+        question=question,
+    ), config=llm_call_config(Log.CallType.CONDENSE)).content.strip() or question
+
+
+async def acondense_question(llm, chat_history, question):
+    response = await llm.ainvoke(CONDENSE_QUESTION_PROMPT.format(
+        chat_history=format_chat_history(chat_history),
+        question=question,
+    ), config=llm_call_config(Log.CallType.CONDENSE))
+    return response.content.strip() or question
+
+
+def prepare_rag_query(document_id, question, timings, answer_cache=None):
+    """
+    Loads settings and the history and condenses the question if needed, looking the
+    answer cache up on the way:
+
+    1. by the question itself in the current conversation (see `get_history_fingerprint`),
+       before the history is loaded or condensed, so a repeat costs no LLM call;
+    2. by the standalone (condensed) question, which also matches the question asked
+       in another conversation.
+
+    Stage durations (in ms) are written into `timings`.
+
+    Returns:
+        (RagQuery or None, cache_keys, entry) — the cached entry or None on a miss;
+        the answer has to be stored under all `cache_keys`.
+    """
+    settings = get_rag_settings()
+    llm, embeddings_model = build_rag_models(settings)
+    timings["condense"] = 0.0
+
+    cache_keys = [(question, get_history_fingerprint(document_id, question) if answer_cache else None)]
+    entry = find_cached_answer(answer_cache, cache_keys[0], timings)
+    if entry is not None:
+        return None, cache_keys, entry
+
+    # --- Step 1: Retrieve the bounded conversation history (rolling summary + last messages) ---
+    chat_history = get_chat_history(document_id)
+
+    # --- Step 2: Rewrite the question into a standalone one (only if needed) ---
+    query = question
+    condensed = should_condense_question(chat_history)
+    if condensed:
+        started = time.perf_counter()
+        query = condense_question(llm, chat_history, question)
+        timings["condense"] = (time.perf_counter() - started) * 1000
+        if chat_history:
+            cache_keys.append((query, None))
+            entry = find_cached_answer(answer_cache, cache_keys[-1], timings)
+
+    if answer_cache is not None and entry is None:
+        answer_cache.record_miss()
+    return RagQuery(llm, embeddings_model, chat_history, query, condensed), cache_keys, entry
+
+
+async def aprepare_rag_query(document_id, question, timings, answer_cache=None):
+    """
+    Async variant of `prepare_rag_query`.
+    """
+    settings = await db_sync_to_async(get_rag_settings)()
+    llm, embeddings_model = build_rag_models(settings)
+    timings["condense"] = 0.0
+
+    fingerprint = await db_sync_to_async(get_history_fingerprint)(document_id, question) if answer_cache else None
+    cache_keys = [(question, fingerprint)]
+    entry = await afind_cached_answer(answer_cache, cache_keys[0], timings)
+    if entry is not None:
+        return None, cache_keys, entry
+
+    chat_history = await db_sync_to_async(get_chat_history)(document_id)
+
+    query = question
+    condensed = should_condense_question(chat_history)
+    if condensed:
+        started = time.perf_counter()
+        query = await acondense_question(llm, chat_history, question)
+        timings["condense"] = (time.perf_counter() - started) * 1000
+        if chat_history:
+            cache_keys.append((query, None))
+            entry = await afind_cached_answer(answer_cache, cache_keys[-1], timings)
+
+    if answer_cache is not None and entry is None:
+        answer_cache.record_miss()
+    return RagQuery(llm, embeddings_model, chat_history, query, condensed), cache_keys, entry
+
+
+def prepare_rag_prompt(document_id, question, rag_query, timings, answer_cache=None):
+    """
+    Runs everything between the answer cache lookup and answer generation: loads the FAISS
+    index and retrieves the relevant chunks for the (condensed) query.
+
+    Stage durations (in ms) are written into `timings`. The question embedding computed
+    by `answer_cache` during the lookup is reused for retrieval.
+
+    Returns:
+        (llm, prompt, metadata) — the chat model, the final answer prompt and request metadata.
+    """
+    # --- Step 3: Load the FAISS vector store for this document ---
+    # Loaded from disk once per process, then served from the LRU cache
+    started = time.perf_counter()
+    vectorstore = load_vectorstore(document_id, rag_query.embeddings_model)
+    timings["load_index"] = (time.perf_counter() - started) * 1000
+
+    # --- Step 4: BM25 search + at most one embedding and one similarity search ---
+    similar_docs, retrieval = retrieve_documents(
+        document_id, vectorstore, rag_query.embeddings_model, rag_query.query, timings,
+        query_embedding=get_known_query_embedding(answer_cache, rag_query.query),
+    )
+
+    prompt = build_answer_prompt(similar_docs, rag_query.chat_history, question)
+    return rag_query.llm, prompt, {
+        "query": rag_query.query, "condensed": rag_query.condensed, "cached": False, "retrieval": retrieval,
+        "sources": get_sources(similar_docs),
+    }
+
+
+async def aprepare_rag_prompt(document_id, question, rag_query, timings, answer_cache=None):
+    """
+    Async variant of `prepare_rag_prompt`: embedding calls use the async OpenAI client,
+    ORM access goes through db_sync_to_async, FAISS work runs in a thread executor.
+    """
+    loop = asyncio.get_running_loop()
+    query, embeddings_model = rag_query.query, rag_query.embeddings_model
+
+    started = time.perf_counter()
+    vectorstore = await loop.run_in_executor(None, load_vectorstore, document_id, embeddings_model)
+    timings["load_index"] = (time.perf_counter() - started) * 1000
+
+    query_embedding = get_known_query_embedding(answer_cache, query)
+    similar_docs = await db_sync_to_async(lexical_fast_path)(document_id, query, RAG_TOP_K, timings, query_embedding)
+    if similar_docs:
+        retrieval = "lexical"
+        retrievals_counter.labels(path=retrieval).inc()
+    else:
+        lexical_docs = await db_sync_to_async(lexical_candidates)(document_id, query, timings)
+        started = time.perf_counter()
+        if query_embedding is None:
+            query_embedding = await embeddings_model.aembed_query(query)
+            record_embedding_call(get_model_name(embeddings_model), [query], time.perf_counter() - started)
+        timings["embed"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        similar_docs = await loop.run_in_executor(None, partial(
+            vectorstore.similarity_search_by_vector, query_embedding,
+            k=get_vector_candidate_count(RAG_TOP_K, lexical_docs),
+        ))
+        timings["search"] = (time.perf_counter() - started) * 1000
+
+        similar_docs, retrieval = fuse_results(similar_docs, lexical_docs, RAG_TOP_K)
+        retrievals_counter.labels(path=retrieval).inc()
+
+    prompt = build_answer_prompt(similar_docs, rag_query.chat_history, question)
+    return rag_query.llm, prompt, {
+        "query": query, "condensed": rag_query.condensed, "cached": False, "retrieval": retrieval,
+        "sources": get_sources(similar_docs),
+    }
+
+
+def format_timings(timings):
+    return {stage: round(value, 2) for stage, value in timings.items()}
+
+
+def get_cached_answer(entry, document_id, question, timings, total_started):
+    """
+    Returns the response to a repeated question from the answer cache entry, or None on a miss.
+    The question and the cached answer are still saved to the conversation.
+    """
+    if entry is None:
+        return None
+
+    save_conversation_turn(document_id, question, entry.answer)
+    timings["total"] = (time.perf_counter() - total_started) * 1000
+    metadata = dict(entry.metadata, cached=True, timings_ms=format_timings(timings))
+    return {"answer": entry.answer, "metadata": metadata}
+
+
+def save_answer(answer_cache, cache_keys, document_id, question, answer, metadata):
+    save_conversation_turn(document_id, question, answer)
+    if answer_cache is not None and answer:
+        for key_question, context in cache_keys:
+            answer_cache.set(key_question, answer, metadata, context)
+
+
+def answer_question_with_rag_and_history(document_id, question):
+    """
+    Answers a question about the document using retrieval over its FAISS index
+    and the conversation history.
+
+    Repeated questions are answered from the answer cache, looked up before and after the
+    question is condensed with the history (see `prepare_rag_query`). Otherwise each question costs
+    at most one condense LLM call, one BM25 search, one query embedding, one FAISS search
+    and one answer LLM call; keyword-like questions found by BM25 need no embedding.
+
+    Returns:
+        dict with "answer" and "metadata" (per-stage latency breakdown in ms).
+    """
+    timings = {}
+    total_started = time.perf_counter()
+    answer_cache = get_answer_cache(document_id)
+    rag_query, cache_keys, entry = prepare_rag_query(document_id, question, timings, answer_cache)
+    cached = get_cached_answer(entry, document_id, question, timings, total_started)
+    if cached is not None:
+        return cached
+
+    llm, prompt, metadata = prepare_rag_prompt(
+        document_id, question, rag_query, timings, answer_cache
     )
 
-    # Use ConversationalRetrievalChain to handle context-aware Q&A
-    chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 4}),
-        return_source_documents=False  # Set to True if you want to return docs for debugging or traceability
+    # --- Step 5: Generate the answer from the retrieved chunks ---
+    started = time.perf_counter()
+    answer = llm.invoke(prompt, config=llm_call_config(Log.CallType.ANSWER)).content
+    timings["generate"] = (time.perf_counter() - started) * 1000
+
+    # --- Step 6: Persist the question and generated answer to the database and the cache ---
+    save_answer(answer_cache, cache_keys, document_id, question, answer, metadata)
+
+    timings["total"] = (time.perf_counter() - total_started) * 1000
+    metadata["timings_ms"] = format_timings(timings)
+    return {"answer": answer, "metadata": metadata}
+
+
+def stream_answer_with_rag_and_history(document_id, question):
+    """
+    Streaming variant of `answer_question_with_rag_and_history`.
+
+    Generator that yields ("token", text) as the model produces the answer and
+    ("done", {"answer": ..., "metadata": ...}) once the answer is complete and
+    the messages are saved. A cached answer is yielded as a single token.
+    """
+    timings = {}
+    total_started = time.perf_counter()
+    answer_cache = get_answer_cache(document_id)
+    rag_query, cache_keys, entry = prepare_rag_query(document_id, question, timings, answer_cache)
+    cached = get_cached_answer(entry, document_id, question, timings, total_started)
+    if cached is not None:
+        yield "token", cached["answer"]
+        yield "done", cached
+        return
+
+    llm, prompt, metadata = prepare_rag_prompt(
+        document_id, question, rag_query, timings, answer_cache
+    )
+
+    started = time.perf_counter()
+    parts = []
+    for chunk in llm.stream(prompt, config=llm_call_config(Log.CallType.ANSWER)):
+        if not chunk.content:
+            continue
+        if not parts:
+            first_token_at = time.perf_counter()
+            timings["first_token"] = (first_token_at - total_started) * 1000
+            time_to_first_token_histogram.observe(first_token_at - total_started)
+        parts.append(chunk.content)
+        yield "token", chunk.content
+    timings["generate"] = (time.perf_counter() - started) * 1000
+
+    answer = "".join(parts)
+    save_answer(answer_cache, cache_keys, document_id, question, answer, metadata)
+
+    timings["total"] = (time.perf_counter() - total_started) * 1000
+    metadata["timings_ms"] = format_timings(timings)
+    yield "done", {"answer": answer, "metadata": metadata}
+
+
+async def aanswer_question_with_rag_and_history(document_id, question):
+    """
+    Async variant of `answer_question_with_rag_and_history` for the ASGI server:
+    the request doesn't hold a thread while waiting for OpenAI.
+    """
+    timings = {}
+    total_started = time.perf_counter()
+    answer_cache = get_answer_cache(document_id)
+    rag_query, cache_keys, entry = await aprepare_rag_query(document_id, question, timings, answer_cache)
+    cached = await db_sync_to_async(get_cached_answer)(entry, document_id, question, timings, total_started)
+    if cached is not None:
+        return cached
+
+    llm, prompt, metadata = await aprepare_rag_prompt(
+        document_id, question, rag_query, timings, answer_cache
     )
 
-    # Run the chain: it reformulates the question using history and retrieves relevant docs
-    result = chain({
-        "question": question,
-        "chat_history": [(m["role"], m["content"]) for m in chat_history[:-1]]  # history without the last question
-    })
+    started = time.perf_counter()
+    answer = (await llm.ainvoke(prompt, config=llm_call_config(Log.CallType.ANSWER))).content
+    timings["generate"] = (time.perf_counter() - started) * 1000
+
+    await db_sync_to_async(save_answer)(answer_cache, cache_keys, document_id, question, answer, metadata)
 
-    answer = result["answer"]
+    timings["total"] = (time.perf_counter() - total_started) * 1000
+    metadata["timings_ms"] = format_timings(timings)
+    return {"answer": answer, "metadata": metadata}
 
-    # --- Step 5: Persist the question and generated answer to the database ---
-    Message.objects.create(document_id=document_id, role="user", content=question)
-    Message.objects.create(document_id=document_id, role="assistant", content=answer)
 
-    return answer
+async def astream_answer_with_rag_and_history(document_id, question):
+    """
+    Async variant of `stream_answer_with_rag_and_history`, yields the same events.
+    """
+    timings = {}
+    total_started = time.perf_counter()
+    answer_cache = get_answer_cache(document_id)
+    rag_query, cache_keys, entry = await aprepare_rag_query(document_id, question, timings, answer_cache)
+    cached = await db_sync_to_async(get_cached_answer)(entry, document_id, question, timings, total_started)
+    if cached is not None:
+        yield "token", cached["answer"]
+        yield "done", cached
+        return
+
+    llm, prompt, metadata = await aprepare_rag_prompt(
+        document_id, question, rag_query, timings, answer_cache
+    )
+
+    started = time.perf_counter()
+    parts = []
+    async for chunk in llm.astream(prompt, config=llm_call_config(Log.CallType.ANSWER)):
+        if not chunk.content:
+            continue
+        if not parts:
+            first_token_at = time.perf_counter()
+            timings["first_token"] = (first_token_at - total_started) * 1000
+            time_to_first_token_histogram.observe(first_token_at - total_started)
+        parts.append(chunk.content)
+        yield "token", chunk.content
+    timings["generate"] = (time.perf_counter() - started) * 1000
+
+    answer = "".join(parts)
+    await db_sync_to_async(save_answer)(answer_cache, cache_keys, document_id, question, answer, metadata)
+
+    timings["total"] = (time.perf_counter() - total_started) * 1000
+    metadata["timings_ms"] = format_timings(timings)
+    yield "done", {"answer": answer, "metadata": metadata}
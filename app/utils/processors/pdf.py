@@ -1,12 +1,75 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 import fitz
+from django.conf import settings
+
+
+def extract_page_range(file_path, start, stop):
+    """
+    Extracts text of pages [start, stop) — runs in a pool worker with its own fitz handle.
+    """
+    with fitz.open(file_path) as doc:
+        return [doc[number].get_text() for number in range(start, stop)]
+
+
+def iter_pages_sequential(file_path):
+    with fitz.open(file_path) as doc:
+        for number, page in enumerate(doc, start=1):
+            yield number, page.get_text()
+
+
+def iter_pdf_pages(file_path, workers=None, pages_per_task=None):
+    """
+    Yields (page_number, text) for every page of the PDF in page order, page numbers start at 1.
+
+    Page ranges are extracted in a process pool, each worker opens its own fitz handle.
+    At most `workers * 2` ranges are in flight, so memory is proportional to that window
+    of pages and not to the whole document. Small PDFs are read in the current process.
+    """
+    workers = settings.PDF_EXTRACT_WORKERS if workers is None else workers
+    pages_per_task = pages_per_task or settings.PDF_EXTRACT_PAGES_PER_TASK
+
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+
+    # Daemon processes (e.g. multiprocessing pool workers) can't have children. Celery prefork
+    # workers (billiard) aren't daemons here, tasks pass PDF_EXTRACT_WORKERS_IN_CELERY instead
+    if (
+        workers <= 1
+        or page_count <= settings.PDF_EXTRACT_SEQUENTIAL_PAGES
+        or multiprocessing.current_process().daemon
+    ):
+        yield from iter_pages_sequential(file_path)
+        return
+
+    ranges = iter(
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    )
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque(
+            (start, pool.submit(extract_page_range, file_path, start, stop))
+            for start, stop in islice(ranges, workers * 2)
+        )
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append((next_range[0], pool.submit(extract_page_range, file_path, *next_range)))
+
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+
 
 def extract_text_from_pdf(file_path: str) -> str:
     """
     This processor provides functionality to extract text from PDF files.
     """
 
-    text = ""
-    with fitz.open(file_path) as doc:
-        for page in doc:
-            text += page.get_text()
-    return text.strip()
+    return "".join(text for _, text in iter_pdf_pages(file_path)).strip()
@@ -0,0 +1,202 @@
+"""
+Lexical (BM25) search over the SQLite FTS5 index of retrieval chunks and hybrid retrieval.
+
+The index (migration 0018) is kept up to date by triggers on the chunk table, so chunks
+saved with bulk_create are searchable right away. The document id is an indexed column of
+the index, so a search only ranks the chunks of one document however large the corpus is. Hybrid retrieval fuses the BM25 and the
+FAISS rankings with reciprocal rank fusion: only ranks are used, so BM25 and cosine scores
+don't have to be made comparable. A keyword-like query (a quoted phrase or an identifier
+such as a clause number) is answered without embedding the query if some chunk contains
+all of its terms.
+
+Without the FTS5 index (another database vendor) retrieval stays vector-only.
+"""
+import logging
+import re
+import time
+
+from django.conf import settings as django_settings
+from django.db import DatabaseError, connection
+from langchain_core.documents import Document as LangchainDocument
+from prometheus_client import Counter
+
+from app.models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+retrievals_counter = Counter(
+    'rag_retrievals_total', 'RAG retrievals by the path that produced the chunks', ['path']
+)
+
+FTS_TABLE = "app_documentchunk_fts"
+
+# Термин, возможно составной: «4.2.1», «ГОСТ-12», «api/v2»
+TERM_RE = re.compile(r"\w+(?:[./-]\w+)*", re.UNICODE)
+QUOTED_RE = re.compile(r'"([^"]+)"|«([^»]+)»')
+
+_lexical_index_available = None
+
+
+def get_retrieval_mode():
+    """
+    RAG_RETRIEVAL_MODE setting: "hybrid" (BM25 + FAISS, default) or "vector" (FAISS only).
+    """
+    return "vector" if django_settings.RAG_RETRIEVAL_MODE == "vector" else "hybrid"
+
+
+def is_lexical_index_available():
+    global _lexical_index_available
+    if _lexical_index_available is None:
+        _lexical_index_available = (
+            connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _lexical_index_available
+
+
+def get_phrases(query):
+    """
+    Returns the quoted phrases and the terms of the query, lowercased and without repeats.
+    """
+    phrases = [
+        " ".join(TERM_RE.findall(match.group(1) or match.group(2)))
+        for match in QUOTED_RE.finditer(query)
+    ]
+    phrases.extend(
+        term for term in TERM_RE.findall(QUOTED_RE.sub(" ", query))
+        if len(term) > 1 or term.isdigit()
+    )
+    return list(dict.fromkeys(phrase.lower() for phrase in phrases if phrase))
+
+
+def build_match_query(query, operator="OR"):
+    """
+    Turns free text into an FTS5 query. Every term and quoted phrase of the text becomes
+    a quoted FTS5 phrase, so FTS5 syntax characters in the text can't break the query.
+    With "OR" BM25 ranks chunks with more and rarer matches higher; "AND" only matches
+    chunks containing every phrase.
+    """
+    return f" {operator} ".join(f'"{phrase}"' for phrase in get_phrases(query))
+
+
+def is_identifier(term):
+    # «4.2.1», «ГОСТ-12», «2025»: цифры или разделители внутри термина
+    return any(char.isdigit() or char in "./-" for char in term)
+
+
+def is_keyword_query(query):
+    """
+    Whether the query looks like a lookup of exact terms rather than a question: it has
+    a quoted phrase, or at most RAG_LEXICAL_FAST_PATH_MAX_TERMS terms including an
+    identifier and no question mark. Plain short messages ("расскажи про выводы") are not
+    keyword queries: without stemming BM25 would match them on stopwords.
+    """
+    if QUOTED_RE.search(query):
+        return True
+    terms = TERM_RE.findall(query)
+    return (
+        0 < len(terms) <= django_settings.RAG_LEXICAL_FAST_PATH_MAX_TERMS
+        and "?" not in query
+        and any(is_identifier(term) for term in terms)
+    )
+
+
+def search_chunks(document_id, query, k, operator="OR"):
+    """
+    BM25 search over the retrieval chunks of the document, matching any (`operator` "OR")
+    or all ("AND") phrases of the query.
+
+    Returns:
+        list[langchain Document] best first, with the same metadata as FAISS results,
+        or None if lexical search isn't available.
+    """
+    if not is_lexical_index_available():
+        return None
+    match_query = build_match_query(query, operator)
+    if not match_query:
+        return []
+
+    chunk_table = DocumentChunk._meta.db_table
+    # Документ выбирается внутри MATCH; колонка document_id не влияет на BM25 (вес 0)
+    match_query = f'document_id : "{int(document_id)}" AND text : ({match_query})'
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT chunk.text, chunk.page_start, chunk.page_end "
+                f"FROM {FTS_TABLE} JOIN {chunk_table} AS chunk ON chunk.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, 1.0, 0.0) LIMIT %s",
+                [match_query, k],
+            )
+            rows = cursor.fetchall()
+    except DatabaseError:
+        logger.warning("Lexical search failed for query %r", query, exc_info=True)
+        return None
+    return [
+        LangchainDocument(page_content=text, metadata={"page_start": page_start, "page_end": page_end})
+        for text, page_start, page_end in rows
+    ]
+
+
+def reciprocal_rank_fusion(rankings, k):
+    """
+    Fuses rankings (lists of documents, best first): score = sum of 1 / (k + rank).
+
+    Chunks are matched by text: the FAISS index of a deduplicated document is a copy of
+    the source document's index, so chunk ids wouldn't match.
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def lexical_candidates(document_id, query, timings):
+    """
+    BM25 candidates for hybrid retrieval, or None in vector mode or without the FTS5 index.
+    The duration (in ms) is written into `timings` under "lexical_search".
+    """
+    if get_retrieval_mode() != "hybrid":
+        return None
+    started = time.perf_counter()
+    documents = search_chunks(document_id, query, django_settings.RAG_HYBRID_CANDIDATES)
+    timings["lexical_search"] = timings.get("lexical_search", 0.0) + (time.perf_counter() - started) * 1000
+    return documents
+
+
+def lexical_fast_path(document_id, query, k, timings, query_embedding=None):
+    """
+    Chunks answering a keyword-like query from BM25 alone: those containing every phrase
+    of the query. Returns None when the query isn't keyword-like or nothing contains all
+    phrases; retrieval then goes on with the hybrid search. When the query embedding is
+    already known (answer cache), the hybrid search costs no embedding call anyway.
+    """
+    if (
+        get_retrieval_mode() != "hybrid"
+        or not django_settings.RAG_LEXICAL_FAST_PATH
+        or query_embedding is not None
+        or not is_keyword_query(query)
+    ):
+        return None
+    started = time.perf_counter()
+    documents = search_chunks(document_id, query, k, operator="AND")
+    timings["lexical_search"] = timings.get("lexical_search", 0.0) + (time.perf_counter() - started) * 1000
+    return documents or None
+
+
+def get_vector_candidate_count(k, lexical_documents):
+    return k if lexical_documents is None else max(k, django_settings.RAG_HYBRID_CANDIDATES)
+
+
+def fuse_results(vector_documents, lexical_documents, k):
+    """
+    Returns:
+        (documents, path) — the top `k` chunks and "hybrid" or "vector".
+    """
+    if not lexical_documents:
+        return vector_documents[:k], "vector"
+    fused = reciprocal_rank_fusion([vector_documents, lexical_documents], django_settings.RAG_RRF_K)
+    return fused[:k], "hybrid"
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from django.conf import settings as django_settings
+
+from app.models import Log
+from app.utils.cache.summary_cache import ChunkSummaryCache
+from app.utils.processors.instrumentation import llm_callbacks
+from app.utils.processors.langchain import SUMMARY_MAP_PROMPT, \
+                                          get_summary_llm, \
+                                          get_combine_prompt, \
+                                          get_model_context_window
+from app.utils.processors.tokens import get_token_counter
+from app.utils.retry import call_with_retries
+
+
+class MapReduceSummarizer:
+    """
+    Map-reduce summarization with a bounded number of concurrent LLM calls.
+
+    - map: every chunk is summarized with SUMMARY_MAP_PROMPT, up to `concurrency` calls
+      at a time; the order of partial summaries matches the order of the chunks;
+    - collapse: while the partial summaries don't fit into `token_max` tokens, they are
+      grouped and each group is combined into one summary (also concurrently);
+    - reduce: the remaining summaries are combined with the combine prompt.
+
+    Retryable OpenAI errors are retried up to `max_retries` times with jittered backoff.
+    With a `map_cache` (ChunkSummaryCache) only chunks without a stored map summary
+    are sent to the LLM.
+    """
+
+    def __init__(self, llm, max_retries, concurrency, token_max,
+                 combine_prompt=None, map_cache=None, count_tokens=None):
+        self.llm = llm
+        # Тот же счётчик токенов, что и при нарезке чанков (tiktoken модели)
+        self.count_tokens = count_tokens or get_token_counter(getattr(llm, "model_name", ""))
+        self.max_retries = max_retries
+        self.concurrency = max(1, concurrency)
+        self.token_max = token_max
+        self.combine_prompt = combine_prompt or get_combine_prompt(None)
+        self.map_cache = map_cache
+
+    def invoke(self, prompt, call_type=Log.CallType.REDUCE):
+        # Один обработчик на все попытки: повторы попадают в лог как retries
+        config = {"callbacks": llm_callbacks(call_type, self.max_retries)}
+        return call_with_retries(lambda: self.llm.invoke(prompt, config=config).content, self.max_retries)
+
+    def run_prompts(self, prompts, call_type, on_result=None):
+        """
+        Runs prompts concurrently and returns the results in the same order.
+
+        `on_result(index, result)` is called in the calling thread as soon as a prompt
+        completes. If a prompt fails, prompts not started yet are cancelled, the running
+        ones are still awaited and passed to `on_result`, then the first error is raised.
+        """
+        if len(prompts) == 1:
+            results = [self.invoke(prompts[0], call_type)]
+            if on_result is not None:
+                on_result(0, results[0])
+            return results
+
+        results = [None] * len(prompts)
+        error = None
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(prompts))) as pool:
+            futures = {
+                pool.submit(partial(self.invoke, call_type=call_type), prompt): index
+                for index, prompt in enumerate(prompts)
+            }
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                        for pending in futures:
+                            pending.cancel()
+                    continue
+                if on_result is not None:
+                    on_result(futures[future], results[futures[future]])
+        if error is not None:
+            raise error
+        return results
+
+    def map(self, texts):
+        def summarize(texts, on_result=None):
+            return self.run_prompts(
+                [SUMMARY_MAP_PROMPT.format(text=text) for text in texts], Log.CallType.MAP, on_result
+            )
+
+        if self.map_cache is None:
+            return summarize(texts)
+        return self.map_cache.map(texts, summarize)
+
+    def group_by_tokens(self, summaries):
+        """
+        Greedily groups consecutive summaries so each group fits into `token_max`.
+        A group always takes at least two summaries, so every collapse round shrinks the list.
+        """
+        groups = []
+        current = []
+        current_tokens = 0
+        for summary in summaries:
+            tokens = self.count_tokens(summary)
+            if len(current) >= 2 and current_tokens + tokens > self.token_max:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def reduce(self, summaries):
+        while len(summaries) > 1 and self.count_tokens("\n\n".join(summaries)) > self.token_max:
+            groups = self.group_by_tokens(summaries)
+            # Группу из одного резюме нечего объединять, оставляем как есть
+            to_combine = [index for index, group in enumerate(groups) if len(group) > 1]
+            combined = self.run_prompts([
+                self.combine_prompt.format(text="\n\n".join(groups[index])) for index in to_combine
+            ], Log.CallType.REDUCE)
+            summaries = [group[0] for group in groups]
+            for index, summary in zip(to_combine, combined):
+                summaries[index] = summary
+        return self.invoke(self.combine_prompt.format(text="\n\n".join(summaries)))
+
+    def summarize(self, texts):
+        return self.reduce(self.map(texts))
+
+
+def get_reduce_token_max(model):
+    """
+    Token budget for the reduce step input: the model's context window minus room for
+    the prompt and the answer, capped by SUMMARY_REDUCE_TOKEN_MAX.
+    """
+    context_window = get_model_context_window(model)
+    available = context_window - django_settings.SUMMARY_RESERVED_TOKENS
+    return max(1000, min(django_settings.SUMMARY_REDUCE_TOKEN_MAX, available))
+
+
+def summarize_texts(texts):
+    """
+    Summarizes document chunks with the model configured in `OpenaiSettings`.
+
+    Args:
+        texts (list[str]): Chunk texts in document order.
+
+    Returns:
+        str: The final summary.
+    """
+    llm, settings = get_summary_llm()
+    summarizer = MapReduceSummarizer(
+        llm,
+        max_retries=settings.max_retries,
+        concurrency=django_settings.SUMMARY_MAP_CONCURRENCY,
+        token_max=get_reduce_token_max(settings.model),
+        combine_prompt=get_combine_prompt(settings),
+        map_cache=ChunkSummaryCache(settings.model, SUMMARY_MAP_PROMPT),
+        count_tokens=get_token_counter(settings.model),
+    )
+    return summarizer.summarize(texts)
@@ -0,0 +1,73 @@
+"""
+Token counting with the tokenizer of the model (tiktoken).
+
+tiktoken downloads the encoding files on first use and caches them (TIKTOKEN_CACHE_DIR);
+when an encoding can't be loaded, e.g. without network access, tokens are estimated
+at ~4 characters per token, as everywhere else in the app, and loading is tried again
+after TIKTOKEN_RETRY_INTERVAL seconds.
+"""
+import logging
+import time
+
+import tiktoken
+from django.conf import settings
+
+from app.utils.processors.instrumentation import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Кодировка для моделей, неизвестных tiktoken (в том числе fake-моделей)
+DEFAULT_ENCODING = "cl100k_base"
+
+# Загруженные кодировки по имени и время последней неудачной загрузки
+_encodings = {}
+_failed_at = {}
+
+
+def get_encoding(model):
+    """
+    Returns the tiktoken encoding of the model, or None if it can't be loaded.
+    Only loaded encodings are cached: a failed load is retried after TIKTOKEN_RETRY_INTERVAL.
+    """
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        name = DEFAULT_ENCODING
+    encoding = _encodings.get(name)
+    if encoding is not None:
+        return encoding
+
+    failed_at = _failed_at.get(name)
+    if failed_at is not None and time.monotonic() - failed_at < settings.TIKTOKEN_RETRY_INTERVAL:
+        return None
+    try:
+        encoding = tiktoken.get_encoding(name)
+    except Exception as e:
+        _failed_at[name] = time.monotonic()
+        logger.warning("tiktoken encoding %s is not available, token counts are estimated: %s", name, e)
+        return None
+    _encodings[name] = encoding
+    _failed_at.pop(name, None)
+    return encoding
+
+
+def get_token_counter(model):
+    """
+    Returns a function counting the tokens of a text for the model.
+    """
+    encoding = get_encoding(model or "")
+    if encoding is None:
+        return estimate_tokens
+
+    def count_tokens(text):
+        # Спецтокены вроде <|endoftext|> в тексте документа считаем обычным текстом
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return count_tokens
+
+
+def is_exact(model):
+    """
+    Whether token counts for the model come from its tokenizer rather than the estimate.
+    """
+    return get_encoding(model or "") is not None
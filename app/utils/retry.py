@@ -0,0 +1,41 @@
+import random
+import time
+
+import openai
+
+
+def is_retryable_error(error):
+    """
+    Rate limits, timeouts, connection problems and 5xx responses are worth retrying.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """
+    Exponential backoff with full jitter: random value in [0, base * 2^attempt], capped.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def call_with_retries(func, max_retries, base_delay=1.0, on_retry=None):
+    """
+    Calls `func()` and retries retryable OpenAI errors up to `max_retries` times.
+
+    `on_retry(attempt, error)` is called before each retry.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as error:
+            if attempt >= max_retries or not is_retryable_error(error):
+                raise
+            if on_retry:
+                on_retry(attempt, error)
+            time.sleep(backoff_delay(attempt, base_delay))
+            attempt += 1
@@ -0,0 +1,16 @@
+import json
+
+
+def format_sse_event(event, data):
+    """
+    Formats a Server-Sent Event with a JSON payload.
+    """
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+# Заголовки, чтобы прокси и браузер не буферизовали поток
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
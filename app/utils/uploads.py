@@ -0,0 +1,222 @@
+"""
+Chunked, resumable PDF uploads.
+
+The client creates an UploadSession, sends the file in parts (PUT with the byte offset
+of the part) and completes the upload. Each part is streamed from the request to the
+part file in HASH_BLOCK_SIZE blocks, so memory use doesn't depend on the file size.
+
+The SHA-256 of the file is computed while the parts arrive. The hash state lives in the
+process that received the previous part; if a part lands in another process or is
+re-sent, the hash is recomputed from the file on completion instead.
+"""
+import hashlib
+import os
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from prometheus_client import Counter
+
+from app.models import Document, UploadSession
+from app.utils.admission import prepare_for_queue
+from app.utils.processors.fingerprint import HASH_BLOCK_SIZE
+
+upload_bytes_counter = Counter('upload_received_bytes_total', 'Bytes received by chunked uploads')
+upload_rehash_counter = Counter(
+    'upload_rehash_total', 'Completed uploads whose hash had to be recomputed from disk'
+)
+
+PDF_HEADER = b"%PDF-"
+
+
+class UploadError(Exception):
+    """
+    Invalid upload request; `status` is the HTTP status to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# upload uuid -> (sha256 of the bytes received so far, number of hashed bytes)
+_live_hashes = {}
+_live_hashes_lock = threading.Lock()
+
+
+def get_part_path(session):
+    return Path(settings.MEDIA_ROOT) / 'uploads' / f'{session.uuid}.part'
+
+
+def serialize_session(session):
+    return {
+        'upload_id': str(session.uuid),
+        'filename': session.filename,
+        'size': session.size,
+        'received_bytes': session.received_bytes,
+        'status': session.status,
+        'part_max_bytes': settings.UPLOAD_PART_MAX_BYTES,
+        'document_id': session.document_id,
+    }
+
+
+def delete_expired_sessions():
+    """
+    Removes unfinished uploads not touched for UPLOAD_SESSION_TTL seconds, with their files.
+    """
+    expired_before = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    expired = UploadSession.objects.filter(
+        status=UploadSession.Status.ACTIVE, updated_at__lt=expired_before
+    )
+    for session in expired:
+        abort_upload(session)
+
+
+def create_upload(filename, size, title, client_key):
+    if not filename or not filename.lower().endswith('.pdf'):
+        raise UploadError("Only PDF files allowed.")
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError("size must be a positive integer")
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(f"File too large. Max {settings.UPLOAD_MAX_BYTES // (1024 * 1024)} MB.", status=413)
+
+    delete_expired_sessions()
+    session = UploadSession.objects.create(
+        filename=os.path.basename(filename)[:255],
+        title=title or None,
+        size=size,
+        client_key=client_key,
+    )
+    path = get_part_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    with _live_hashes_lock:
+        _live_hashes[session.uuid] = (hashlib.sha256(), 0)
+    return session
+
+
+def write_part(session, offset, stream, length):
+    """
+    Streams `length` bytes of the request body to the part file at `offset`.
+
+    The part must start where the received data ends; re-sending an already received
+    range (a retry after a lost response) is allowed and overwrites the same bytes.
+    """
+    if session.status != UploadSession.Status.ACTIVE:
+        raise UploadError("Upload is not active", status=409)
+    if offset > session.received_bytes:
+        raise UploadError("Part doesn't continue the received data", status=409)
+    if length <= 0 or length > settings.UPLOAD_PART_MAX_BYTES:
+        raise UploadError(f"Part size must be between 1 and {settings.UPLOAD_PART_MAX_BYTES} bytes", status=413)
+    if offset + length > session.size:
+        raise UploadError("Part exceeds the declared file size")
+
+    with _live_hashes_lock:
+        digest, hashed = _live_hashes.pop(session.uuid, (None, 0))
+    if hashed != offset:
+        # Часть повторяется или предыдущие части принял другой процесс — хэш досчитаем с диска
+        digest = None
+
+    written = 0
+    with open(get_part_path(session), 'r+b') as part_file:
+        part_file.seek(offset)
+        while written < length:
+            block = stream.read(min(HASH_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            if offset == 0 and written == 0 and not block.startswith(PDF_HEADER[:len(block)]):
+                abort_upload(session)
+                raise UploadError("File is not a PDF.")
+            part_file.write(block)
+            if digest is not None:
+                digest.update(block)
+            written += len(block)
+    upload_bytes_counter.inc(written)
+
+    if written != length:
+        raise UploadError("Incomplete part: the request body is shorter than Content-Length")
+
+    end = offset + written
+    if end > session.received_bytes:
+        UploadSession.objects.filter(id=session.id, received_bytes__lt=end).update(
+            received_bytes=end, updated_at=timezone.now()
+        )
+        session.received_bytes = end
+    if digest is not None:
+        with _live_hashes_lock:
+            _live_hashes[session.uuid] = (digest, end)
+    return session
+
+
+def hash_file(path, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = size
+        while remaining:
+            block = f.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def complete_upload(session):
+    """
+    Moves the received file into the document storage and creates the queued Document.
+    """
+    if session.status != UploadSession.Status.ACTIVE:
+        raise UploadError("Upload is not active", status=409)
+    if session.received_bytes != session.size:
+        raise UploadError(
+            f"Upload is incomplete: {session.received_bytes} of {session.size} bytes received", status=409
+        )
+
+    path = get_part_path(session)
+    # Повторно присланная часть могла оставить лишние байты в конце
+    os.truncate(path, session.size)
+
+    with _live_hashes_lock:
+        digest, hashed = _live_hashes.pop(session.uuid, (None, 0))
+    if digest is None or hashed != session.size:
+        upload_rehash_counter.inc()
+        digest = hash_file(path, session.size)
+
+    with open(path, 'rb') as f:
+        if f.read(len(PDF_HEADER)) != PDF_HEADER:
+            abort_upload(session)
+            raise UploadError("File is not a PDF.")
+
+    # Завершить загрузку может только один запрос
+    claimed = UploadSession.objects.filter(
+        id=session.id, status=UploadSession.Status.ACTIVE
+    ).update(status=UploadSession.Status.COMPLETED, updated_at=timezone.now())
+    if not claimed:
+        raise UploadError("Upload is not active", status=409)
+
+    name = default_storage.get_available_name(f'pdfs/{session.filename}')
+    destination = Path(default_storage.path(name))
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(path, destination)
+
+    document = Document(title=session.title, variant=Document.Variant.DOCUMENT)
+    document.file.name = name
+    document.fingerprint = f"sha256:{digest.hexdigest()}"
+    prepare_for_queue(document, session.client_key)
+    document.save()
+
+    session.status = UploadSession.Status.COMPLETED
+    session.document = document
+    session.save(update_fields=['document', 'updated_at'])
+    return document
+
+
+def abort_upload(session):
+    with _live_hashes_lock:
+        _live_hashes.pop(session.uuid, None)
+    get_part_path(session).unlink(missing_ok=True)
+    session.status = UploadSession.Status.ABORTED
+    session.save(update_fields=['status', 'updated_at'])
@@ -1,56 +1,100 @@
+import hashlib
 import json
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from prometheus_client import Counter
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 
-from app.models import Document, Message
+from app.models import Document, Message, UploadSession
 from app.forms import DocumentUploadForm
 from app.tasks import process_document
-from app.utils.processors.langchain import answer_question_with_rag_and_history
+from app.utils import uploads
+from app.utils.admission import get_client_key, get_queue_positions, prepare_for_queue
+from app.utils.documents import document_list_queryset, \
+                                filter_documents, \
+                                list_documents, \
+                                parse_page_size, \
+                                LATEST_DOCUMENTS_LIMIT
+from app.utils.processors.langchain import aanswer_question_with_rag_and_history, \
+                                        stream_answer_with_rag_and_history
+from app.utils.sse import format_sse_event, SSE_HEADERS
 
 # Простая метрика: сколько раз вызывали health check
 health_check_counter = Counter('health_check_requests_total', 'Total health check requests')
 
-# api endpoint to get the latest 5 documents using polling approach
+def get_listing_params(request):
+    """
+    Returns (status, variant, cursor, limit) of a documents listing request or raises ValueError.
+    """
+    return (
+        request.GET.get('status') or None,
+        request.GET.get('variant') or None,
+        request.GET.get('cursor') or None,
+        parse_page_size(request.GET.get('limit')),
+    )
+
+
+def documents_etag(request):
+    """
+    ETag of a documents page: every status change bumps updated_at, so ids and updated_at
+    are enough and the rows themselves aren't loaded. Queue positions change without
+    touching the listed documents and are hashed as well.
+    """
+    try:
+        status, variant, cursor, limit = get_listing_params(request)
+        queryset = filter_documents(Document.objects.order_by('-id'), status, variant, cursor)
+    except ValueError:
+        return None
+    rows = list(queryset.values_list('id', 'updated_at', 'status')[:limit + 1])
+    positions = get_queue_positions([row[0] for row in rows if row[2] == Document.Status.QUEUED])
+    return hashlib.sha1(repr((rows, sorted(positions.items()))).encode('utf-8')).hexdigest()
+
+
+# api endpoint listing documents newest first, keyset paginated (?status=&variant=&limit=&cursor=).
+# Fallback for clients without the SSE stream (/api/documents/events/):
+# unchanged polls get 304 Not Modified without a body
+@condition(etag_func=documents_etag)
 def get_documents(request):
-    documents = Document.objects.order_by('-id')[:5]
-    docs_data = []
-
-    for doc in documents:
-        docs_data.append({
-            'id': doc.id,
-            'filename': doc.filename() if doc.variant == Document.Variant.DOCUMENT else None,
-            'variant': doc.variant,
-            'title': doc.title,
-            'url': doc.url,
-            'status': doc.status,
-            'status_display': doc.get_status_display(),
-            'summary': doc.summary,
-        })
-    
-    return JsonResponse({'documents': docs_data})
+    try:
+        status, variant, cursor, limit = get_listing_params(request)
+        page = list_documents(status, variant, cursor, limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
 
 
-def upload_document_view(request):
-    documents = Document.objects.order_by('-id')[:5]
-    is_processing = Document.objects.filter(status='processing').exists()
+def document_summary_etag(request, doc_id):
+    updated_at = Document.objects.filter(id=doc_id).values_list('updated_at', flat=True).first()
+    return updated_at.isoformat() if updated_at else None
+
 
+# Summary of one document: the listing doesn't include summaries
+@condition(etag_func=document_summary_etag)
+def get_document_summary(request, doc_id):
+    document = get_object_or_404(Document.objects.only('id', 'summary'), id=doc_id)
+    return JsonResponse({'id': document.id, 'summary': document.summary})
+
+
+def upload_document_view(request):
     if request.method == 'POST':
         form = DocumentUploadForm(request.POST, request.FILES)
-        if form.is_valid() and not is_processing:
-            document = form.save()
-        
-            # run background task to process the PDF
+        if form.is_valid():
+            document = form.save(commit=False)
+            # Документ встаёт в очередь, обработка начнётся, когда освободится слот
+            prepare_for_queue(document, get_client_key(request))
+            document.save()
+
+            # run background task to queue and dispatch the document
             process_document.delay(document.id)
         return redirect('upload')
     else:
         form = DocumentUploadForm()
 
+    documents = document_list_queryset()[:LATEST_DOCUMENTS_LIMIT]
     return render(request, 'upload.html', {
         'form': form,
         'documents': documents,
-        'is_processing': is_processing,
     })
 
 
@@ -65,22 +109,148 @@ def document_chat_view(request, doc_id):
     })
 
 
-@csrf_exempt
-def ask_question(request):
+async def ask_question(request):
     if request.method == "POST":
         try:
-            body = json.loads(request.body)
-            question = body.get("question")
-            document_id = body.get("document_id")
-            if not question or not document_id:
-                return JsonResponse({"error": "Missing question or document_id"}, status=400)
+            question, document_id = parse_question_request(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
-            # Используем функцию с поддержкой истории сообщений
-            answer = answer_question_with_rag_and_history(document_id, question)
+        try:
+            # Асинхронная версия: запрос не держит поток, пока ждём ответ OpenAI
+            result = await aanswer_question_with_rag_and_history(document_id, question)
 
-            return JsonResponse({"answer": answer})
+            return JsonResponse({"answer": result["answer"], "metadata": result["metadata"]})
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+# csrf_exempt in Django 3.2 wraps the view into a sync function, which breaks async views
+ask_question.csrf_exempt = True
+
+
+def parse_question_request(request):
+    """
+    Returns (question, document_id) from a JSON request body or raises ValueError.
+    """
+    body = json.loads(request.body)
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    question = body.get("question")
+    document_id = body.get("document_id")
+    if not question or not document_id:
+        raise ValueError("Missing question or document_id")
+    return question, document_id
+
+
+def stream_answer_events(document_id, question):
+    try:
+        for event, data in stream_answer_with_rag_and_history(document_id, question):
+            if event == "token":
+                yield format_sse_event("token", {"token": data})
+            else:
+                yield format_sse_event(event, data)
+    except Exception as e:
+        yield format_sse_event("error", {"error": str(e)})
+
+
+# Streaming answers over SSE. Under ASGI this URL is served by app.asgi.ask_question_stream_app
+@csrf_exempt
+def ask_question_stream(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    try:
+        question, document_id = parse_question_request(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        stream_answer_events(document_id, question), content_type="text/event-stream"
+    )
+    for header, value in SSE_HEADERS.items():
+        response[header] = value
+    return response
+
+
+def get_upload_session(upload_id):
+    return get_object_or_404(UploadSession, uuid=upload_id)
+
+
+def parse_part_offset(request):
+    """
+    Returns the offset of an uploaded part from `Content-Range: bytes start-end/total`
+    or the `offset` query parameter; raises ValueError if there is neither.
+    """
+    content_range = request.headers.get('Content-Range', '')
+    if content_range.startswith('bytes '):
+        return int(content_range[len('bytes '):].split('-', 1)[0])
+    return int(request.GET['offset'])
+
+
+# Chunked resumable uploads: create a session, PUT the parts, complete
+@csrf_exempt
+def create_upload(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        body = json.loads(request.body)
+        session = uploads.create_upload(
+            body.get('filename'), body.get('size'), body.get('title'), get_client_key(request)
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse(uploads.serialize_session(session), status=201)
+
+
+@csrf_exempt
+def upload_session(request, upload_id):
+    session = get_upload_session(upload_id)
+
+    if request.method == 'GET':
+        return JsonResponse(uploads.serialize_session(session))
+
+    if request.method == 'PUT':
+        try:
+            offset = parse_part_offset(request)
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Missing or invalid Content-Range/offset'}, status=400)
+        try:
+            # Тело запроса читается из потока блоками, без request.body
+            session = uploads.write_part(session, offset, request, length)
+        except uploads.UploadError as e:
+            session.refresh_from_db()
+            return JsonResponse(dict(uploads.serialize_session(session), error=str(e)), status=e.status)
+        return JsonResponse(uploads.serialize_session(session))
+
+    if request.method == 'DELETE':
+        if session.status == UploadSession.Status.ACTIVE:
+            uploads.abort_upload(session)
+        return JsonResponse(uploads.serialize_session(session))
+
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+
+@csrf_exempt
+def complete_upload(request, upload_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    session = get_upload_session(upload_id)
+    if session.status == UploadSession.Status.COMPLETED:
+        # Повтор запроса после потерянного ответа: документ уже в очереди
+        return JsonResponse(uploads.serialize_session(session))
+    try:
+        document = uploads.complete_upload(session)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    # run background task to queue and dispatch the document
+    process_document.delay(document.id)
+    return JsonResponse(uploads.serialize_session(session))
 
 
 def health_check_view(request):
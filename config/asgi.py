@@ -9,8 +9,33 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# runserver serves static files itself, under uvicorn we do it here in DEBUG mode
+if settings.DEBUG:
+    django_application = ASGIStaticFilesHandler(django_application)
+
+# Imported after Django is configured: the endpoints use models and settings
+from app.asgi import ask_question_stream_app, document_events_app, lifespan_app  # noqa: E402
+
+# Streaming endpoints served natively over ASGI, everything else goes to Django
+ASGI_ROUTES = {
+    '/api/ask-question/stream/': ask_question_stream_app,
+    '/api/documents/events/': document_events_app,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan_app(scope, receive, send)
+        return
+    handler = ASGI_ROUTES.get(scope['path']) if scope['type'] == 'http' else None
+    if handler is None:
+        handler = django_application
+    await handler(scope, receive, send)
@@ -1,6 +1,8 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess, start_http_server
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -20,14 +22,33 @@ celery_app.conf.task_time_limit = 5400
 celery_app.conf.task_soft_time_limit = 5340
 celery_app.conf.broker_transport_options = {"visibility_timeout": 5400}
 
-@celery_app.task(bind=True)
-def debug_task(self):
-    print(f"Request: {self.request!r}")
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    # Настройки и клиенты LLM создаются заранее в каждом процессе пула
+    from app.utils.processors.backends import warm_up_clients
+    warm_up_clients()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # Экспортер запускается только в главном процессе воркера: процессы пула
+    # пишут метрики в PROMETHEUS_MULTIPROC_DIR, а он собирает их вместе
+    from django.conf import settings
 
-import threading
-from prometheus_client import start_http_server
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(settings.WORKER_METRICS_PORT, registry=registry)
 
-def start_metrics_server():
-    start_http_server(8001)
 
-threading.Thread(target=start_metrics_server, daemon=True).start()
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    # livesum/liveall-метрики завершённого процесса пула больше не учитываются
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+@celery_app.task(bind=True)
+def debug_task(self):
+    print(f"Request: {self.request!r}")
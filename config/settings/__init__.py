@@ -4,4 +4,7 @@ include(
     'base.py',
     'database.py',
     'celery.py',
+    'cache.py',
+    'llm.py',
+    'processing.py',
 )
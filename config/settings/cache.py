@@ -0,0 +1,21 @@
+import environ
+
+from config.settings.base import BASE_DIR
+
+env = environ.Env()
+env.read_env(env.str('ENV_PATH', '.env'))
+
+# Persistent chunk embeddings cache (sqlite file, float32 vectors)
+EMBEDDING_CACHE_ENABLED = env.bool('EMBEDDING_CACHE_ENABLED', default=True)
+EMBEDDING_CACHE_PATH = env.str('EMBEDDING_CACHE_PATH', default=str(BASE_DIR / 'embedding_cache.sqlite3'))
+EMBEDDING_CACHE_MAX_BYTES = env.int('EMBEDDING_CACHE_MAX_BYTES', default=1024 * 1024 * 1024)
+
+# In-process LRU cache of loaded FAISS indices used by the chat
+VECTORSTORE_CACHE_MAX_BYTES = env.int('VECTORSTORE_CACHE_MAX_BYTES', default=512 * 1024 * 1024)
+
+# Answers to repeated questions per document (exact match on the normalized question).
+# A threshold > 0 also enables near-duplicate matches by cosine similarity of question embeddings
+ANSWER_CACHE_ENABLED = env.bool('ANSWER_CACHE_ENABLED', default=True)
+ANSWER_CACHE_TTL = env.int('ANSWER_CACHE_TTL', default=7 * 24 * 60 * 60)
+ANSWER_CACHE_MAX_ENTRIES_PER_DOCUMENT = env.int('ANSWER_CACHE_MAX_ENTRIES_PER_DOCUMENT', default=200)
+ANSWER_CACHE_SIMILARITY_THRESHOLD = env.float('ANSWER_CACHE_SIMILARITY_THRESHOLD', default=0.0)
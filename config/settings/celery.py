@@ -9,3 +9,10 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 
 CELERY_TIMEZONE = 'UTC'
+
+# Prometheus exporter of the worker. With PROMETHEUS_MULTIPROC_DIR set (an empty directory
+# per worker start) the metrics of all pool processes are aggregated, see config/celery.py
+WORKER_METRICS_PORT = env.int('WORKER_METRICS_PORT', default=8001)
+
+# Document status events for the upload page (fanout exchange on the broker, see app/utils/events.py)
+DOCUMENT_EVENTS_ENABLED = env.bool('DOCUMENT_EVENTS_ENABLED', default=True)
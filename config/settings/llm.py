@@ -0,0 +1,64 @@
+import environ
+
+env = environ.Env()
+env.read_env(env.str('ENV_PATH', '.env'))
+
+# RAG chat: rewrite follow-up questions with the history before retrieval
+# "auto" - only when there is a history, "always", "never"
+RAG_CONDENSE_QUESTION = env.str('RAG_CONDENSE_QUESTION', default='auto')
+
+# RAG retrieval: "hybrid" - BM25 over the SQLite FTS5 index of chunks and FAISS, rankings fused
+# with reciprocal rank fusion (RAG_HYBRID_CANDIDATES from each, constant RAG_RRF_K), "vector" - FAISS only.
+# Keyword-like queries (quoted phrase, or up to RAG_LEXICAL_FAST_PATH_MAX_TERMS terms with an identifier
+# such as "4.2.1" and no "?") are answered without embedding the query if a chunk contains all their terms
+RAG_RETRIEVAL_MODE = env.str('RAG_RETRIEVAL_MODE', default='hybrid')
+RAG_HYBRID_CANDIDATES = env.int('RAG_HYBRID_CANDIDATES', default=20)
+RAG_RRF_K = env.int('RAG_RRF_K', default=60)
+RAG_LEXICAL_FAST_PATH = env.bool('RAG_LEXICAL_FAST_PATH', default=True)
+RAG_LEXICAL_FAST_PATH_MAX_TERMS = env.int('RAG_LEXICAL_FAST_PATH_MAX_TERMS', default=4)
+
+# Summarization: concurrent map calls, max tokens of the reduce step input
+# and tokens reserved in the context window for the prompt and the answer
+SUMMARY_MAP_CONCURRENCY = env.int('SUMMARY_MAP_CONCURRENCY', default=8)
+SUMMARY_REDUCE_TOKEN_MAX = env.int('SUMMARY_REDUCE_TOKEN_MAX', default=12000)
+SUMMARY_RESERVED_TOKENS = env.int('SUMMARY_RESERVED_TOKENS', default=2000)
+
+# Use OpenaiSettings.summary_prompt (admin) as the reduce step prompt when it takes exactly {text}.
+# Off by default: existing rows would silently change summaries. Apply to stored summaries
+# with `manage.py resummarize`
+SUMMARY_CUSTOM_PROMPT_ENABLED = env.bool('SUMMARY_CUSTOM_PROMPT_ENABLED', default=False)
+
+# OpenaiSettings row cached per process (dropped on admin save in that process),
+# keep-alive connection pool shared by the OpenAI clients
+OPENAI_SETTINGS_CACHE_TTL = env.int('OPENAI_SETTINGS_CACHE_TTL', default=60)
+LLM_HTTP_MAX_CONNECTIONS = env.int('LLM_HTTP_MAX_CONNECTIONS', default=100)
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = env.int('LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS', default=20)
+
+# Every LLM/embedding call is written to the Log table by a background thread
+# in batches; rows are dropped when the queue is full
+LLM_LOG_ENABLED = env.bool('LLM_LOG_ENABLED', default=True)
+LLM_LOG_BATCH_SIZE = env.int('LLM_LOG_BATCH_SIZE', default=100)
+LLM_LOG_FLUSH_INTERVAL = env.float('LLM_LOG_FLUSH_INTERVAL', default=1.0)
+LLM_LOG_QUEUE_SIZE = env.int('LLM_LOG_QUEUE_SIZE', default=10000)
+
+# LLM/embedding backend: "openai" or "fake" (deterministic local models, no network)
+LLM_BACKEND = env.str('LLM_BACKEND', default='openai')
+FAKE_LLM_LATENCY = env.float('FAKE_LLM_LATENCY', default=0.05)
+FAKE_LLM_TOKENS_PER_SECOND = env.float('FAKE_LLM_TOKENS_PER_SECOND', default=200)
+FAKE_LLM_ANSWER_TOKENS = env.int('FAKE_LLM_ANSWER_TOKENS', default=60)
+FAKE_EMBEDDING_DIMENSIONS = env.int('FAKE_EMBEDDING_DIMENSIONS', default=256)
+FAKE_EMBEDDING_LATENCY = env.float('FAKE_EMBEDDING_LATENCY', default=0.0)
+
+# Chunk embeddings: concurrent batch requests, max texts and estimated tokens per batch
+# (OpenAI accepts up to 2048 inputs and 300k tokens per request)
+EMBEDDING_CONCURRENCY = env.int('EMBEDDING_CONCURRENCY', default=4)
+EMBEDDING_BATCH_MAX_TEXTS = env.int('EMBEDDING_BATCH_MAX_TEXTS', default=512)
+EMBEDDING_BATCH_MAX_TOKENS = env.int('EMBEDDING_BATCH_MAX_TOKENS', default=100000)
+
+# Chat history: the last messages are sent verbatim within a token budget,
+# older messages are folded into a rolling summary by a Celery task
+# once at least CHAT_HISTORY_FOLD_BATCH of them have accumulated
+CHAT_HISTORY_MAX_MESSAGES = env.int('CHAT_HISTORY_MAX_MESSAGES', default=10)
+CHAT_HISTORY_TOKEN_BUDGET = env.int('CHAT_HISTORY_TOKEN_BUDGET', default=2000)
+CHAT_HISTORY_FOLD_BATCH = env.int('CHAT_HISTORY_FOLD_BATCH', default=6)
+CHAT_HISTORY_SUMMARY_ENABLED = env.bool('CHAT_HISTORY_SUMMARY_ENABLED', default=True)
@@ -0,0 +1,52 @@
+import os
+
+import environ
+
+from config.settings.base import BASE_DIR
+
+env = environ.Env()
+env.read_env(env.str('ENV_PATH', '.env'))
+
+# PDF text extraction: process pool size, pages per pool task and
+# the page count below which the PDF is read in the current process
+PDF_EXTRACT_WORKERS = env.int('PDF_EXTRACT_WORKERS', default=min(4, os.cpu_count() or 1))
+PDF_EXTRACT_PAGES_PER_TASK = env.int('PDF_EXTRACT_PAGES_PER_TASK', default=16)
+PDF_EXTRACT_SEQUENTIAL_PAGES = env.int('PDF_EXTRACT_SEQUENTIAL_PAGES', default=32)
+# Pool size inside Celery tasks: every prefork worker is already a process per concurrency slot,
+# a pool per worker would start concurrency x PDF_EXTRACT_WORKERS more interpreters
+PDF_EXTRACT_WORKERS_IN_CELERY = env.int('PDF_EXTRACT_WORKERS_IN_CELERY', default=1)
+
+# Chunking: characters buffered before splitting and chunks per bulk_create
+CHUNKING_WINDOW_CHARS = env.int('CHUNKING_WINDOW_CHARS', default=50000)
+CHUNK_BULK_CREATE_BATCH_SIZE = env.int('CHUNK_BULK_CREATE_BATCH_SIZE', default=500)
+
+# Chunk sizes in tokens of the model's tokenizer. Summary chunks (map step) take the summary
+# model's context window minus SUMMARY_RESERVED_TOKENS, up to SUMMARY_CHUNK_MAX_TOKENS;
+# retrieval chunks (embeddings and search) are small and overlap a little
+SUMMARY_CHUNK_MAX_TOKENS = env.int('SUMMARY_CHUNK_MAX_TOKENS', default=8000)
+SUMMARY_CHUNK_OVERLAP_TOKENS = env.int('SUMMARY_CHUNK_OVERLAP_TOKENS', default=0)
+RETRIEVAL_CHUNK_TOKENS = env.int('RETRIEVAL_CHUNK_TOKENS', default=400)
+RETRIEVAL_CHUNK_OVERLAP_TOKENS = env.int('RETRIEVAL_CHUNK_OVERLAP_TOKENS', default=40)
+# Seconds before loading a tiktoken encoding is tried again after a failure (tokens are estimated meanwhile)
+TIKTOKEN_RETRY_INTERVAL = env.int('TIKTOKEN_RETRY_INTERVAL', default=300)
+
+# Retries of a failed pipeline stage (Celery task) before the document is marked as failed
+PIPELINE_STAGE_MAX_RETRIES = env.int('PIPELINE_STAGE_MAX_RETRIES', default=2)
+PIPELINE_STAGE_RETRY_DELAY = env.int('PIPELINE_STAGE_RETRY_DELAY', default=10)
+
+# FAISS indices of documents, one directory per document
+FAISS_INDEX_DIR = env.str('FAISS_INDEX_DIR', default=str(BASE_DIR.parent / 'app' / 'faiss_indices'))
+
+# Admission control: documents processed at the same time (in total and per client),
+# documents up to ADMISSION_SMALL_DOCUMENT_BYTES go first, other documents waiting
+# longer than ADMISSION_PRIORITY_AGING seconds are treated as small
+ADMISSION_MAX_ACTIVE = env.int('ADMISSION_MAX_ACTIVE', default=5)
+ADMISSION_MAX_ACTIVE_PER_CLIENT = env.int('ADMISSION_MAX_ACTIVE_PER_CLIENT', default=2)
+ADMISSION_SMALL_DOCUMENT_BYTES = env.int('ADMISSION_SMALL_DOCUMENT_BYTES', default=1024 * 1024)
+ADMISSION_PRIORITY_AGING = env.int('ADMISSION_PRIORITY_AGING', default=600)
+
+# Chunked uploads (/api/uploads/): max file size, max size of one part
+# and how long an unfinished upload is kept
+UPLOAD_MAX_BYTES = env.int('UPLOAD_MAX_BYTES', default=500 * 1024 * 1024)
+UPLOAD_PART_MAX_BYTES = env.int('UPLOAD_PART_MAX_BYTES', default=16 * 1024 * 1024)
+UPLOAD_SESSION_TTL = env.int('UPLOAD_SESSION_TTL', default=24 * 60 * 60)
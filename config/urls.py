@@ -22,9 +22,14 @@ from django.urls import path, include
 
 from app.views import upload_document_view, \
                     get_documents, \
+                    get_document_summary, \
                     document_chat_view, \
                     health_check_view, \
-                    ask_question
+                    ask_question, \
+                    ask_question_stream, \
+                    create_upload, \
+                    upload_session, \
+                    complete_upload
 
 urlpatterns = [
     # main urls
@@ -35,7 +40,12 @@ urlpatterns = [
 
     # api urls
     path('api/documents/', get_documents, name='get_documents'),
+    path('api/documents/<int:doc_id>/summary/', get_document_summary, name='document_summary'),
     path("api/ask-question/", ask_question, name="ask-question"),
+    path("api/ask-question/stream/", ask_question_stream, name="ask-question-stream"),
+    path('api/uploads/', create_upload, name='create_upload'),
+    path('api/uploads/<uuid:upload_id>/', upload_session, name='upload_session'),
+    path('api/uploads/<uuid:upload_id>/complete/', complete_upload, name='complete_upload'),
     # metrics
     path('', include('django_prometheus.urls')),
 ]
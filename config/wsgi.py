@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Imported after Django is configured: settings and clients come from the database
+from app.utils.processors.backends import warm_up_clients  # noqa: E402
+
+warm_up_clients()